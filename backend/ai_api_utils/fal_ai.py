@@ -1,21 +1,24 @@
 import os
 import time
 import requests
+from ai_api_utils import http_session, webhooks
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv()
 
 FAL_API_KEY = os.getenv('FAL_API_KEY')
-FAL_BASE_URL = 'https://fal.run'
+FAL_BASE_URL = os.getenv('FAL_BASE_URL', 'https://fal.run')
 
 
-def create_prediction(model_path, input_payload):
+def create_prediction(model_path, input_payload, webhook_url=None):
     """
     Generic POST request to create a Fal AI prediction.
 
     Args:
         model_path: str, the model path (e.g., 'fal-ai/iclight-v2')
         input_payload: dict containing the input parameters for the model
+        webhook_url: Optional URL Fal AI should POST to when the request completes
 
     Returns:
         dict: Response from Fal AI API containing request_id for polling
@@ -25,9 +28,10 @@ def create_prediction(model_path, input_payload):
         "Authorization": f"Key {FAL_API_KEY}",
         "Content-Type": "application/json"
     }
+    params = {"fal_webhook": webhook_url} if webhook_url else None
 
     try:
-        response = requests.post(url, json=input_payload, headers=headers, timeout=600)
+        response = http_session.post(url, json=input_payload, headers=headers, params=params, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -51,7 +55,7 @@ def get_prediction_status(model_path, request_id):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=600)
+        response = http_session.get(url, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -75,13 +79,40 @@ def get_prediction_result(model_path, request_id):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=600)
+        response = http_session.get(url, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Exception(f"Failed to get Fal AI prediction result: {str(e)}")
 
 
+def check_prediction(model_path, request_id):
+    """
+    Check a Fal AI prediction once.
+
+    Args:
+        model_path: str, the model path (e.g., 'fal-ai/iclight-v2')
+        request_id: str, the unique request ID
+
+    Returns:
+        dict: Final prediction result if it completed, None if it is still running
+
+    Raises:
+        Exception: If prediction failed
+    """
+    status_result = get_prediction_status(model_path, request_id)
+    status = status_result.get('status')
+
+    if status == 'COMPLETED':
+        # Get full result
+        return get_prediction_result(model_path, request_id)
+    elif status == 'FAILED':
+        error_msg = status_result.get('error', 'Unknown error')
+        raise Exception(f"Fal AI prediction failed: {error_msg}")
+
+    return None
+
+
 def poll_prediction(model_path, request_id, max_wait_seconds=300, poll_interval=2):
     """
     Poll a Fal AI prediction until completion or timeout.
@@ -101,26 +132,19 @@ def poll_prediction(model_path, request_id, max_wait_seconds=300, poll_interval=
     start_time = time.time()
 
     while time.time() - start_time < max_wait_seconds:
-        status_result = get_prediction_status(model_path, request_id)
-        status = status_result.get('status')
-
-        if status == 'COMPLETED':
-            # Get full result
-            return get_prediction_result(model_path, request_id)
-        elif status == 'FAILED':
-            error_msg = status_result.get('error', 'Unknown error')
-            raise Exception(f"Fal AI prediction failed: {error_msg}")
-        elif status in ['IN_PROGRESS', 'IN_QUEUE']:
-            time.sleep(poll_interval)
-        else:
-            time.sleep(poll_interval)
+        result = check_prediction(model_path, request_id)
+        if result is not None:
+            return result
+        time.sleep(poll_interval)
 
     raise Exception(f"Fal AI prediction timed out after {max_wait_seconds} seconds")
 
 
+@metrics.timed_call(metrics.PROVIDER_PREDICTION_SECONDS, provider='fal_ai')
 def run_prediction_sync(model_path, input_payload, max_wait_seconds=300, poll_interval=2):
     """
-    Convenience function to create and poll a prediction synchronously.
+    Convenience function to create a prediction and wait for it synchronously.
+    Waits on the webhook callback when webhook mode is enabled, otherwise polls.
 
     Args:
         model_path: str, the model path (e.g., 'fal-ai/iclight-v2')
@@ -134,14 +158,28 @@ def run_prediction_sync(model_path, input_payload, max_wait_seconds=300, poll_in
     Raises:
         Exception: If prediction fails or timeout is reached
     """
+    use_webhook = webhooks.webhook_enabled()
+
     # Create prediction
-    creation_result = create_prediction(model_path, input_payload)
+    creation_result = create_prediction(
+        model_path,
+        input_payload,
+        webhook_url=webhooks.webhook_url('fal_ai') if use_webhook else None
+    )
     request_id = creation_result.get('request_id')
 
     if not request_id:
         raise Exception("Failed to get request ID from Fal AI response")
 
-    # Poll until completion
-    final_result = poll_prediction(model_path, request_id, max_wait_seconds, poll_interval)
+    # Wait for the completion callback, or poll until completion
+    if use_webhook:
+        final_result = webhooks.wait_for_completion(
+            'fal_ai',
+            request_id,
+            lambda: check_prediction(model_path, request_id),
+            max_wait_seconds
+        )
+    else:
+        final_result = poll_prediction(model_path, request_id, max_wait_seconds, poll_interval)
 
     return final_result
@@ -0,0 +1,157 @@
+"""
+Shared Gemini access for the inference pipeline.
+
+All Gemini calls go through gemini_client_manager: one lazily created, thread-safe
+genai.Client per process (so its HTTP connection pool stays warm across presets and
+runs), a process-wide cap on in-flight requests, and per-model request counters
+(plus the gemini_* histograms in metrics.py).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+from google import genai
+from google.genai import types
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+GEMINI_IMAGE_MODEL = "gemini-3-pro-image-preview"
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv('GEMINI_HTTP_MAX_CONNECTIONS', '16'))
+GEMINI_HTTP_KEEPALIVE_SECONDS = float(os.getenv('GEMINI_HTTP_KEEPALIVE_SECONDS', '120'))
+
+
+class GeminiClientManager:
+    """
+    Process-wide Gemini client holder.
+    The client is created on first use and shared by every thread.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max(1, GEMINI_MAX_CONCURRENCY))
+        self._stats_lock = threading.Lock()
+        self._model_stats = {}
+
+    def get_client(self):
+        """Return the shared genai.Client, creating it on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    api_key = os.environ.get("GOOGLE_AI_STUDIO_API_KEY")
+                    if not api_key:
+                        raise ValueError("GOOGLE_AI_STUDIO_API_KEY not found in environment")
+
+                    self._client = genai.Client(
+                        api_key=api_key,
+                        http_options=types.HttpOptions(client_args={
+                            'limits': httpx.Limits(
+                                max_connections=GEMINI_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=GEMINI_HTTP_MAX_CONNECTIONS,
+                                keepalive_expiry=GEMINI_HTTP_KEEPALIVE_SECONDS
+                            )
+                        })
+                    )
+        return self._client
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the process-wide Gemini request slots for the duration of the block.
+        Blocks until a slot is free.
+        """
+        with self._semaphore:
+            yield
+
+    def _record(self, model, seconds, error):
+        with self._stats_lock:
+            stats = self._model_stats.setdefault(model, {'requests': 0, 'errors': 0, 'total_seconds': 0.0})
+            stats['requests'] += 1
+            stats['total_seconds'] += seconds
+            if error:
+                stats['errors'] += 1
+
+    def generate_content(self, model, contents, config=None):
+        """
+        Call models.generate_content on the shared client, within a request slot.
+
+        Returns:
+            google.genai GenerateContentResponse
+        """
+        client = self.get_client()
+        wait_start = time.time()
+        with self.slot():
+            metrics.GEMINI_SLOT_WAIT_SECONDS.observe(time.time() - wait_start)
+            start_time = time.time()
+            error = False
+            try:
+                with metrics.timed(metrics.GEMINI_REQUEST_SECONDS, model=model):
+                    return client.models.generate_content(model=model, contents=contents, config=config)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self._record(model, time.time() - start_time, error)
+
+    def get_stats(self):
+        """Per-model request counters for this process."""
+        with self._stats_lock:
+            return {
+                model: {
+                    **stats,
+                    'avg_seconds': round(stats['total_seconds'] / stats['requests'], 3) if stats['requests'] else None,
+                    'total_seconds': round(stats['total_seconds'], 3),
+                }
+                for model, stats in self._model_stats.items()
+            }
+
+
+# Global singleton instance
+gemini_client_manager = GeminiClientManager()
+
+
+def extract_image_bytes(response):
+    """
+    Get the first generated image from a Gemini generate_content response.
+
+    Reads the inline image bytes straight off the response part, so nothing is
+    decoded, re-encoded or written to disk.
+
+    Args:
+        response: google.genai GenerateContentResponse
+
+    Returns:
+        bytes: The image data exactly as returned by Gemini, or None if the
+        response has no image part
+    """
+    if response is None or response.parts is None:
+        return None
+
+    for part in response.parts:
+        if part.text is not None:
+            # Text response (if any)
+            continue
+        inline_data = part.inline_data
+        if inline_data and inline_data.data and (inline_data.mime_type or '').startswith('image/'):
+            return inline_data.data
+
+    return None
@@ -0,0 +1,130 @@
+"""
+Shared HTTP layer for the provider clients (Replicate, Fal AI, Wavespeed) and image downloads.
+
+One process-wide requests.Session keeps per-host keep-alive connection pools, so a
+poll loop reuses its TCP+TLS connection instead of handshaking on every request.
+Idempotent GETs are retried at the transport level on connection errors and
+429/5xx responses; POSTs are never retried here. Every request is timed in the
+provider_http_request_seconds histogram (see metrics.py).
+
+Pool limits (environment):
+    PROVIDER_HTTP_POOL_CONNECTIONS: number of per-host pools kept (default 10)
+    PROVIDER_HTTP_POOL_MAXSIZE: connections kept per host; should cover the
+        process's thread count (default 16)
+    PROVIDER_HTTP_GET_RETRIES: transport-level retries for GETs (default 3)
+"""
+import os
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+PROVIDER_HTTP_POOL_CONNECTIONS = int(os.getenv('PROVIDER_HTTP_POOL_CONNECTIONS', '10'))
+PROVIDER_HTTP_POOL_MAXSIZE = int(os.getenv('PROVIDER_HTTP_POOL_MAXSIZE', '16'))
+PROVIDER_HTTP_GET_RETRIES = int(os.getenv('PROVIDER_HTTP_GET_RETRIES', '3'))
+
+_session = None
+_session_lock = threading.Lock()
+_adapter = None
+
+_requests_by_host = Counter()
+_requests_lock = threading.Lock()
+
+
+def _build_session():
+    global _adapter
+
+    retry = Retry(
+        total=PROVIDER_HTTP_GET_RETRIES,
+        connect=PROVIDER_HTTP_GET_RETRIES,
+        read=PROVIDER_HTTP_GET_RETRIES,
+        status=PROVIDER_HTTP_GET_RETRIES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        status_forcelist=(429, 500, 502, 503, 504),
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    _adapter = HTTPAdapter(
+        pool_connections=PROVIDER_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=PROVIDER_HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+        pool_block=False,
+    )
+
+    session = requests.Session()
+    session.mount('https://', _adapter)
+    session.mount('http://', _adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _request(method, url, **kwargs):
+    host = urlsplit(url).netloc
+    with _requests_lock:
+        _requests_by_host[host] += 1
+
+    with metrics.timed(metrics.PROVIDER_HTTP_SECONDS, host=host, method=method) as observation:
+        response = get_session().request(method, url, **kwargs)
+        if response.status_code >= 400:
+            observation['outcome'] = f"http_{response.status_code // 100}xx"
+        return response
+
+
+def get(url, **kwargs):
+    """GET through the pooled session (retried on transient failures)."""
+    return _request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST through the pooled session (never retried at the transport level)."""
+    return _request('POST', url, **kwargs)
+
+
+def get_pool_stats():
+    """
+    Per-host pool usage for this process.
+
+    Returns:
+        Dict with configured limits and, per host, the requests sent, connections
+        opened and connections currently idle in the pool
+    """
+    with _requests_lock:
+        requests_by_host = dict(_requests_by_host)
+
+    hosts = {host: {'requests': count, 'connections_opened': 0, 'idle_connections': 0}
+             for host, count in requests_by_host.items()}
+
+    if _adapter is not None:
+        pools = _adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = hosts.setdefault(host, {'requests': 0, 'connections_opened': 0, 'idle_connections': 0})
+            entry['connections_opened'] += pool.num_connections
+            # The pool queue is pre-filled with None placeholders; only count real connections
+            if pool.pool is not None:
+                entry['idle_connections'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+    return {
+        'pool_connections': PROVIDER_HTTP_POOL_CONNECTIONS,
+        'pool_maxsize': PROVIDER_HTTP_POOL_MAXSIZE,
+        'get_retries': PROVIDER_HTTP_GET_RETRIES,
+        'hosts': hosts,
+    }
@@ -1,21 +1,24 @@
 import os
 import time
 import requests
+from ai_api_utils import http_session, webhooks
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv()
 
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-REPLICATE_BASE_URL = 'https://api.replicate.com/v1'
+REPLICATE_BASE_URL = os.getenv('REPLICATE_BASE_URL', 'https://api.replicate.com/v1')
 
 
-def create_prediction(input_payload, model_version=None):
+def create_prediction(input_payload, model_version=None, webhook_url=None):
     """
     Generic POST request to create a Replicate prediction.
 
     Args:
         input_payload: dict containing the input parameters for the model
         model_version: Optional specific model version string
+        webhook_url: Optional URL Replicate should POST to when the prediction completes
 
     Returns:
         dict: Response from Replicate API containing prediction ID and initial status
@@ -29,9 +32,12 @@ def create_prediction(input_payload, model_version=None):
     payload = {"input": input_payload}
     if model_version:
         payload["version"] = model_version
+    if webhook_url:
+        payload["webhook"] = webhook_url
+        payload["webhook_events_filter"] = ["completed"]
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=600)
+        response = http_session.post(url, json=payload, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -54,13 +60,38 @@ def get_prediction(prediction_id):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=600)
+        response = http_session.get(url, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Exception(f"Failed to get Replicate prediction: {str(e)}")
 
 
+def check_prediction(prediction_id):
+    """
+    Check a Replicate prediction once.
+
+    Args:
+        prediction_id: str, the unique prediction ID
+
+    Returns:
+        dict: Final prediction result if it succeeded, None if it is still running
+
+    Raises:
+        Exception: If prediction failed
+    """
+    result = get_prediction(prediction_id)
+    status = result.get('status')
+
+    if status == 'succeeded':
+        return result
+    elif status == 'failed':
+        error_msg = result.get('error', 'Unknown error')
+        raise Exception(f"Replicate prediction failed: {error_msg}")
+
+    return None
+
+
 def poll_prediction(prediction_id, max_wait_seconds=300, poll_interval=2):
     """
     Poll a Replicate prediction until completion or timeout.
@@ -79,18 +110,10 @@ def poll_prediction(prediction_id, max_wait_seconds=300, poll_interval=2):
     start_time = time.time()
 
     while time.time() - start_time < max_wait_seconds:
-        result = get_prediction(prediction_id)
-        status = result.get('status')
-
-        if status == 'succeeded':
+        result = check_prediction(prediction_id)
+        if result is not None:
             return result
-        elif status == 'failed':
-            error_msg = result.get('error', 'Unknown error')
-            raise Exception(f"Replicate prediction failed: {error_msg}")
-        elif status in ['starting', 'processing']:
-            time.sleep(poll_interval)
-        else:
-            time.sleep(poll_interval)
+        time.sleep(poll_interval)
 
     raise Exception(f"Replicate prediction timed out after {max_wait_seconds} seconds")
 
@@ -112,16 +135,18 @@ def cancel_prediction(prediction_id):
     }
 
     try:
-        response = requests.post(url, headers=headers, timeout=600)
+        response = http_session.post(url, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Exception(f"Failed to cancel Replicate prediction: {str(e)}")
 
 
+@metrics.timed_call(metrics.PROVIDER_PREDICTION_SECONDS, provider='replicate')
 def run_prediction_sync(input_payload, model_version=None, max_wait_seconds=300, poll_interval=2):
     """
-    Convenience function to create and poll a prediction synchronously.
+    Convenience function to create a prediction and wait for it synchronously.
+    Waits on the webhook callback when webhook mode is enabled, otherwise polls.
 
     Args:
         input_payload: dict containing the input parameters for the model
@@ -135,14 +160,28 @@ def run_prediction_sync(input_payload, model_version=None, max_wait_seconds=300,
     Raises:
         Exception: If prediction fails or timeout is reached
     """
+    use_webhook = webhooks.webhook_enabled()
+
     # Create prediction
-    creation_result = create_prediction(input_payload, model_version)
+    creation_result = create_prediction(
+        input_payload,
+        model_version,
+        webhook_url=webhooks.webhook_url('replicate') if use_webhook else None
+    )
     prediction_id = creation_result.get('id')
 
     if not prediction_id:
         raise Exception("Failed to get prediction ID from Replicate response")
 
-    # Poll until completion
-    final_result = poll_prediction(prediction_id, max_wait_seconds, poll_interval)
+    # Wait for the completion callback, or poll until completion
+    if use_webhook:
+        final_result = webhooks.wait_for_completion(
+            'replicate',
+            prediction_id,
+            lambda: check_prediction(prediction_id),
+            max_wait_seconds
+        )
+    else:
+        final_result = poll_prediction(prediction_id, max_wait_seconds, poll_interval)
 
     return final_result
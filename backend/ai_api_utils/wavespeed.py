@@ -1,21 +1,24 @@
 import os
 import time
 import requests
+from ai_api_utils import http_session, webhooks
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv()
 
 WAVESPEED_API_KEY = os.getenv('WAVESPEED_API_KEY')
-WAVESPEED_BASE_URL = 'https://api.wavespeed.ai/api/v3'
+WAVESPEED_BASE_URL = os.getenv('WAVESPEED_BASE_URL', 'https://api.wavespeed.ai/api/v3')
 
 
-def create_prediction(model_path, input_payload):
+def create_prediction(model_path, input_payload, webhook_url=None):
     """
     Generic POST request to create a Wavespeed prediction.
 
     Args:
         model_path: str, the model path (e.g., 'bytedance/seedream-v4/edit')
         input_payload: dict containing the input parameters for the model
+        webhook_url: Optional URL Wavespeed should POST to when the prediction completes
 
     Returns:
         dict: Response from Wavespeed API containing prediction ID and initial status
@@ -25,9 +28,10 @@ def create_prediction(model_path, input_payload):
         "Authorization": f"Bearer {WAVESPEED_API_KEY}",
         "Content-Type": "application/json"
     }
+    params = {"webhook": webhook_url} if webhook_url else None
 
     try:
-        response = requests.post(url, json=input_payload, headers=headers, timeout=600)
+        response = http_session.post(url, json=input_payload, headers=headers, params=params, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -50,13 +54,40 @@ def get_prediction(prediction_id):
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=600)
+        response = http_session.get(url, headers=headers, timeout=600)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Exception(f"Failed to get Wavespeed prediction: {str(e)}")
 
 
+def check_prediction(prediction_id):
+    """
+    Check a Wavespeed prediction once.
+
+    Args:
+        prediction_id: str, the unique prediction ID
+
+    Returns:
+        dict: Final prediction result if it completed with outputs, None if it is still running
+
+    Raises:
+        Exception: If prediction failed
+    """
+    result = get_prediction(prediction_id)
+
+    status = result.get('status') or result.get('data', {}).get('status')
+    output = result.get('output') or result.get('data', {}).get('outputs')
+
+    if (status == 'succeeded' or status == 'completed') and output:
+        return result
+    elif status == 'failed':
+        error_msg = result.get('error', 'Unknown error')
+        raise Exception(f"Wavespeed prediction failed: {error_msg}")
+
+    return None
+
+
 def poll_prediction(prediction_id, max_wait_seconds=300, poll_interval=5):
     """
     Poll a Wavespeed prediction until completion or timeout.
@@ -75,25 +106,19 @@ def poll_prediction(prediction_id, max_wait_seconds=300, poll_interval=5):
     start_time = time.time()
 
     while time.time() - start_time < max_wait_seconds:
-        result = get_prediction(prediction_id)
-
-        status = result.get('status') or result.get('data', {}).get('status')
-        output = result.get('output') or result.get('data', {}).get('outputs')
-
-        if (status == 'succeeded' or status == 'completed') and output:
+        result = check_prediction(prediction_id)
+        if result is not None:
             return result
-        elif status == 'failed':
-            error_msg = result.get('error', 'Unknown error')
-            raise Exception(f"Wavespeed prediction failed: {error_msg}")
-
         time.sleep(poll_interval)
 
     raise Exception(f"Wavespeed prediction timed out after {max_wait_seconds} seconds")
 
 
+@metrics.timed_call(metrics.PROVIDER_PREDICTION_SECONDS, provider='wavespeed')
 def run_prediction_sync(model_path, input_payload, max_wait_seconds=300, poll_interval=5):
     """
-    Convenience function to create and poll a prediction synchronously.
+    Convenience function to create a prediction and wait for it synchronously.
+    Waits on the webhook callback when webhook mode is enabled, otherwise polls.
 
     Args:
         model_path: str, the model path (e.g., 'bytedance/seedream-v4/edit')
@@ -107,7 +132,13 @@ def run_prediction_sync(model_path, input_payload, max_wait_seconds=300, poll_in
     Raises:
         Exception: If prediction fails or timeout is reached
     """
-    creation_result = create_prediction(model_path, input_payload)
+    use_webhook = webhooks.webhook_enabled()
+
+    creation_result = create_prediction(
+        model_path,
+        input_payload,
+        webhook_url=webhooks.webhook_url('wavespeed') if use_webhook else None
+    )
     prediction_id = creation_result.get('id') or creation_result.get('data', {}).get('id')
 
     if not prediction_id:
@@ -116,6 +147,14 @@ def run_prediction_sync(model_path, input_payload, max_wait_seconds=300, poll_in
     if creation_result.get('status') == 'completed' or creation_result.get('data', {}).get('status') == 'completed':
         return creation_result
 
-    final_result = poll_prediction(prediction_id, max_wait_seconds, poll_interval)
+    if use_webhook:
+        final_result = webhooks.wait_for_completion(
+            'wavespeed',
+            prediction_id,
+            lambda: check_prediction(prediction_id),
+            max_wait_seconds
+        )
+    else:
+        final_result = poll_prediction(prediction_id, max_wait_seconds, poll_interval)
 
     return final_result
@@ -0,0 +1,186 @@
+"""
+Webhook-driven prediction completion for the provider clients.
+
+When WEBHOOK_BASE_URL and WEBHOOK_SECRET are both set, predictions are created with a
+callback URL pointing at POST /webhooks/<provider> on this server (carrying the secret), and the caller blocks on an in-process
+completion registry instead of sleeping in a poll loop. A callback wakes the waiter,
+which then fetches the authoritative result from the provider once (the callback body
+itself is never trusted).
+
+Gunicorn runs several worker processes and the callback can land on any of them. If
+the receiving process has no local waiter it drops a marker file in WEBHOOK_SPOOL_DIR,
+which waiters in the other processes check every WEBHOOK_SPOOL_CHECK_INTERVAL seconds
+(a local stat, not a network call).
+
+Polling stays as a fallback: waiters still check the provider every
+WEBHOOK_FALLBACK_POLL_INTERVAL seconds in case a callback is lost.
+"""
+import hmac
+import os
+import re
+import threading
+import time
+
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_SPOOL_DIR = os.getenv('WEBHOOK_SPOOL_DIR', os.path.join('temp', 'webhooks'))
+WEBHOOK_FALLBACK_POLL_INTERVAL = float(os.getenv('WEBHOOK_FALLBACK_POLL_INTERVAL', '20'))
+WEBHOOK_SPOOL_CHECK_INTERVAL = float(os.getenv('WEBHOOK_SPOOL_CHECK_INTERVAL', '0.25'))
+
+# Spool markers nobody picked up (e.g. the fallback poll won) are removed after this long
+SPOOL_MAX_AGE_SECONDS = 3600
+
+PROVIDERS = ('replicate', 'fal_ai', 'wavespeed')
+
+if WEBHOOK_BASE_URL and not WEBHOOK_SECRET:
+    print("WEBHOOK_BASE_URL is set without WEBHOOK_SECRET; webhooks are off and predictions are polled")
+
+
+def webhook_enabled():
+    """
+    Webhook mode is on when this server has a public base URL to receive callbacks on
+    and a secret to authenticate them with.
+    """
+    return bool(WEBHOOK_BASE_URL and WEBHOOK_SECRET)
+
+
+def webhook_url(provider):
+    """The callback URL to hand to a provider when creating a prediction."""
+    return f"{WEBHOOK_BASE_URL}/webhooks/{provider}?token={WEBHOOK_SECRET}"
+
+
+def verify_token(token):
+    """Check the shared secret carried in the callback URL. Never passes if WEBHOOK_SECRET is unset."""
+    if not WEBHOOK_SECRET:
+        return False
+    # Bytes, since compare_digest rejects str with non-ASCII characters
+    return hmac.compare_digest((token or '').encode('utf-8'), WEBHOOK_SECRET.encode('utf-8'))
+
+
+def extract_prediction_id(payload):
+    """Find the prediction ID in a Replicate, Fal AI or Wavespeed callback body."""
+    if not isinstance(payload, dict):
+        return None
+    data = payload.get('data') if isinstance(payload.get('data'), dict) else {}
+    return payload.get('id') or payload.get('request_id') or data.get('id')
+
+
+class CompletionRegistry:
+    """In-process map of (provider, prediction_id) -> Event that waiting callers block on."""
+
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def register(self, provider, prediction_id):
+        with self._lock:
+            event = self._events.get((provider, prediction_id))
+            if event is None:
+                event = self._events[(provider, prediction_id)] = threading.Event()
+            return event
+
+    def unregister(self, provider, prediction_id):
+        with self._lock:
+            self._events.pop((provider, prediction_id), None)
+
+    def notify(self, provider, prediction_id):
+        """
+        Wake the local waiter for a prediction.
+
+        Returns:
+            bool: True if a waiter in this process was notified
+        """
+        with self._lock:
+            event = self._events.get((provider, prediction_id))
+        if event is None:
+            return False
+        event.set()
+        return True
+
+
+registry = CompletionRegistry()
+
+
+def _spool_path(provider, prediction_id):
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(prediction_id))
+    return os.path.join(WEBHOOK_SPOOL_DIR, f"{provider}-{safe_id}")
+
+
+def _prune_spool():
+    cutoff = time.time() - SPOOL_MAX_AGE_SECONDS
+    try:
+        for name in os.listdir(WEBHOOK_SPOOL_DIR):
+            path = os.path.join(WEBHOOK_SPOOL_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+    except OSError:
+        pass
+
+
+def deliver(provider, prediction_id):
+    """
+    Handle a provider callback: wake the local waiter, or leave a spool marker for
+    a waiter in another worker process.
+    """
+    if registry.notify(provider, prediction_id):
+        return
+
+    os.makedirs(WEBHOOK_SPOOL_DIR, exist_ok=True)
+    with open(_spool_path(provider, prediction_id), 'w'):
+        pass
+    _prune_spool()
+
+
+def _consume_spool(provider, prediction_id):
+    try:
+        os.remove(_spool_path(provider, prediction_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def wait_for_completion(provider, prediction_id, check_prediction, max_wait_seconds=300,
+                        fallback_poll_interval=None):
+    """
+    Block until a prediction completes, woken by its webhook callback.
+
+    Args:
+        provider: str, one of PROVIDERS
+        prediction_id: str, the provider's prediction/request ID
+        check_prediction: callable doing one status check; returns the final result,
+            None if still running, or raises if the prediction failed
+        max_wait_seconds: int, maximum time to wait for completion (default: 300)
+        fallback_poll_interval: seconds between fallback status checks
+            (default: WEBHOOK_FALLBACK_POLL_INTERVAL)
+
+    Returns:
+        dict: Final prediction result
+
+    Raises:
+        Exception: If prediction fails or timeout is reached
+    """
+    if fallback_poll_interval is None:
+        fallback_poll_interval = WEBHOOK_FALLBACK_POLL_INTERVAL
+
+    event = registry.register(provider, prediction_id)
+    try:
+        start_time = time.time()
+        next_poll = start_time + fallback_poll_interval
+
+        while time.time() - start_time < max_wait_seconds:
+            signalled = event.wait(WEBHOOK_SPOOL_CHECK_INTERVAL) or _consume_spool(provider, prediction_id)
+
+            if signalled or time.time() >= next_poll:
+                event.clear()
+                result = check_prediction()
+                if result is not None:
+                    return result
+                next_poll = time.time() + fallback_poll_interval
+
+        raise Exception(f"{provider} prediction timed out after {max_wait_seconds} seconds")
+    finally:
+        registry.unregister(provider, prediction_id)
+        _consume_spool(provider, prediction_id)
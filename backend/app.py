@@ -1,18 +1,31 @@
 import os
-import threading
-from flask import Flask, request, jsonify, send_from_directory
+import json
+import time
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
-from models.image import Image
 import inference_pipeline.main as inference_pipeline
 from db_utils import (
     create_pending_run, 
     update_run_with_results, 
     update_run_with_error,
-    get_all_presets,
-    get_preset_names_by_ids,
-    supabase
+    get_run_by_id,
+    get_runs_by_ids,
+    list_runs as db_list_runs
 )
 from progress_tracker import progress_tracker
+from event_stream import stream_run_events
+from event_bus import event_bus
+from job_queue import job_queue, JOB_QUEUE_RETRY_AFTER_SECONDS
+from input_uploads import input_uploads
+from image_dedup import get_dedup_stats
+import sample_generations
+import preset_catalog
+import run_views
+import metrics
+from cache_utils import get_cache_stats
+from ai_api_utils.http_session import get_pool_stats
+from ai_api_utils import webhooks
+from ai_api_utils.gemini import gemini_client_manager
 
 app = Flask(__name__)
 CORS(app)
@@ -26,42 +39,270 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32MB max file size
 
 
+@app.before_request
+def _start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    start_time = g.pop('request_start_time', None)
+    if start_time is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            method=request.method, endpoint=endpoint, status=str(response.status_code)
+        ).observe(time.perf_counter() - start_time)
+    return response
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'}), 200
 
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    In-process stats for this worker (cache hit rates, provider HTTP pool usage,
+    Gemini requests per model, input image dedup hit rate), plus the host-wide job
+    queue depth and wait times.
+    Each Gunicorn worker keeps its own caches, so repeated calls may land on different workers.
+    """
+    return jsonify({
+        'pid': os.getpid(),
+        'caches': get_cache_stats(),
+        'http_pools': get_pool_stats(),
+        'gemini': gemini_client_manager.get_stats(),
+        'image_dedup': get_dedup_stats(),
+        'job_queue': job_queue.get_stats()
+    }), 200
+
+
+def _cached_json_response(body, etag, cache_control, last_modified=None):
+    """
+    Build a JSON response from pre-serialized bytes with validators, answering
+    If-None-Match / If-Modified-Since with 304 Not Modified.
+    """
+    response = Response(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics (latency histograms for pipeline stages, providers, Gemini,
+    Supabase and HTTP handlers; see metrics.py), aggregated across Gunicorn workers
+    when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    body, content_type = metrics.render()
+    return Response(body, status=200, content_type=content_type)
+
+
 @app.route('/presets', methods=['GET'])
 def get_presets():
     """
     Get all available presets.
     
+    Served from the in-process catalog (see preset_catalog.py) with ETag and
+    Last-Modified; conditional requests for an unchanged catalog get 304.
+    
     Returns:
         List of presets with id, name, and ref_image_background_only
     """
     try:
-        presets = get_all_presets()
-        return jsonify({'presets': presets}), 200
+        catalog = preset_catalog.get_preset_catalog()
+        return _cached_json_response(
+            catalog['body'],
+            catalog['etag'],
+            f"public, max-age={preset_catalog.PRESET_CATALOG_MAX_AGE_SECONDS}",
+            last_modified=catalog['last_modified']
+        )
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/presets/refresh', methods=['POST'])
+def refresh_presets():
+    """
+    Reload the preset catalog after editing presets in Supabase, instead of waiting
+    for the cache TTL. Every worker on this host picks up the new catalog.
+    Returns 404 unless PRESET_REFRESH_TOKEN is configured.
+    """
+    if not preset_catalog.refresh_enabled():
+        return jsonify({'error': 'Not found'}), 404
+    if not preset_catalog.verify_refresh_token(request.headers.get('X-Refresh-Token')):
+        return jsonify({'error': 'Invalid refresh token'}), 403
+    
+    try:
+        catalog = preset_catalog.refresh()
+        return jsonify({'status': 'ok', 'etag': catalog['etag']}), 200
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/webhooks/<provider>', methods=['POST'])
+def provider_webhook(provider):
+    """
+    Completion callback from Replicate, Fal AI or Wavespeed (webhook mode, see ai_api_utils/webhooks.py).
+    Wakes whichever worker is waiting on the prediction; the waiter fetches the result itself.
+    """
+    if provider not in webhooks.PROVIDERS:
+        return jsonify({'error': f'Unknown provider: {provider}'}), 404
+    if not webhooks.verify_token(request.args.get('token')):
+        return jsonify({'error': 'Invalid webhook token'}), 403
+
+    prediction_id = webhooks.extract_prediction_id(request.get_json(silent=True))
+    if not prediction_id:
+        return jsonify({'error': 'No prediction ID in callback body'}), 400
+
+    webhooks.deliver(provider, str(prediction_id))
+    return jsonify({'status': 'ok'}), 200
+
+
 @app.route('/assets/backgrounds/<filename>', methods=['GET'])
 def serve_background_image(filename):
     return send_from_directory(ASSETS_FOLDER, filename)
 
 
+def _run_response(run_id, fields):
+    """
+    Read a projection of one run and return it with ETag and Cache-Control.
+    The ETag hashes the serialized projection, so a conditional request for a run
+    that hasn't changed gets 304 without the body (see run_views.py).
+    """
+    # status decides Cache-Control even when it isn't projected
+    row = get_run_by_id(run_id, tuple(dict.fromkeys(fields + ('status',))))
+    if row is None:
+        return jsonify({'error': 'Run not found'}), 404
+    
+    body, etag = run_views.serialize({field: row.get(field) for field in fields})
+    return _cached_json_response(body, etag, run_views.cache_control(row.get('status')))
+
+
+@app.route('/runs', methods=['GET'])
+def list_runs():
+    """
+    List runs newest first, one page at a time.
+    
+    Query parameters:
+        - limit: Page size (default RUNS_PAGE_DEFAULT_LIMIT, at most RUNS_PAGE_MAX_LIMIT)
+        - cursor: next_cursor from the previous page
+        - status: Comma-separated statuses to keep (e.g. 'completed,failed')
+        - is_sample: 'true' or 'false'
+        - fields: Columns to return, as for /runs/<run_id> (compact view by default)
+    
+    Response:
+        {
+            "runs": [...],
+            "next_cursor": "..."  # null on the last page
+        }
+    """
+    try:
+        fields = run_views.parse_fields(request.args.get('fields'))
+        limit = run_views.parse_limit(request.args.get('limit'))
+        before_id = run_views.decode_cursor(request.args.get('cursor'))
+        is_sample = run_views.parse_bool(request.args.get('is_sample'), 'is_sample')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statuses = [status.strip() for status in request.args.get('status', '').split(',') if status.strip()]
+    
+    try:
+        # One extra row tells us whether there is a next page
+        rows = db_list_runs(fields, limit + 1, before_id=before_id, statuses=statuses, is_sample=is_sample)
+        next_cursor = run_views.encode_cursor(rows[limit - 1]['id']) if len(rows) > limit else None
+        
+        body, etag = run_views.serialize({'runs': rows[:limit], 'next_cursor': next_cursor})
+        return _cached_json_response(body, etag, 'no-cache')
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/runs:batchGet', methods=['POST'])
+def batch_get_runs():
+    """
+    Get many runs in one request (and one database query).
+    
+    Request body:
+        {
+            "run_ids": ["27", "28", ...],
+            "fields": "status,outputs"  # Optional, as for /runs/<run_id> (compact view by default)
+        }
+    
+    Response:
+        {
+            "runs": [...],          # In request order
+            "not_found": ["28"]
+        }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        run_ids = run_views.parse_run_ids(data.get('run_ids'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    fields_param = data.get('fields')
+    if isinstance(fields_param, list):
+        fields_param = ','.join(str(field) for field in fields_param)
+    try:
+        fields = run_views.parse_fields(fields_param)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        rows = get_runs_by_ids(run_ids, fields)
+        return jsonify({
+            'runs': [rows[run_id] for run_id in run_ids if run_id in rows],
+            'not_found': [run_id for run_id in run_ids if run_id not in rows]
+        }), 200
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/runs/<run_id>', methods=['GET'])
 def get_run(run_id):
+    """
+    Get a run. Returns the compact view (id, status, error, is_sample, inputs, outputs)
+    unless the fields query parameter selects other columns (comma-separated, or '*'
+    for every column including intermediate_outputs).
+    
+    Supports conditional GET with If-None-Match (304 Not Modified).
+    """
     try:
-        result = supabase.table('runs').select('*').eq('id', run_id).execute()
+        fields = run_views.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        return _run_response(run_id, fields)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        if not result.data or len(result.data) == 0:
-            return jsonify({'error': 'Run not found'}), 404
 
-        return jsonify(result.data[0]), 200
+@app.route('/runs/<run_id>/intermediate_outputs', methods=['GET'])
+def get_run_intermediate_outputs(run_id):
+    """
+    Get the intermediate outputs of a run (analysis and per-step generate / enhance
+    results), which the compact run view leaves out.
+    
+    Supports conditional GET with If-None-Match (304 Not Modified).
+    """
+    try:
+        return _run_response(run_id, ('id', 'status', 'intermediate_outputs'))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -72,58 +313,59 @@ def get_run(run_id):
 def get_sample_generations():
     """
     Get sample generations with preset IDs decoded to names.
+    
+    The response is cached in-process (see sample_generations.py) and carries an ETag;
+    a request with a matching If-None-Match gets 304 Not Modified with no body.
     """
     try:
-        result = supabase.table('runs').select('inputs,outputs').eq('is_sample', True).execute()
-
-        samples = []
-        for row in result.data:
-            inputs = row.get('inputs', {})
-            outputs = row.get('outputs', [])
-            
-            # Decode preset IDs to names if present
-            preset_ids = inputs.get('settings', [])
-            if preset_ids and isinstance(preset_ids[0], int):
-                # These are numeric IDs, decode to names
-                preset_names_map = get_preset_names_by_ids(preset_ids)
-                preset_names = [preset_names_map.get(pid, str(pid)) for pid in preset_ids]
-                inputs = {**inputs, 'settings': preset_names}
-            
-            samples.append({
-                'inputs': inputs,
-                'outputs': outputs
-            })
-
-        return jsonify(samples), 200
+        body, etag = sample_generations.get_sample_generations()
+        return _cached_json_response(body, etag, 'no-cache')
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
-def _run_generation_worker(run_id, run_id_str, person_img, clothing_img, preset_ids):
+def _publish_event(run_id_str, event, data):
+    """Publish a run event for SSE subscribers; never lets a bus failure break the run."""
+    try:
+        event_bus.publish(run_id_str, event, data)
+    except Exception as e:
+        print(f"Failed to publish {event} event for run {run_id_str}: {e}")
+
+
+def _run_generation_worker(run_id, run_id_str, person_img, clothing_img, preset_ids, use_result_cache=True):
     """
-    Worker function that runs the generation pipeline in a background thread.
-    Updates progress tracker and Supabase database upon completion.
+    Worker function that runs the generation pipeline on a job queue worker thread.
+    Updates progress tracker and Supabase database upon completion, and publishes
+    progress, per-preset outputs and the terminal state to the event bus.
     
     Args:
         run_id: Integer run ID for database operations
         run_id_str: String run ID for progress tracker
+        use_result_cache: False to regenerate presets even if identical outputs are stored
     """
     try:
         # Create progress callback that uses string run_id
         # Signature: callback(progress) - run_id_str is captured in closure
         def progress_callback(progress):
+            _publish_event(run_id_str, 'progress', {'progress': progress})
             progress_tracker.update_progress(run_id_str, progress)
         
+        def output_callback(stage, result):
+            _publish_event(run_id_str, 'output', {'stage': stage, **result})
+        
         # Run the pipeline with progress tracking
-        pipeline_result = inference_pipeline.run(
-            person_image=person_img,
-            clothing_image=clothing_img,
-            preset_ids=preset_ids,
-            run_id=run_id_str,  # Pass string for callback
-            progress_callback=progress_callback
-        )
+        with metrics.timed(metrics.PIPELINE_RUN_SECONDS):
+            pipeline_result = inference_pipeline.run(
+                person_image=person_img,
+                clothing_image=clothing_img,
+                preset_ids=preset_ids,
+                run_id=run_id_str,  # Pass string for callback
+                progress_callback=progress_callback,
+                output_callback=output_callback,
+                use_result_cache=use_result_cache
+            )
 
         # Update Supabase with the results (use integer run_id)
         update_run_with_results(
@@ -134,6 +376,10 @@ def _run_generation_worker(run_id, run_id_str, person_img, clothing_img, preset_
 
         # Mark as complete in progress tracker (use string run_id)
         progress_tracker.mark_complete(run_id_str)
+        _publish_event(run_id_str, 'complete', {
+            'progress': 100,
+            'outputs': [img.to_dict() for img in pipeline_result['outputs']]
+        })
 
     except Exception as e:
         import traceback
@@ -147,6 +393,66 @@ def _run_generation_worker(run_id, run_id_str, person_img, clothing_img, preset_
             print(f"Failed to update database with error: {db_error}")
 
         progress_tracker.mark_error(run_id_str, error_msg)  # String for tracker
+        _publish_event(run_id_str, 'error', {'error': error_msg})
+
+
+def _fail_run(run_id, error_msg):
+    """Mark a run failed in Supabase, the progress tracker and the event bus."""
+    try:
+        update_run_with_error(run_id, error_msg)
+    except Exception as db_error:
+        print(f"Failed to update database with error: {db_error}")
+    progress_tracker.mark_error(str(run_id), error_msg)
+    _publish_event(str(run_id), 'error', {'error': error_msg})
+
+
+def _handle_generation_job(payload):
+    """
+    Job queue handler: wait for the run's input uploads (see input_uploads.py),
+    then run the pipeline.
+    """
+    run_id = payload['run_id']
+    spool_paths = [payload['person_spool'], payload['clothing_spool']]
+    try:
+        try:
+            person_img = input_uploads.resolve(payload['person_spool'])
+            clothing_img = input_uploads.resolve(payload['clothing_spool'])
+        except Exception as upload_error:
+            import traceback
+            traceback.print_exc()
+            _fail_run(run_id, str(upload_error))
+            return
+
+        _run_generation_worker(
+            run_id=run_id,
+            run_id_str=str(run_id),
+            person_img=person_img,
+            clothing_img=clothing_img,
+            preset_ids=payload['preset_ids'],
+            use_result_cache=payload.get('use_result_cache', True)
+        )
+    finally:
+        input_uploads.discard(spool_paths)
+
+
+def _abandon_generation_job(payload, error_msg):
+    """Job queue abandon handler: fail a run whose job kept getting interrupted."""
+    _fail_run(payload['run_id'], error_msg)
+    input_uploads.discard([path for path in (payload.get('person_spool'), payload.get('clothing_spool')) if path])
+
+
+@app.route('/runs/<run_id>/events', methods=['GET'])
+def run_events(run_id):
+    """
+    Server-Sent Events stream of a run's progress (see event_stream.py for the events).
+    
+    Supports Last-Event-ID so reconnecting clients resume where they left off. In
+    production nginx sends this URL to the gevent-served sse_app.py; here streams are
+    capped at SSE_MAX_STREAMS per worker so they cannot take every Gunicorn thread, and
+    requests past the cap get 503 and should poll /check_progress.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return stream_run_events(run_id, last_event_id)
 
 
 @app.route('/check_progress', methods=['POST'])
@@ -156,7 +462,8 @@ def check_progress():
     
     Progress Tracking System:
     - When a generation starts, a run is created in the database (returns integer ID)
-    - The progress tracker stores progress in memory using string keys
+    - The progress tracker records progress in a node-local store shared by all workers
+      (progress_store.py); runs not known to this host are looked up in the database
     - Client sends run_ids as strings in the request
     - Progress is updated by the background worker thread as the pipeline runs
     - Once complete, results are saved to database and progress tracker marks it complete
@@ -257,14 +564,18 @@ def check_progress():
 @app.route('/generate_request', methods=['POST'])
 def generate_request():
     """
-    Create a new generation request. Immediately returns a run_id and starts
-    processing in the background. Clients should poll /check_progress to monitor
+    Create a new generation request. Immediately returns a run_id and queues the
+    run on the job queue. Clients should poll /check_progress to monitor
     progress and then fetch results from /runs/<run_id> when complete.
+    Returns 429 with a Retry-After header when the queue is full.
+    The images are uploaded in the background; the run's inputs get their URLs
+    once both uploads finish.
     
     Expected form data:
         - personImage: File - the model/person image
         - clothingImages: File(s) - the clothing image(s) (only first one is used)
         - settings: JSON string - array of preset IDs (integers)
+        - skipCache: Optional, 'true' to regenerate even if identical outputs are stored
     """
     try:
         if 'personImage' not in request.files:
@@ -294,26 +605,34 @@ def generate_request():
             if not isinstance(pid, int):
                 return jsonify({'error': f'Invalid preset ID: {pid}. Must be an integer.'}), 400
 
-        # Process images and upload them
+        # Refuse before uploading anything if the queue is already full
+        if not job_queue.has_capacity():
+            response = jsonify({'error': 'Too many generation requests in progress, please retry later'})
+            response.headers['Retry-After'] = str(JOB_QUEUE_RETRY_AFTER_SECONDS)
+            return response, 429
+
+        # Spool the images locally; normalizing and uploading them happens in the background
         try:
-            person_img = Image(filepath=person_file)
+            person_spool = input_uploads.spool(person_file)
             # Only use the first clothing image
-            clothing_img = Image(filepath=clothing_files[0])
+            clothing_spool = input_uploads.spool(clothing_files[0])
         except Exception as img_error:
             import traceback
             traceback.print_exc()
             return jsonify({'error': f'Failed to process images: {str(img_error)}'}), 500
 
-        # Create pending run in database immediately
+        # Create pending run in database immediately, with the image URLs filled in
+        # once the uploads finish
         try:
             run_id = create_pending_run(
-                model_url=person_img.url,
-                clothing_url=clothing_img.url,
+                model_url=None,
+                clothing_url=None,
                 settings=preset_ids  # Now storing numeric IDs
             )
         except Exception as db_error:
             import traceback
             traceback.print_exc()
+            input_uploads.discard([person_spool, clothing_spool])
             return jsonify({'error': f'Failed to create run in database: {str(db_error)}'}), 500
         
         # Convert run_id to string for consistency (database returns int, tracker uses str keys)
@@ -329,25 +648,32 @@ def generate_request():
             # but log the error (the worker thread will handle progress updates)
             print(f"Warning: Failed to initialize progress tracker for run {run_id_str}: {tracker_error}")
 
-        # Start background thread for generation
-        # Pass run_id_str to worker for progress tracking, but keep run_id (int) for database
+        # Start both uploads in parallel and queue the run; the job waits for the uploads
         try:
-            thread = threading.Thread(
-                target=_run_generation_worker,
-                args=(run_id, run_id_str, person_img, clothing_img, preset_ids)
-            )
-            thread.daemon = True
-            thread.start()
-        except Exception as thread_error:
+            input_uploads.submit(run_id_str, 'model', person_spool)
+            input_uploads.submit(run_id_str, 'clothing', clothing_spool)
+            job_id = job_queue.enqueue(run_id_str, {
+                'run_id': run_id,
+                'person_spool': person_spool,
+                'clothing_spool': clothing_spool,
+                'preset_ids': preset_ids,
+                'use_result_cache': request.form.get('skipCache', '').lower() not in ('true', '1')
+            })
+        except Exception as queue_error:
             import traceback
             traceback.print_exc()
-            # Run was created but thread failed to start - mark as error
-            try:
-                update_run_with_error(run_id, f'Failed to start generation thread: {str(thread_error)}')
-                progress_tracker.mark_error(run_id_str, f'Failed to start generation thread: {str(thread_error)}')
-            except Exception as update_error:
-                print(f"Failed to update run with thread error: {update_error}")
-            return jsonify({'error': f'Failed to start generation: {str(thread_error)}'}), 500
+            # Run was created but couldn't be queued - mark as error and drop its uploads
+            _fail_run(run_id, f'Failed to queue generation: {str(queue_error)}')
+            input_uploads.discard([person_spool, clothing_spool])
+            return jsonify({'error': f'Failed to start generation: {str(queue_error)}'}), 500
+
+        if job_id is None:
+            # The queue filled up since the capacity check above
+            _fail_run(run_id, 'Generation queue was full')
+            input_uploads.discard([person_spool, clothing_spool])
+            response = jsonify({'error': 'Too many generation requests in progress, please retry later'})
+            response.headers['Retry-After'] = str(JOB_QUEUE_RETRY_AFTER_SECONDS)
+            return response, 429
 
         # Return run_id (int) immediately - client will convert to string when checking progress
         return jsonify({'run_id': run_id}), 202  # 202 Accepted
@@ -358,8 +684,20 @@ def generate_request():
         return jsonify({'error': str(e)}), 500
 
 
+def start_background_workers():
+    """
+    Start this process's job queue workers. Not done on import, so scripts and the
+    reloader's watcher process that import the app don't run jobs; Gunicorn calls this
+    from the post_worker_init hook in gunicorn.conf.py, once in every worker.
+    """
+    job_queue.start(_handle_generation_job, _abandon_generation_job)
+
+
 # Development server - only used when running: python app.py
 # In production, Gunicorn runs the app (see /etc/systemd/system/wardrobe.service)
 # The port 4000 here is irrelevant in production - Gunicorn binds to 127.0.0.1:8000
 if __name__ == '__main__':
+    # With the reloader only the child process (WERKZEUG_RUN_MAIN set) serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(debug=True, host='0.0.0.0', port=4000, threaded=True)
@@ -0,0 +1,128 @@
+"""
+In-process caches with TTL, optional LRU size bound and hit/miss accounting.
+
+Every cache registers itself by name so its stats can be reported from /stats.
+A cache created with ttl_seconds <= 0 is disabled: it stores nothing and every
+lookup is a miss, which keeps call sites identical whether caching is on or off.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class TTLCache:
+    """Thread-safe key/value cache where entries expire ttl_seconds after they are set."""
+
+    def __init__(self, name, ttl_seconds, max_entries=None, register=True):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if register:
+            register_cache(name, self)
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def _lookup_locked(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            found, value = self._lookup_locked(key, time.monotonic())
+            if found:
+                self._hits += 1
+                return value
+            self._misses += 1
+            return default
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once.
+
+        Returns:
+            Tuple of (dict of found key -> value, list of missing keys in input order)
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                hit, value = self._lookup_locked(key, now)
+                if hit:
+                    self._hits += 1
+                    found[key] = value
+                else:
+                    self._misses += 1
+                    missing.append(key)
+        return found, missing
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        if not self.enabled:
+            return
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl_seconds
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            if self.max_entries:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or every entry if keys is None."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+            }
+
+
+def register_cache(name, cache):
+    """Report cache.stats() under name in get_cache_stats()."""
+    with _registry_lock:
+        _registry[name] = cache
+
+
+def get_cache_stats():
+    """Return stats for every registered cache, keyed by cache name."""
+    with _registry_lock:
+        caches = dict(_registry)
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -1,8 +1,10 @@
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from PIL import Image as PILImage
+from PIL import Image as PILImage, ImageOps
 import io
+from general_utils import detect_image_format
+from metrics import supabase_call
 
 load_dotenv()
 
@@ -13,46 +15,202 @@ bucket_name = os.getenv('SUPABASE_BUCKET_NAME', 'uploads')
 supabase: Client = create_client(supabase_url, supabase_key)
 
 
-def upload_image_to_supabase(image_file, filename):
+# How normalize_image_bytes encodes images it has to re-encode:
+#   png           - lossless PNG at IMAGE_PNG_COMPRESS_LEVEL (fast, the default)
+#   png_optimize  - lossless PNG with optimize=True (smallest PNG, seconds of CPU on 4K images)
+#   webp_lossless - lossless WebP at IMAGE_WEBP_METHOD effort
+#   jpeg          - JPEG at IMAGE_JPEG_QUALITY with 4:4:4 chroma, for photos
+IMAGE_ENCODING_PROFILE = os.getenv('IMAGE_ENCODING_PROFILE', 'png')
+IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv('IMAGE_PNG_COMPRESS_LEVEL', '3'))
+IMAGE_WEBP_METHOD = int(os.getenv('IMAGE_WEBP_METHOD', '1'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '92'))
+# Upload RGB images that are already in one of these formats without re-encoding, whatever
+# the profile (JPEGs lose their EXIF / XMP / IPTC segments; PNGs and WebPs with metadata
+# are re-encoded)
+IMAGE_PASSTHROUGH = os.getenv('IMAGE_PASSTHROUGH', 'true').lower() == 'true'
+IMAGE_PASSTHROUGH_FORMATS = os.getenv('IMAGE_PASSTHROUGH_FORMATS', 'PNG,JPEG,WEBP').upper().split(',')
+
+ENCODING_PROFILES = {
+    'png': ('PNG', {'compress_level': IMAGE_PNG_COMPRESS_LEVEL}),
+    'png_optimize': ('PNG', {'optimize': True}),
+    'webp_lossless': ('WEBP', {'lossless': True, 'method': IMAGE_WEBP_METHOD}),
+    'jpeg': ('JPEG', {'quality': IMAGE_JPEG_QUALITY, 'subsampling': 0}),
+}
+
+# Bump when normalize_image_bytes produces different bytes for the same input, so
+# image_dedup stops mapping raw uploads to objects stored by the old version
+NORMALIZE_VERSION = 2
+
+_EXIF_ORIENTATION = 0x0112
+
+# JPEG segments dropped on pass-through: APP1 (EXIF, including GPS and maker notes, and
+# XMP) and APP13 (IPTC). APP0 (JFIF), APP2 (ICC profile) and APP14 (Adobe) are kept.
+_JPEG_METADATA_MARKERS = (0xE1, 0xED)
+_JPEG_SOS = 0xDA
+
+
+def _is_compliant(img):
+    """Already RGB, in a pass-through format and not relying on an EXIF rotation."""
+    return (
+        img.mode == 'RGB'
+        and img.format in IMAGE_PASSTHROUGH_FORMATS
+        and img.getexif().get(_EXIF_ORIENTATION, 1) == 1
+    )
+
+
+def _strip_jpeg_metadata(image_data):
+    """
+    Remove the metadata segments from a JPEG without re-encoding it.
+
+    Returns:
+        bytes, or None if the segment layout is unexpected (the caller re-encodes instead)
+    """
+    if image_data[:2] != b'\xff\xd8':
+        return None
+    parts = [image_data[:2]]
+    pos = 2
+    while pos + 4 <= len(image_data):
+        if image_data[pos] != 0xFF:
+            return None
+        marker = image_data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == _JPEG_SOS:
+            # Entropy-coded data follows; metadata segments only come before it
+            parts.append(image_data[pos:])
+            return b''.join(parts)
+        length = int.from_bytes(image_data[pos + 2:pos + 4], 'big')
+        end = pos + 2 + length
+        if length < 2 or end > len(image_data):
+            return None
+        if marker not in _JPEG_METADATA_MARKERS:
+            parts.append(image_data[pos:end])
+        pos = end
+    return None
+
+
+def _passthrough_bytes(img, image_data):
+    """The bytes to upload for a compliant image as it is, without metadata, or None to re-encode."""
+    if img.format == 'JPEG':
+        return _strip_jpeg_metadata(image_data)
+    if img.getexif() or any(key in img.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp')):
+        return None
+    return image_data
+
+
+def normalize_image_bytes(image_file, profile=None):
+    """
+    Decode an image, apply its EXIF orientation, flatten any alpha onto white and
+    re-encode it as RGB using an encoding profile. Images that are already compliant
+    are returned without re-encoding. Either way the result carries no EXIF (the
+    uploads are public, and phone photos carry GPS coordinates).
+
+    Args:
+        image_file: bytes or a file-like object
+        profile: Key of ENCODING_PROFILES (defaults to IMAGE_ENCODING_PROFILE)
+
+    Returns:
+        bytes: The normalized image data (use detect_image_format for its type)
+
+    Raises:
+        Exception: If the profile is unknown
+    """
+    profile = profile or IMAGE_ENCODING_PROFILE
+    if profile not in ENCODING_PROFILES:
+        raise Exception(f"Unknown image encoding profile: {profile}")
+    image_format, save_params = ENCODING_PROFILES[profile]
+
+    if hasattr(image_file, 'read'):
+        image_data = image_file.read()
+        image_file.seek(0)
+    else:
+        image_data = image_file
+
+    img = PILImage.open(io.BytesIO(image_data))
+
+    if IMAGE_PASSTHROUGH and _is_compliant(img):
+        passthrough = _passthrough_bytes(img, image_data)
+        if passthrough is not None:
+            return passthrough
+
+    # Rotate the pixels as the EXIF tag says; the tag itself isn't written back
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = PILImage.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **save_params)
+    return buffer.getvalue()
+
+
+@supabase_call('storage')
+def upload_image_bytes_to_supabase(image_bytes, filename, content_type='image/png', exist_ok=False):
+    """
+    Upload already-encoded image bytes to Supabase storage as-is.
+
+    Args:
+        exist_ok: Treat "file already exists" as success (for content-addressed filenames)
+
+    Returns:
+        str: The public URL of the uploaded file
+    """
     try:
-        if hasattr(image_file, 'read'):
-            image_data = image_file.read()
-            image_file.seek(0)
-        else:
-            image_data = image_file
-
-        img = PILImage.open(io.BytesIO(image_data))
-
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = PILImage.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG', optimize=True)
-        buffer.seek(0)
-
-        if not filename.endswith('.png'):
-            filename = filename.rsplit('.', 1)[0] + '.png'
-
-        response = supabase.storage.from_(bucket_name).upload(
+        supabase.storage.from_(bucket_name).upload(
             filename,
-            buffer.getvalue(),
-            file_options={"content-type": "image/png"}
+            image_bytes,
+            file_options={"content-type": content_type}
         )
 
-        public_url = supabase.storage.from_(bucket_name).get_public_url(filename)
+        return supabase.storage.from_(bucket_name).get_public_url(filename)
+
+    except Exception as e:
+        if exist_ok and ('Duplicate' in str(e) or 'already exists' in str(e)):
+            return supabase.storage.from_(bucket_name).get_public_url(filename)
+        raise Exception(f"Failed to upload to Supabase: {str(e)}")
+
 
-        return public_url
+@supabase_call('storage')
+def supabase_image_exists(filename):
+    """
+    Check whether a file exists in Supabase storage (one list call, no download).
 
+    Returns:
+        str: Its public URL if it exists, otherwise None
+    """
+    folder, _, name = filename.rpartition('/')
+    try:
+        entries = supabase.storage.from_(bucket_name).list(folder, {'search': name, 'limit': 10})
+    except Exception as e:
+        raise Exception(f"Failed to check Supabase storage: {str(e)}")
+
+    if any(entry.get('name') == name for entry in entries):
+        return supabase.storage.from_(bucket_name).get_public_url(filename)
+    return None
+
+
+def upload_image_to_supabase(image_file, filename):
+    try:
+        image_bytes = normalize_image_bytes(image_file)
     except Exception as e:
         raise Exception(f"Failed to upload to Supabase: {str(e)}")
 
+    extension, content_type = detect_image_format(image_bytes)
+    if not filename.endswith(f'.{extension}'):
+        filename = filename.rsplit('.', 1)[0] + f'.{extension}'
+
+    return upload_image_bytes_to_supabase(image_bytes, filename, content_type=content_type)
+
 
+@supabase_call('storage')
 def delete_image_from_supabase(filename):
     try:
         supabase.storage.from_(bucket_name).remove([filename])
@@ -74,6 +232,7 @@ def serialize_value(obj):
         return obj
 
 
+@supabase_call('table')
 def create_run(model_url, clothing_url, intermediate_outputs, outputs, settings):
     """Legacy function for backward compatibility. Creates a complete run."""
     inputs = {
@@ -99,6 +258,7 @@ def create_run(model_url, clothing_url, intermediate_outputs, outputs, settings)
         raise Exception("Failed to create run in database")
 
 
+@supabase_call('table')
 def create_pending_run(model_url, clothing_url, settings):
     """
     Create a new run in 'pending' status without outputs.
@@ -127,6 +287,28 @@ def create_pending_run(model_url, clothing_url, settings):
         raise Exception("Failed to create pending run in database")
 
 
+@supabase_call('table')
+def update_run_input_images(run_id, model_url, clothing_url):
+    """
+    Fill in the input image URLs of a run created with pending (None) images.
+
+    Args:
+        run_id: The ID of the run to update
+        model_url: Public URL of the uploaded model image
+        clothing_url: Public URL of the uploaded clothing image
+    """
+    result = supabase.table('runs').select('inputs').eq('id', run_id).execute()
+    if not result.data:
+        raise Exception(f"Run {run_id} not found")
+
+    inputs = result.data[0].get('inputs') or {}
+    inputs['model'] = model_url
+    inputs['clothing'] = clothing_url
+
+    supabase.table('runs').update({'inputs': inputs}).eq('id', run_id).execute()
+
+
+@supabase_call('table')
 def update_run_with_results(run_id, intermediate_outputs, outputs):
     """
     Update a run with the final results after generation completes.
@@ -139,6 +321,11 @@ def update_run_with_results(run_id, intermediate_outputs, outputs):
     outputs_json = [serialize_value(img) for img in outputs]
     intermediate_json = serialize_value(intermediate_outputs)
 
+    # This replaces intermediate_outputs wholesale, so carry the final progress along
+    # instead of leaving a completed run at 0% until mark_complete merges it back
+    if isinstance(intermediate_json, dict):
+        intermediate_json['progress_percent'] = 100
+
     result = supabase.table('runs').update({
         'intermediate_outputs': intermediate_json,
         'outputs': outputs_json,
@@ -149,6 +336,7 @@ def update_run_with_results(run_id, intermediate_outputs, outputs):
         raise Exception(f"Failed to update run {run_id} in database")
 
 
+@supabase_call('table')
 def update_run_with_error(run_id, error_message):
     """
     Update a run with error status when generation fails.
@@ -166,6 +354,73 @@ def update_run_with_error(run_id, error_message):
         raise Exception(f"Failed to update run {run_id} with error")
 
 
+@supabase_call('table')
+def get_run_by_id(run_id, fields=None):
+    """
+    Get one run, reading only the given columns.
+    
+    Args:
+        run_id: The ID of the run
+        fields: Column names to select (all columns if None)
+        
+    Returns:
+        Dict with the selected columns, or None if the run doesn't exist
+    """
+    columns = ','.join(fields) if fields else '*'
+    result = supabase.table('runs').select(columns).eq('id', run_id).execute()
+    
+    if result.data:
+        return result.data[0]
+    return None
+
+
+@supabase_call('table')
+def list_runs(fields, limit, before_id=None, statuses=None, is_sample=None):
+    """
+    Get a page of runs, newest first (keyset pagination on the run ID).
+    
+    Args:
+        fields: Column names to select
+        limit: Maximum number of runs to return
+        before_id: Only return runs with a smaller ID (the previous page's last ID)
+        statuses: Optional list of statuses to keep
+        is_sample: Optional True/False to keep only sample / non-sample runs
+        
+    Returns:
+        List of dicts with the selected columns, ordered by ID descending
+    """
+    query = supabase.table('runs').select(','.join(fields))
+    if before_id is not None:
+        query = query.lt('id', before_id)
+    if statuses:
+        query = query.in_('status', statuses)
+    if is_sample is not None:
+        query = query.eq('is_sample', is_sample)
+    
+    result = query.order('id', desc=True).limit(limit).execute()
+    return result.data or []
+
+
+@supabase_call('table')
+def get_runs_by_ids(run_ids, fields):
+    """
+    Get several runs in one query.
+    
+    Args:
+        run_ids: List of run IDs
+        fields: Column names to select (must include 'id')
+        
+    Returns:
+        Dict mapping str(run_id) to the run's selected columns; missing runs are absent
+    """
+    if not run_ids:
+        return {}
+    
+    result = supabase.table('runs').select(','.join(fields)).in_('id', run_ids).execute()
+    return {str(row['id']): row for row in result.data or []}
+
+
+@supabase_call('table')
 def get_all_presets():
     """
     Get all presets from the presets table.
@@ -180,6 +435,7 @@ def get_all_presets():
     return []
 
 
+@supabase_call('table')
 def get_preset_names_by_ids(preset_ids):
     """
     Get preset names for a list of preset IDs.
@@ -198,3 +454,27 @@ def get_preset_names_by_ids(preset_ids):
     if result.data:
         return {row['id']: row['name'] for row in result.data}
     return {}
+
+
+@supabase_call('table')
+def get_sample_runs():
+    """
+    Get the inputs and outputs of every sample run.
+    
+    Returns:
+        List of dicts with 'id', 'inputs' and 'outputs', ordered by run ID
+    """
+    result = supabase.table('runs').select('id,inputs,outputs').eq('is_sample', True).order('id').execute()
+    return result.data or []
+
+
+@supabase_call('table')
+def get_sample_run_ids():
+    """
+    Get the IDs of every sample run (a cheap check for sample rows being added or removed).
+    
+    Returns:
+        List of run IDs in ascending order
+    """
+    result = supabase.table('runs').select('id').eq('is_sample', True).order('id').execute()
+    return [row['id'] for row in result.data or []]
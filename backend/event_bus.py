@@ -0,0 +1,94 @@
+"""
+Event Bus Module
+Per-run event stream feeding GET /runs/<run_id>/events (Server-Sent Events).
+
+The worker thread running a pipeline publishes progress, per-preset outputs and the
+terminal state here; SSE handlers in any Gunicorn worker on the same host read them
+back. This is a local stand-in for a real pub/sub bus: events go into a node-local
+SQLite table (see sqlite_utils.py), and subscribers tail it by event ID, so streaming
+never re-queries Supabase.
+"""
+import json
+import os
+import threading
+import time
+from sqlite_utils import get_connection
+
+EVENT_BUS_RETENTION_SECONDS = int(os.getenv('EVENT_BUS_RETENTION_SECONDS', '86400'))
+
+TERMINAL_EVENTS = ('complete', 'error')
+
+_DB_NAME = 'event_bus'
+_PRUNE_EVERY = 500
+
+
+class LocalEventBus:
+    """Append-only, per-run event log shared by all workers on this host."""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._schema_ready = False
+        self._publish_count = 0
+
+    def _conn(self):
+        conn = get_connection(_DB_NAME)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS events_run_id ON events (run_id, id)')
+            self._schema_ready = True
+        return conn
+
+    def publish(self, run_id: str, event: str, data: dict) -> int:
+        """Append an event for a run. Returns its event ID."""
+        conn = self._conn()
+        cursor = conn.execute(
+            'INSERT INTO events (run_id, event, data, created_at) VALUES (?, ?, ?, ?)',
+            (str(run_id), event, json.dumps(data), time.time())
+        )
+
+        self._publish_count += 1
+        if self._publish_count % _PRUNE_EVERY == 0:
+            self.prune()
+
+        return cursor.lastrowid
+
+    def read(self, run_id: str, after_id: int = 0) -> list:
+        """
+        Get a run's events newer than after_id.
+
+        Returns:
+            List of (event_id, event, data dict) tuples in publish order
+        """
+        rows = self._conn().execute(
+            'SELECT id, event, data FROM events WHERE run_id = ? AND id > ? ORDER BY id',
+            (str(run_id), after_id)
+        ).fetchall()
+        return [(row['id'], row['event'], json.loads(row['data'])) for row in rows]
+
+    def prune(self, max_age_seconds: int = EVENT_BUS_RETENTION_SECONDS) -> None:
+        """Drop events older than max_age_seconds."""
+        self._conn().execute('DELETE FROM events WHERE created_at < ?', (time.time() - max_age_seconds,))
+
+
+# Global singleton instance
+event_bus = LocalEventBus()
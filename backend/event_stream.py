@@ -0,0 +1,169 @@
+"""
+Event Stream Module
+Server-Sent Events responses for GET /runs/<run_id>/events.
+
+An open stream occupies whatever serves it for up to SSE_MAX_STREAM_SECONDS. In the
+main app that is one of the few Gunicorn threads (4 workers x 2 threads), so streams
+are served by sse_app.py instead: a separate Gunicorn process with a gevent worker,
+where a stream costs a greenlet rather than a thread, and nginx routes the events
+URL to it (see README).
+
+Each process admits at most SSE_MAX_STREAMS concurrent streams. Past that the request
+gets HTTP 503 with Retry-After and should poll POST /check_progress instead. The
+default of 1 suits the main app, where a stream only shows up if nginx is not routing
+them to the SSE service; that service raises the limit in its own service file.
+"""
+import json
+import os
+import threading
+import time
+from flask import Response, jsonify, stream_with_context
+from progress_tracker import progress_tracker
+from event_bus import event_bus, TERMINAL_EVENTS
+
+# How often a stream checks the local event bus, how often it sends a keepalive
+# comment, and how long one connection may stay open before the client reconnects
+SSE_POLL_INTERVAL_SECONDS = float(os.getenv('SSE_POLL_INTERVAL_SECONDS', '0.5'))
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+SSE_MAX_STREAM_SECONDS = float(os.getenv('SSE_MAX_STREAM_SECONDS', '300'))
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '1'))
+SSE_RETRY_AFTER_SECONDS = int(os.getenv('SSE_RETRY_AFTER_SECONDS', '5'))
+
+
+class StreamSlots:
+    """Counts the streams open in this process and refuses new ones past the limit."""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._open = 0
+        self._slots_lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a slot; False if SSE_MAX_STREAMS streams are already open."""
+        with self._slots_lock:
+            if self._open >= SSE_MAX_STREAMS:
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._slots_lock:
+            self._open = max(0, self._open - 1)
+
+    def open_count(self) -> int:
+        with self._slots_lock:
+            return self._open
+
+
+def _format_sse(event, data, event_id=None):
+    message = ''
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return message
+
+
+def _stream(run_id, after_id):
+    yield 'retry: 3000\n\n'
+
+    cursor = after_id
+    events = event_bus.read(run_id, cursor)
+
+    if not events and cursor == 0:
+        snapshot = progress_tracker.get_progress(run_id)
+        if snapshot is None:
+            yield _format_sse('error', {'error': 'Run not found'})
+            return
+        if snapshot.error:
+            yield _format_sse('error', {'error': snapshot.error})
+            return
+        if snapshot.is_complete:
+            yield _format_sse('complete', {'progress': 100})
+            return
+        yield _format_sse('progress', {'progress': snapshot.progress})
+
+    started_at = time.time()
+    last_sent_at = started_at
+
+    while True:
+        for event_id, event, data in events:
+            cursor = event_id
+            yield _format_sse(event, data, event_id)
+            last_sent_at = time.time()
+            if event in TERMINAL_EVENTS:
+                return
+
+        now = time.time()
+        if now - started_at >= SSE_MAX_STREAM_SECONDS:
+            # Client reconnects with Last-Event-ID and resumes
+            return
+        if now - last_sent_at >= SSE_KEEPALIVE_SECONDS:
+            yield ': keepalive\n\n'
+            last_sent_at = now
+
+        time.sleep(SSE_POLL_INTERVAL_SECONDS)
+        events = event_bus.read(run_id, cursor)
+
+
+def stream_run_events(run_id, last_event_id=None):
+    """
+    Build the response for GET /runs/<run_id>/events.
+
+    Events:
+        progress: {"progress": 45}
+        output:   {"stage": "generate" | "enhance", "preset_id": 1, "preset_name": "...", "output_url": "..."}
+        complete: {"progress": 100, "outputs": [{"url": "...", "filepath": null}, ...]}  (terminal)
+        error:    {"error": "..."}  (terminal)
+
+    Events are read from the node-local event bus the worker publishes to, not from
+    Supabase. If this host has no events for the run (e.g. it ran elsewhere or before a
+    restart), one snapshot is read from the progress tracker.
+
+    Args:
+        run_id: The run to stream
+        last_event_id: Last-Event-ID sent by a reconnecting client, to resume after it
+
+    Returns:
+        The streaming Response, or a 503 (response, status) tuple when this process
+        already has SSE_MAX_STREAMS streams open
+    """
+    if not stream_slots.acquire():
+        response = jsonify({
+            'error': 'Too many open progress streams, poll /check_progress instead',
+            'fallback': '/check_progress'
+        })
+        response.headers['Retry-After'] = str(SSE_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    try:
+        after_id = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        after_id = 0
+
+    response = Response(
+        stream_with_context(_stream(run_id, after_id)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+        }
+    )
+    # Runs when the server closes the response: stream finished or client went away
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+# Global singleton instance
+stream_slots = StreamSlots()
@@ -1,5 +1,5 @@
 import os
-import requests
+from ai_api_utils import http_session
 from PIL import Image
 import io
 
@@ -45,7 +45,7 @@ def save_image_locally(image_data, filename):
 def download_image_from_url(url, filename):
     ensure_temp_folder()
     try:
-        response = requests.get(url, timeout=600)
+        response = http_session.get(url, timeout=600)
         response.raise_for_status()
         return save_image_locally(response.content, filename)
     except Exception as e:
@@ -4,3 +4,17 @@ import uuid
 def generate_uuid_filename(extension='png'):
     unique_id = uuid.uuid4().hex
     return f"{unique_id}.{extension}"
+
+
+def detect_image_format(image_bytes):
+    """
+    Identify an encoded image from its magic bytes without decoding it.
+
+    Returns:
+        Tuple of (file extension, content type); defaults to PNG if unrecognized
+    """
+    if image_bytes[:3] == b'\xff\xd8\xff':
+        return 'jpg', 'image/jpeg'
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'webp', 'image/webp'
+    return 'png', 'image/png'
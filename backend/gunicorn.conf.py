@@ -0,0 +1,12 @@
+"""
+Gunicorn settings read from the working directory (backend/) on start.
+
+The command line in the service file (see README) still sets the workers, threads,
+bind address and timeout; this file only adds the hooks.
+"""
+
+
+def post_worker_init(worker):
+    # Each worker process runs its own job queue workers (see job_queue.py)
+    from app import start_background_workers
+    start_background_workers()
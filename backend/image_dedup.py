@@ -0,0 +1,141 @@
+"""
+Image Dedup Module
+Content-addressed uploads, so identical images are stored and transferred once.
+
+Normalized images are uploaded as CONTENT_PREFIX/<sha256 of the normalized bytes>.<ext>.
+A node-local SQLite index (see sqlite_utils.py) remembers, for every image seen:
+    raw hash (+ encoding profile) -> content hash   (skips decoding and re-encoding)
+    content hash -> public URL                      (skips the upload)
+Content hashes the index doesn't know are checked against storage with one list call
+before uploading, so dedup also works across hosts and after local state is lost.
+If images are ever deleted from storage, delete LOCAL_STATE_DIR/image_dedup.db too.
+"""
+import hashlib
+import os
+import threading
+import time
+from db_utils import (
+    IMAGE_ENCODING_PROFILE,
+    NORMALIZE_VERSION,
+    normalize_image_bytes,
+    upload_image_bytes_to_supabase,
+    supabase_image_exists
+)
+from general_utils import generate_uuid_filename, detect_image_format
+from sqlite_utils import get_connection
+
+IMAGE_DEDUP_ENABLED = os.getenv('IMAGE_DEDUP_ENABLED', 'true').lower() == 'true'
+CONTENT_PREFIX = os.getenv('IMAGE_DEDUP_PREFIX', 'content')
+
+_DB_NAME = 'image_dedup'
+
+_schema_ready = False
+_stats_lock = threading.Lock()
+_stats = {'raw_hits': 0, 'content_hits': 0, 'storage_hits': 0, 'uploads': 0}
+
+
+def _conn():
+    global _schema_ready
+    conn = get_connection(_DB_NAME)
+    if not _schema_ready:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS raw_hashes (
+                raw_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS contents (
+                content_hash TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        _schema_ready = True
+    return conn
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def _lookup_url(content_hash):
+    row = _conn().execute('SELECT url FROM contents WHERE content_hash = ?', (content_hash,)).fetchone()
+    return row['url'] if row else None
+
+
+def _remember(raw_key, content_hash, url):
+    conn = _conn()
+    conn.execute('INSERT OR REPLACE INTO contents (content_hash, url, created_at) VALUES (?, ?, ?)',
+                 (content_hash, url, time.time()))
+    conn.execute('INSERT OR REPLACE INTO raw_hashes (raw_key, content_hash) VALUES (?, ?)',
+                 (raw_key, content_hash))
+
+
+def upload_image_deduplicated(image_data):
+    """
+    Normalize and upload an image unless identical content is already stored.
+
+    Args:
+        image_data: Raw image bytes as received
+
+    Returns:
+        Tuple of (public URL, normalized bytes). The bytes are None when the raw image
+        was recognized before decoding, i.e. encoding was skipped entirely.
+    """
+    if not IMAGE_DEDUP_ENABLED:
+        image_bytes = normalize_image_bytes(image_data)
+        extension, content_type = detect_image_format(image_bytes)
+        _count('uploads')
+        return upload_image_bytes_to_supabase(image_bytes, generate_uuid_filename(extension),
+                                              content_type=content_type), image_bytes
+
+    # The profile and normalization version are part of the key: the same upload
+    # normalizes differently under each
+    raw_key = f"{IMAGE_ENCODING_PROFILE}:v{NORMALIZE_VERSION}:{hashlib.sha256(image_data).hexdigest()}"
+    row = _conn().execute('SELECT content_hash FROM raw_hashes WHERE raw_key = ?', (raw_key,)).fetchone()
+    if row is not None:
+        url = _lookup_url(row['content_hash'])
+        if url is not None:
+            _count('raw_hits')
+            return url, None
+
+    image_bytes = normalize_image_bytes(image_data)
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+
+    url = _lookup_url(content_hash)
+    if url is not None:
+        _count('content_hits')
+        _remember(raw_key, content_hash, url)
+        return url, image_bytes
+
+    extension, content_type = detect_image_format(image_bytes)
+    filename = f"{CONTENT_PREFIX}/{content_hash}.{extension}"
+
+    try:
+        url = supabase_image_exists(filename)
+    except Exception as e:
+        print(f"Storage existence check failed, uploading anyway: {e}")
+        url = None
+
+    if url is not None:
+        _count('storage_hits')
+    else:
+        # exist_ok: a concurrent upload of the same content may have won the race
+        url = upload_image_bytes_to_supabase(image_bytes, filename, content_type=content_type, exist_ok=True)
+        _count('uploads')
+
+    _remember(raw_key, content_hash, url)
+    return url, image_bytes
+
+
+def get_dedup_stats():
+    """This process's dedup outcomes and hit rate since startup."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    hits = stats['raw_hits'] + stats['content_hits'] + stats['storage_hits']
+    stats['enabled'] = IMAGE_DEDUP_ENABLED
+    stats['hit_rate'] = round(hits / total, 3) if total else None
+    return stats
@@ -0,0 +1,10 @@
+"""
+Concurrency limits for the inference pipeline.
+
+GENERATE_MAX_CONCURRENCY_PER_RUN caps how many presets a single run works on at once.
+The process-wide cap on in-flight Gemini requests (GEMINI_MAX_CONCURRENCY) lives in
+ai_api_utils.gemini, so every Gemini caller shares it.
+"""
+import os
+
+GENERATE_MAX_CONCURRENCY_PER_RUN = int(os.getenv('GENERATE_MAX_CONCURRENCY_PER_RUN', '3'))
@@ -0,0 +1,108 @@
+"""
+Run-scoped image store shared by the generate and enhance steps.
+
+Keeps the bytes of every image the run already has (the original uploads and the
+generated outputs before they are uploaded), keyed by their public URL, so the
+pipeline doesn't download its own images back from Supabase storage. Anything not
+seeded is downloaded once on first use; content hashes and the versions of the
+person and clothing images prepared for Gemini requests are cached alongside. Images
+are only decoded to prepare them and not kept, so a run doesn't hold decoded bitmaps.
+"""
+import hashlib
+import threading
+from ai_api_utils import http_session
+from general_utils import detect_image_format
+from io import BytesIO
+from PIL import Image as PILImage
+from .input_prep import prepare_image
+
+
+def download_image_bytes(url):
+    """Download an image from URL and return its raw bytes."""
+    response = http_session.get(url, timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+class RunImageStore:
+    """
+    Image bytes, content hashes and prepared inputs for one pipeline run, keyed by URL.
+    Safe to share between the run's worker threads; concurrent requests for the
+    same URL wait for a single download/preparation.
+    """
+
+    def __init__(self):
+        self._bytes = {}
+        self._hashes = {}
+        self._prepared = {}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    def _url_lock(self, url):
+        with self._lock:
+            lock = self._url_locks.get(url)
+            if lock is None:
+                lock = self._url_locks[url] = threading.Lock()
+            return lock
+
+    def put(self, url, image_bytes):
+        """Seed the store with bytes we already hold for url."""
+        if not url or image_bytes is None:
+            return
+        with self._lock:
+            self._bytes[url] = image_bytes
+
+    def get_bytes(self, url):
+        """Return the raw bytes for url, downloading them on first use."""
+        with self._url_lock(url):
+            image_bytes = self._bytes.get(url)
+            if image_bytes is None:
+                image_bytes = download_image_bytes(url)
+                with self._lock:
+                    self._bytes[url] = image_bytes
+            return image_bytes
+
+    def content_hash(self, url):
+        """Return the SHA-256 hex digest of the image bytes for url (downloading them on first use)."""
+        image_hash = self._hashes.get(url)
+        if image_hash is None:
+            image_hash = hashlib.sha256(self.get_bytes(url)).hexdigest()
+            with self._lock:
+                self._hashes[url] = image_hash
+        return image_hash
+
+    def get_prepared(self, url):
+        """
+        Return a user input image for url prepared for a Gemini request (see
+        input_prep.py), preparing it on first use.
+
+        Returns:
+            Tuple of (encoded bytes, mime type)
+        """
+        prepared = self._prepared.get(url)
+        if prepared is not None:
+            return prepared
+
+        image_bytes = self.get_bytes(url)
+        with self._url_lock(url):
+            prepared = self._prepared.get(url)
+            if prepared is None:
+                # Decode just for preparation; the bitmap is dropped once it is encoded
+                image = PILImage.open(BytesIO(image_bytes))
+                image.load()
+                prepared = prepare_image(image)
+                with self._lock:
+                    self._prepared[url] = prepared
+            return prepared
+
+    def get_original(self, url):
+        """
+        Return the image for url exactly as stored, for requests that need it at full
+        resolution in its original encoding (reference images, generated images to enhance).
+
+        Returns:
+            Tuple of (encoded bytes, mime type)
+        """
+        image_bytes = self.get_bytes(url)
+        _, mime_type = detect_image_format(image_bytes)
+        return image_bytes, mime_type
@@ -0,0 +1,54 @@
+"""
+Input preparation for Gemini requests.
+
+Handing generate_content a PIL image makes the SDK re-encode it as a full-size PNG on
+every call and retry, so the request size follows the resolution of the user's photo
+rather than what the model needs. The person and clothing photos are instead prepared
+once per run (cached in the RunImageStore): downscaled so the longest edge is at most
+GEMINI_INPUT_MAX_EDGE and encoded as GEMINI_INPUT_FORMAT. Uploads are already upright,
+since db_utils.normalize_image_bytes applies the EXIF orientation when it stores them;
+prepare_image applies it too, for images that didn't come through an upload.
+Reference images and the generated image sent to enhance are passed through as stored,
+so enhance works on the full-resolution output.
+"""
+import os
+from io import BytesIO
+from PIL import Image as PILImage, ImageOps
+
+GEMINI_INPUT_MAX_EDGE = int(os.getenv('GEMINI_INPUT_MAX_EDGE', '2048'))  # 0 keeps the original size
+GEMINI_INPUT_FORMAT = os.getenv('GEMINI_INPUT_FORMAT', 'jpeg').lower()  # 'jpeg' or 'png'
+GEMINI_INPUT_JPEG_QUALITY = int(os.getenv('GEMINI_INPUT_JPEG_QUALITY', '90'))
+
+
+def prepare_image(image, max_edge=None, image_format=None):
+    """
+    Orient, downscale and encode an image for a Gemini request.
+
+    Args:
+        image: A loaded PIL image (not modified)
+        max_edge: Longest edge in pixels (defaults to GEMINI_INPUT_MAX_EDGE; 0 keeps the size)
+        image_format: 'jpeg' or 'png' (defaults to GEMINI_INPUT_FORMAT); images with
+            transparency are always encoded as PNG
+
+    Returns:
+        Tuple of (encoded bytes, mime type)
+    """
+    max_edge = GEMINI_INPUT_MAX_EDGE if max_edge is None else max_edge
+    image_format = image_format or GEMINI_INPUT_FORMAT
+
+    # exif_transpose returns a copy, so the caller's (cached) image is never modified
+    prepared = ImageOps.exif_transpose(image)
+
+    if max_edge and max(prepared.size) > max_edge:
+        prepared.thumbnail((max_edge, max_edge), PILImage.Resampling.LANCZOS)
+
+    has_alpha = prepared.mode in ('RGBA', 'LA') or (prepared.mode == 'P' and 'transparency' in prepared.info)
+    buffer = BytesIO()
+    if image_format == 'jpeg' and not has_alpha:
+        if prepared.mode != 'RGB':
+            prepared = prepared.convert('RGB')
+        prepared.save(buffer, format='JPEG', quality=GEMINI_INPUT_JPEG_QUALITY)
+        return buffer.getvalue(), 'image/jpeg'
+
+    prepared.save(buffer, format='PNG', compress_level=3)
+    return buffer.getvalue(), 'image/png'
@@ -1,19 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .step_analyze import analyze
 from .step_generate import generate
 from .step_enhance import enhance
 from models.image import Image
-from db_utils import upload_image_to_supabase
-from general_utils import generate_uuid_filename
+from db_utils import upload_image_bytes_to_supabase
+from general_utils import generate_uuid_filename, detect_image_format
+from .concurrency import GENERATE_MAX_CONCURRENCY_PER_RUN
+from .stage_progress import StageProgress
+from .image_store import RunImageStore
+from .result_cache import preset_result_cache, preset_result_key
+import metrics
 
 
-def run(person_image, clothing_image, preset_ids, run_id=None, progress_callback=None):
+def upload_output_image(image_bytes):
+    """
+    Upload a Gemini output image to Supabase exactly as it was returned,
+    without decoding or re-encoding it.
+    
+    Returns:
+        str: The public URL of the uploaded image
+    """
+    extension, content_type = detect_image_format(image_bytes)
+    filename = generate_uuid_filename(extension)
+    with metrics.timed(metrics.PIPELINE_STAGE_SECONDS, stage='upload'):
+        return upload_image_bytes_to_supabase(image_bytes, filename, content_type=content_type)
+
+
+def run(person_image, clothing_image, preset_ids, run_id=None, progress_callback=None, max_concurrency=None,
+        output_callback=None, use_result_cache=True):
     """
     Run the inference pipeline with optional progress tracking.
     
     Three stages:
     1. Analyze (0% -> 25%): Detect gender, analyze clothing, fetch preset details
-    2. Generate (25% -> 75%): Generate images for each preset using Gemini
-    3. Enhance (75% -> 100%): Enhance each generated image to harmonize clothing
+    2. Generate: Generate an image for each preset using Gemini
+    3. Enhance: Enhance each generated image to harmonize clothing
+    
+    Presets run concurrently and each one moves from generate to enhance as soon as
+    its own generation is uploaded. Stages 2 and 3 share 25% -> 100%, weighted per
+    preset and per stage (see stage_progress.py).
+    
+    A preset whose exact inputs were processed before returns the stored output URLs
+    instead of calling Gemini (see result_cache.py); its results carry 'cached': True.
+    
+    Each stage is timed in the pipeline_stage_seconds histogram (see metrics.py).
     
     Args:
         person_image: Image object for the person/model
@@ -21,6 +51,11 @@ def run(person_image, clothing_image, preset_ids, run_id=None, progress_callback
         preset_ids: List of preset IDs (integers)
         run_id: Optional run ID for progress tracking
         progress_callback: Optional callback function(run_id, progress) to update progress
+        max_concurrency: Optional cap on presets processed at once for this run
+            (defaults to GENERATE_MAX_CONCURRENCY_PER_RUN)
+        output_callback: Optional callback function(stage, result) called from worker threads
+            as each preset finishes 'generate' or 'enhance'; result is the step's result dict
+        use_result_cache: Set to False to always regenerate instead of reusing stored outputs
         
     Returns:
         Dict with analysis, intermediate_outputs, and outputs
@@ -28,143 +63,181 @@ def run(person_image, clothing_image, preset_ids, run_id=None, progress_callback
     person_url = person_image.url
     clothing_url = clothing_image.url
     
-    def update_progress(progress):
-        """Helper to update progress if callback is provided."""
-        if progress_callback:
-            # Callback signature: callback(progress) - run_id is captured in closure
-            progress_callback(progress)
+    # Images shared by generate and enhance, seeded with the uploads we already hold
+    image_store = RunImageStore()
+    image_store.put(person_url, person_image.data)
+    image_store.put(clothing_url, clothing_image.data)
+    
+    progress = StageProgress([], progress_callback)
+    
+    def report_output(stage, result):
+        """Helper to report a finished preset stage if callback is provided."""
+        if output_callback:
+            output_callback(stage, result)
     
     # Stage 1: Analyze (0% -> 25%)
-    update_progress(0)
-    analysis_result = analyze(person_url, clothing_url, preset_ids)
-    update_progress(25)
+    progress.start()
+    with metrics.timed(metrics.PIPELINE_STAGE_SECONDS, stage='analyze'):
+        analysis_result = analyze(person_url, clothing_url, preset_ids, image_store=image_store)
     
     # Extract analysis results
     garment_description = analysis_result['garment_description']
     preset_details = analysis_result['preset_details']
     clothing_type = analysis_result['clothing_type']
     
-    # Stage 2: Generate (25% -> 75%)
-    # Calculate progress increment per preset for generation
     num_presets = len(preset_details)
     if num_presets == 0:
         raise Exception("No valid presets found for the given IDs and gender")
     
-    progress_per_preset_generate = 50 / num_presets  # 50% total for generation stage (25% -> 75%)
+    progress.set_presets([preset_detail['preset_id'] for preset_detail in preset_details])
+    progress.analyze_done()
     
-    generate_results = []
-    # Use dict keyed by preset_id for safer data passing
-    generated_image_urls_by_preset = {}
+    # Content hashes of the inputs, for the per-preset result cache
+    input_hashes = None
+    if use_result_cache and preset_result_cache.enabled:
+        input_hashes = (image_store.content_hash(person_url), image_store.content_hash(clothing_url))
     
-    for i, preset_detail in enumerate(preset_details):
+    # Stages 2 and 3: Generate -> Enhance (25% -> 100%)
+    # Each preset streams through both stages on its own, so a preset that finishes
+    # generating goes straight into enhance instead of waiting for the others.
+    def process_preset(preset_detail):
+        """Generate, upload, enhance and upload the image for one preset. Runs in a worker thread."""
         preset_id = preset_detail['preset_id']
+        preset_name = preset_detail['name']
         
-        # Generate image for this preset
-        generated_image_bytes = generate(
-            model_image_url=person_url,
-            clothing_image_url=clothing_url,
-            preset_detail=preset_detail,
-            garment_description=garment_description
-        )
+        cache_key = None
+        if input_hashes is not None:
+            cache_key = preset_result_key(*input_hashes, preset_detail, garment_description, clothing_type)
+            cached = preset_result_cache.get(cache_key)
+            if cached is not None:
+                generate_result = {
+                    'preset_id': preset_id,
+                    'preset_name': preset_name,
+                    'output_url': cached['generate_url'],
+                    'cached': True
+                }
+                progress.stage_done(preset_id, 'generate')
+                report_output('generate', generate_result)
+                
+                enhance_result = {
+                    'preset_id': preset_id,
+                    'preset_name': preset_name,
+                    'output_url': cached['enhance_url'],
+                    'cached': True
+                }
+                progress.stage_done(preset_id, 'enhance')
+                report_output('enhance', enhance_result)
+                return generate_result, enhance_result
         
-        # If generation failed (returns None), skip this preset
+        with metrics.timed(metrics.PIPELINE_STAGE_SECONDS, stage='generate') as observation:
+            generated_image_bytes = generate(
+                model_image_url=person_url,
+                clothing_image_url=clothing_url,
+                preset_detail=preset_detail,
+                garment_description=garment_description,
+                image_store=image_store
+            )
+            if generated_image_bytes is None:
+                observation['outcome'] = 'failed'
+        
+        # If generation failed (returns None), record the failure and skip enhancement
         if generated_image_bytes is None:
-            # Record the failure in generate_results
-            generate_results.append({
+            progress.skip_remaining(preset_id)
+            generate_result = {
                 'preset_id': preset_id,
-                'preset_name': preset_detail['name'],
+                'preset_name': preset_name,
                 'output_url': None,
                 'error': 'Generation failed after retries'
-            })
-            # Update progress and continue to next preset
-            current_progress = 25 + int((i + 1) * progress_per_preset_generate)
-            update_progress(min(current_progress, 75))
-            continue
+            }
+            report_output('generate', generate_result)
+            return generate_result, None
         
         # Upload generated image to Supabase
-        filename = generate_uuid_filename()
-        uploaded_url = upload_image_to_supabase(generated_image_bytes, filename)
-        
-        # Store generated image URL for enhance step (keyed by preset_id)
-        generated_image_urls_by_preset[preset_id] = uploaded_url
-        
-        # Store result info for intermediate outputs
-        generate_results.append({
+        generated_url = upload_output_image(generated_image_bytes)
+        image_store.put(generated_url, generated_image_bytes)
+        generate_result = {
             'preset_id': preset_id,
-            'preset_name': preset_detail['name'],
-            'output_url': uploaded_url
-        })
-        
-        # Update progress
-        current_progress = 25 + int((i + 1) * progress_per_preset_generate)
-        update_progress(min(current_progress, 75))
-    
-    update_progress(75)
-    
-    # Stage 3: Enhance (75% -> 100%)
-    # Calculate progress increment per preset for enhancement
-    # Only count presets that successfully generated
-    num_successful_generates = len(generated_image_urls_by_preset)
-    if num_successful_generates == 0:
-        raise Exception("No images were successfully generated")
-    
-    progress_per_preset_enhance = 25 / num_successful_generates  # 25% total for enhancement stage (75% -> 100%)
-    
-    final_images = []
-    enhance_results = []
-    enhance_progress_count = 0
-    
-    # Process each preset that successfully generated
-    for preset_detail in preset_details:
-        preset_id = preset_detail['preset_id']
-        
-        # Skip if generation failed for this preset
-        if preset_id not in generated_image_urls_by_preset:
-            continue
-        
-        generated_url = generated_image_urls_by_preset[preset_id]
+            'preset_name': preset_name,
+            'output_url': generated_url
+        }
+        progress.stage_done(preset_id, 'generate')
+        report_output('generate', generate_result)
         
         # Enhance the generated image
-        enhanced_image_bytes = enhance(
-            generated_image_url=generated_url,
-            clothing_type=clothing_type
-        )
+        with metrics.timed(metrics.PIPELINE_STAGE_SECONDS, stage='enhance') as observation:
+            enhanced_image_bytes = enhance(
+                generated_image_url=generated_url,
+                clothing_type=clothing_type,
+                image_store=image_store
+            )
+            if enhanced_image_bytes is None:
+                observation['outcome'] = 'failed'
         
-        # If enhancement failed (returns None), skip this preset
+        # If enhancement failed (returns None), still record the failure
         if enhanced_image_bytes is None:
-            # Still record the failure in enhance_results
-            enhance_results.append({
+            progress.stage_done(preset_id, 'enhance')
+            enhance_result = {
                 'preset_id': preset_id,
-                'preset_name': preset_detail['name'],
+                'preset_name': preset_name,
                 'output_url': None,
                 'error': 'Enhancement failed after retries'
-            })
-            enhance_progress_count += 1
-            current_progress = 75 + int(enhance_progress_count * progress_per_preset_enhance)
-            update_progress(min(current_progress, 100))
-            continue
+            }
+            report_output('enhance', enhance_result)
+            return generate_result, enhance_result
         
         # Upload enhanced image to Supabase
-        filename = generate_uuid_filename()
-        uploaded_url = upload_image_to_supabase(enhanced_image_bytes, filename)
+        enhanced_url = upload_output_image(enhanced_image_bytes)
+        enhance_result = {
+            'preset_id': preset_id,
+            'preset_name': preset_name,
+            'output_url': enhanced_url
+        }
+        progress.stage_done(preset_id, 'enhance')
+        report_output('enhance', enhance_result)
         
-        # Create Image object for final output
-        final_image = Image(url=uploaded_url)
-        final_images.append(final_image)
+        if cache_key is not None:
+            preset_result_cache.set(cache_key, {'generate_url': generated_url, 'enhance_url': enhanced_url})
         
-        # Store result info
-        enhance_results.append({
-            'preset_id': preset_id,
-            'preset_name': preset_detail['name'],
-            'output_url': uploaded_url
-        })
+        return generate_result, enhance_result
+    
+    # Process all presets concurrently, bounded per run by max_concurrency and
+    # per process by the Gemini request slots in gemini_client_manager
+    fan_out = max(1, min(max_concurrency or GENERATE_MAX_CONCURRENCY_PER_RUN, num_presets))
+    
+    # Use dicts keyed by preset_id for safer data passing
+    generate_results_by_preset = {}
+    enhance_results_by_preset = {}
+    
+    with ThreadPoolExecutor(max_workers=fan_out) as executor:
+        futures = [executor.submit(process_preset, preset_detail) for preset_detail in preset_details]
         
-        # Update progress
-        enhance_progress_count += 1
-        current_progress = 75 + int(enhance_progress_count * progress_per_preset_enhance)
-        update_progress(min(current_progress, 100))
+        for future in as_completed(futures):
+            generate_result, enhance_result = future.result()
+            preset_id = generate_result['preset_id']
+            generate_results_by_preset[preset_id] = generate_result
+            if enhance_result is not None:
+                enhance_results_by_preset[preset_id] = enhance_result
+    
+    # Only presets that successfully generated reach the enhance stage
+    if len(enhance_results_by_preset) == 0:
+        raise Exception("No images were successfully generated")
+    
+    # Keep intermediate and final outputs in the requested preset order
+    generate_results = []
+    enhance_results = []
+    final_images = []
+    for preset_detail in preset_details:
+        preset_id = preset_detail['preset_id']
+        generate_results.append(generate_results_by_preset[preset_id])
+        
+        enhance_result = enhance_results_by_preset.get(preset_id)
+        if enhance_result is None:
+            continue
+        enhance_results.append(enhance_result)
+        if enhance_result['output_url']:
+            final_images.append(Image(url=enhance_result['output_url']))
     
-    update_progress(100)
+    progress.finish()
     
     intermediate_outputs = {
         'step_analyze': analysis_result,
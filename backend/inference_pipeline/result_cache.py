@@ -0,0 +1,61 @@
+"""
+Per-preset result memoization for the inference pipeline.
+
+A preset's generate + enhance outputs are stored under a key built from everything
+that determines them: the content hashes of the person and clothing images, the
+preset (ID, reference image, description), the full generate and enhance prompts
+(which cover the prompt templates and the analysis results), the Gemini model name,
+the input preparation settings (see input_prep.py) and RESULT_CACHE_VERSION. A run
+asking for the same combination again gets the stored output URLs back instead of
+calling Gemini.
+
+Eviction: entries expire after RESULT_CACHE_TTL_SECONDS and the disk tier keeps at
+most RESULT_CACHE_MAX_ENTRIES (least recently used go first). A TTL of 0 disables it.
+"""
+import hashlib
+import json
+import os
+from ai_api_utils.gemini import GEMINI_IMAGE_MODEL
+from persistent_cache import PersistentCache
+from .input_prep import GEMINI_INPUT_FORMAT, GEMINI_INPUT_JPEG_QUALITY, GEMINI_INPUT_MAX_EDGE
+from .prompts import get_enhance_prompt
+from .step_generate import build_prompt
+
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 86400)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000'))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv('RESULT_CACHE_MEMORY_ENTRIES', '500'))
+
+# Bump when generation settings outside the prompts change (image size, aspect ratio, ...)
+RESULT_CACHE_VERSION = '1'
+
+preset_result_cache = PersistentCache('preset_results', RESULT_CACHE_TTL_SECONDS,
+                                      memory_entries=RESULT_CACHE_MEMORY_ENTRIES,
+                                      max_entries=RESULT_CACHE_MAX_ENTRIES)
+
+
+def preset_result_key(person_hash, clothing_hash, preset_detail, garment_description, clothing_type):
+    """
+    Build the memoization key for one preset of a run.
+
+    Args:
+        person_hash: Content hash of the person image
+        clothing_hash: Content hash of the clothing image
+        preset_detail: Dict with 'preset_id', 'ref_image_full' and 'description'
+        garment_description: Dict from the analyze step
+        clothing_type: String from the analyze step
+
+    Returns:
+        str: Hex digest identifying the preset's outputs
+    """
+    key_parts = {
+        'version': RESULT_CACHE_VERSION,
+        'model': GEMINI_IMAGE_MODEL,
+        'input_prep': [GEMINI_INPUT_MAX_EDGE, GEMINI_INPUT_FORMAT, GEMINI_INPUT_JPEG_QUALITY],
+        'person': person_hash,
+        'clothing': clothing_hash,
+        'preset_id': preset_detail['preset_id'],
+        'ref_image': preset_detail['ref_image_full'],
+        'generate_prompt': build_prompt(garment_description, preset_detail['description']),
+        'enhance_prompt': get_enhance_prompt(clothing_type),
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
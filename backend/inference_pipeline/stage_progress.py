@@ -0,0 +1,87 @@
+"""
+Per-preset, per-stage progress accounting for a pipeline run.
+
+Analyze covers 0% -> 25%. The remaining 75% is split evenly across presets, and each
+preset's share is split between its stages by STAGE_WEIGHTS (generate 50, enhance 25),
+so presets moving through the pipeline independently still add up to a single,
+monotonically increasing percentage.
+"""
+import threading
+
+ANALYZE_WEIGHT = 25
+STAGE_WEIGHTS = {
+    'generate': 50,
+    'enhance': 25,
+}
+
+
+class StageProgress:
+    """
+    Tracks which stages each preset has finished and reports the overall percentage.
+    Safe to call from multiple worker threads. Each reported value is higher than the
+    last one computed, but the callback runs outside the lock, so two threads can
+    deliver theirs out of order; the progress tracker keeps the highest value it sees.
+    """
+
+    def __init__(self, preset_ids, progress_callback=None):
+        self._preset_ids = list(preset_ids)
+        self._callback = progress_callback
+        self._lock = threading.Lock()
+        self._analyze_done = False
+        self._done = {preset_id: set() for preset_id in self._preset_ids}
+        self._last_reported = None
+
+    def set_presets(self, preset_ids):
+        """Replace the preset set once analysis has resolved which presets will run."""
+        with self._lock:
+            self._preset_ids = list(preset_ids)
+            self._done = {preset_id: set() for preset_id in self._preset_ids}
+
+    def start(self):
+        self._report()
+
+    def analyze_done(self):
+        with self._lock:
+            self._analyze_done = True
+        self._report()
+
+    def stage_done(self, preset_id, stage):
+        """Mark a stage as finished for one preset."""
+        with self._lock:
+            self._done[preset_id].add(stage)
+        self._report()
+
+    def skip_remaining(self, preset_id):
+        """Count all remaining stages of a preset as done (e.g. after a failed generation)."""
+        with self._lock:
+            self._done[preset_id].update(STAGE_WEIGHTS.keys())
+        self._report()
+
+    def finish(self):
+        with self._lock:
+            self._analyze_done = True
+            for stages in self._done.values():
+                stages.update(STAGE_WEIGHTS.keys())
+        self._report(force=100)
+
+    def percent(self):
+        with self._lock:
+            return self._percent_locked()
+
+    def _percent_locked(self):
+        progress = ANALYZE_WEIGHT if self._analyze_done else 0
+        if self._preset_ids:
+            per_preset = 1 / len(self._preset_ids)
+            for stages in self._done.values():
+                progress += sum(STAGE_WEIGHTS[stage] for stage in stages) * per_preset
+        return min(100, int(progress))
+
+    def _report(self, force=None):
+        with self._lock:
+            progress = force if force is not None else self._percent_locked()
+            if self._last_reported is not None and progress <= self._last_reported:
+                return
+            self._last_reported = progress
+        # Not under the lock: the callback writes to SQLite and Supabase
+        if self._callback:
+            self._callback(progress)
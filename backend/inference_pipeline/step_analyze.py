@@ -1,38 +1,46 @@
+import os
 import json
-from ai_api_utils.openai_api import vision_completion
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ai_api_utils.openai_api import vision_completion, multi_image_completion, GPT4O_MINI_VERSION
+from cache_utils import TTLCache
+from persistent_cache import PersistentCache
 from db_utils import supabase
+import preset_catalog
+from .image_store import RunImageStore
 
+PRESET_DETAILS_CACHE_TTL_SECONDS = int(os.getenv('PRESET_DETAILS_CACHE_TTL_SECONDS', '600'))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(30 * 86400)))
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', '1000'))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '100000'))
+# 'separate': one vision call per image; 'combined': one call with both images
+# (falls back to 'separate' if the combined answer can't be parsed)
+ANALYZE_MODE = os.getenv('ANALYZE_MODE', 'separate')
 
-def detect_gender(person_image_url):
-    """
-    Detect if the person in the image is male or female.
-    Returns 'male' or 'female'.
-    """
-    system_prompt = "You are a gender detection assistant. You must respond with ONLY one word: either 'male' or 'female'. No explanation, no punctuation, no additional text."
-    prompt = "Look at this person. Is this person male or female? Answer with ONLY one word: 'male' or 'female'."
-    
-    result = vision_completion(person_image_url, prompt, system_prompt=system_prompt)
-    gender = result['choices'][0]['message']['content'].strip().lower()
-    
-    # Normalize response
-    if 'female' in gender or 'woman' in gender:
-        return 'female'
-    else:
-        return 'male'
+# presets_details rows keyed by preset_id; rows almost never change. POST /presets/refresh
+# drops them in every worker through the preset catalog's refresh version.
+_preset_details_cache = TTLCache('preset_details', PRESET_DETAILS_CACHE_TTL_SECONDS)
+_preset_details_version = None
+_preset_details_version_lock = threading.Lock()
 
+# Vision analysis results keyed by analysis kind, prompt version and image content hash.
+# The analyses run at temperature 0, so the same image and prompt give the same answer.
+_analysis_cache = PersistentCache('vision_analysis', ANALYSIS_CACHE_TTL_SECONDS,
+                                  memory_entries=ANALYSIS_CACHE_MEMORY_ENTRIES,
+                                  max_entries=ANALYSIS_CACHE_MAX_ENTRIES)
 
-def analyze_clothing(clothing_image_url):
-    """
-    Analyze clothing image to get type and style description.
-    Returns dict with 'type' and 'style' keys.
-    """
-    system_prompt = """You are a fashion analysis assistant. You analyze clothing images and return ONLY a JSON object with exactly two keys:
+GENDER_SYSTEM_PROMPT = "You are a gender detection assistant. You must respond with ONLY one word: either 'male' or 'female'. No explanation, no punctuation, no additional text."
+GENDER_PROMPT = "Look at this person. Is this person male or female? Answer with ONLY one word: 'male' or 'female'."
+GENDER_MAX_TOKENS = 500
+
+CLOTHING_SYSTEM_PROMPT = """You are a fashion analysis assistant. You analyze clothing images and return ONLY a JSON object with exactly two keys:
 - "type": the type of clothing in 1-3 words (e.g., "skirt", "blazer", "evening dress")
 - "style": a brief description of how the garment is worn (e.g., "worn from the waist down and ends at ankles")
 
 Return ONLY the JSON object, no other text, no markdown formatting, no code blocks."""
 
-    prompt = """Analyze this clothing item. Return a JSON object with:
+CLOTHING_PROMPT = """Analyze this clothing item. Return a JSON object with:
 1. "type": the type of clothing in 1-3 words
 2. "style": a brief description of how this garment is typically worn
 
@@ -40,30 +48,157 @@ Example response:
 {"type": "skirt", "style": "worn from the waist down and ends at ankles"}
 
 Return ONLY the JSON object, nothing else."""
+CLOTHING_MAX_TOKENS = 200
 
-    result = vision_completion(clothing_image_url, prompt, system_prompt=system_prompt, max_tokens=200)
-    response_text = result['choices'][0]['message']['content'].strip()
+COMBINED_SYSTEM_PROMPT = """You are a fashion analysis assistant. You are given two images: image 1 shows a person, image 2 shows a clothing item. Return ONLY a JSON object with exactly three keys:
+- "gender": the gender of the person in image 1, either "male" or "female"
+- "clothing_type": the type of clothing in image 2 in 1-3 words (e.g., "skirt", "blazer", "evening dress")
+- "clothing_style": a brief description of how the garment in image 2 is worn (e.g., "worn from the waist down and ends at ankles")
+
+Return ONLY the JSON object, no other text, no markdown formatting, no code blocks."""
+
+COMBINED_PROMPT = """Image 1 is a person, image 2 is a clothing item. Return a JSON object with:
+1. "gender": "male" or "female" for the person in image 1
+2. "clothing_type": the type of clothing in image 2 in 1-3 words
+3. "clothing_style": a brief description of how the clothing in image 2 is typically worn
+
+Example response:
+{"gender": "female", "clothing_type": "skirt", "clothing_style": "worn from the waist down and ends at ankles"}
+
+Return ONLY the JSON object, nothing else."""
+COMBINED_MAX_TOKENS = 250
+
+
+def prompt_version(*parts):
+    """Short hash of everything that determines a vision answer besides the image."""
+    return hashlib.sha256('\x00'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+GENDER_PROMPT_VERSION = prompt_version(GPT4O_MINI_VERSION, GENDER_SYSTEM_PROMPT, GENDER_PROMPT, GENDER_MAX_TOKENS)
+CLOTHING_PROMPT_VERSION = prompt_version(GPT4O_MINI_VERSION, CLOTHING_SYSTEM_PROMPT, CLOTHING_PROMPT,
+                                         CLOTHING_MAX_TOKENS)
+COMBINED_PROMPT_VERSION = prompt_version(GPT4O_MINI_VERSION, COMBINED_SYSTEM_PROMPT, COMBINED_PROMPT,
+                                         COMBINED_MAX_TOKENS)
+
+
+def parse_json_object(response_text):
+    """
+    Parse a JSON object from a model response, tolerating markdown code blocks and
+    text around the object.
     
-    # Try to parse JSON from response
+    Returns:
+        The parsed dict, or None if there is no valid JSON object
+    """
+    response_text = response_text.strip()
+    if not response_text.startswith('{'):
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        if start == -1 or end <= start:
+            return None
+        response_text = response_text[start:end]
     try:
-        # Handle potential markdown code blocks
-        if '```' in response_text:
-            # Extract JSON from code block
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            response_text = response_text[start:end]
-        
-        clothing_info = json.loads(response_text)
-        return {
-            'type': clothing_info.get('type', 'garment'),
-            'style': clothing_info.get('style', 'worn on the body')
-        }
+        parsed = json.loads(response_text)
     except json.JSONDecodeError:
-        # Fallback if JSON parsing fails
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def detect_gender(person_image_url, image_hash=None):
+    """
+    Detect if the person in the image is male or female.
+    Returns 'male' or 'female'.
+    
+    If image_hash (the image's content hash) is given, the answer is cached under it.
+    """
+    cache_key = f"gender:{GENDER_PROMPT_VERSION}:{image_hash}" if image_hash else None
+    if cache_key:
+        cached = _analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    result = vision_completion(person_image_url, GENDER_PROMPT, system_prompt=GENDER_SYSTEM_PROMPT,
+                               max_tokens=GENDER_MAX_TOKENS)
+    gender = result['choices'][0]['message']['content'].strip().lower()
+    
+    # Normalize response
+    if 'female' in gender or 'woman' in gender:
+        gender = 'female'
+    else:
+        gender = 'male'
+    
+    if cache_key:
+        _analysis_cache.set(cache_key, gender)
+    return gender
+
+
+def analyze_clothing(clothing_image_url, image_hash=None):
+    """
+    Analyze clothing image to get type and style description.
+    Returns dict with 'type' and 'style' keys.
+    
+    If image_hash (the image's content hash) is given, the answer is cached under it.
+    """
+    cache_key = f"clothing:{CLOTHING_PROMPT_VERSION}:{image_hash}" if image_hash else None
+    if cache_key:
+        cached = _analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    result = vision_completion(clothing_image_url, CLOTHING_PROMPT, system_prompt=CLOTHING_SYSTEM_PROMPT,
+                               max_tokens=CLOTHING_MAX_TOKENS)
+    clothing_info = parse_json_object(result['choices'][0]['message']['content'])
+    
+    if clothing_info is None:
+        # Fallback if JSON parsing fails (not cached, so the next run asks again)
         return {
             'type': 'garment',
             'style': 'worn on the body'
         }
+    
+    clothing_info = {
+        'type': clothing_info.get('type', 'garment'),
+        'style': clothing_info.get('style', 'worn on the body')
+    }
+    if cache_key:
+        _analysis_cache.set(cache_key, clothing_info)
+    return clothing_info
+
+
+def analyze_person_and_clothing(person_image_url, clothing_image_url, person_hash=None, clothing_hash=None):
+    """
+    Detect gender and analyze clothing with a single vision call on both images.
+    
+    If both content hashes are given, the answers are cached under them.
+    
+    Returns:
+        Tuple of (gender, clothing_info dict), or None if the answer couldn't be parsed
+    """
+    cache_keys = None
+    if person_hash and clothing_hash:
+        cache_keys = (f"gender:{COMBINED_PROMPT_VERSION}:{person_hash}",
+                      f"clothing:{COMBINED_PROMPT_VERSION}:{clothing_hash}")
+        gender, clothing_info = (_analysis_cache.get(key) for key in cache_keys)
+        if gender is not None and clothing_info is not None:
+            return gender, clothing_info
+    
+    result = multi_image_completion([person_image_url, clothing_image_url], COMBINED_PROMPT,
+                                    system_prompt=COMBINED_SYSTEM_PROMPT, max_tokens=COMBINED_MAX_TOKENS)
+    parsed = parse_json_object(result['choices'][0]['message']['content'])
+    if parsed is None:
+        return None
+    
+    gender = str(parsed.get('gender', '')).strip().lower()
+    clothing_type = parsed.get('clothing_type')
+    clothing_style = parsed.get('clothing_style')
+    if gender not in ('male', 'female') or not isinstance(clothing_type, str) or not isinstance(clothing_style, str) \
+            or not clothing_type.strip() or not clothing_style.strip():
+        return None
+    
+    clothing_info = {'type': clothing_type.strip(), 'style': clothing_style.strip()}
+    if cache_keys:
+        _analysis_cache.set(cache_keys[0], gender)
+        _analysis_cache.set(cache_keys[1], clothing_info)
+    return gender, clothing_info
 
 
 def build_garment_description(clothing_info):
@@ -81,13 +216,65 @@ def build_garment_description(clothing_info):
     }
 
 
-def get_preset_details(preset_ids, is_male):
+def fetch_preset_detail_rows(preset_ids):
     """
-    Query presets and presets_details tables to get the reference images and descriptions
-    for the given preset IDs, filtered by gender.
+    Get the presets_details rows for the given preset IDs without filtering on gender,
+    so the rows can be fetched before gender detection has finished.
+    
+    Rows are served from an in-process cache; IDs that aren't cached are fetched
+    with a single batched query.
     
     Args:
         preset_ids: List of preset IDs (integers)
+        
+    Returns:
+        Dict mapping preset_id to the list of its presets_details rows (one per gender)
+    """
+    _check_preset_refresh()
+    rows_by_preset, missing_ids = _preset_details_cache.get_many(preset_ids)
+    
+    if missing_ids:
+        response = supabase.table('presets_details').select(
+            'id, gender, ref_image_full, description, presets(id, name)'
+        ).in_('id', missing_ids).execute()
+        
+        # Unknown IDs are cached as empty too, so they don't hit the DB on every run
+        fetched = {preset_id: [] for preset_id in missing_ids}
+        for row in response.data or []:
+            fetched.setdefault(row['id'], []).append(row)
+        
+        _preset_details_cache.set_many(fetched)
+        rows_by_preset.update(fetched)
+    
+    return rows_by_preset
+
+
+def invalidate_preset_details_cache(preset_ids=None):
+    """Drop cached presets_details rows for the given preset IDs, or all of them if None."""
+    _preset_details_cache.invalidate(preset_ids)
+
+
+def _check_preset_refresh():
+    """Drop every cached presets_details row if the presets were refreshed since they were fetched."""
+    global _preset_details_version
+    try:
+        version = preset_catalog.refresh_version()
+    except Exception as e:
+        print(f"Error reading preset refresh version: {e}")
+        return
+    with _preset_details_version_lock:
+        if version != _preset_details_version:
+            invalidate_preset_details_cache()
+            _preset_details_version = version
+
+
+def select_preset_details(rows_by_preset, preset_ids, is_male):
+    """
+    Pick the presets_details row matching the model's gender for each preset ID.
+    
+    Args:
+        rows_by_preset: Dict from fetch_preset_detail_rows
+        preset_ids: List of preset IDs (integers), in the order results should be returned
         is_male: Boolean - True if the model is male
         
     Returns:
@@ -99,52 +286,103 @@ def get_preset_details(preset_ids, is_male):
     gender_filter = not is_male  # male -> false, female -> true
     
     for preset_id in preset_ids:
-        # Query presets_details filtered by preset_id and gender
-        response = supabase.table('presets_details').select(
-            'id, ref_image_full, description, presets(id, name)'
-        ).eq('id', preset_id).eq('gender', gender_filter).execute()
-        
-        if response.data and len(response.data) > 0:
-            detail = response.data[0]
+        for detail in rows_by_preset.get(preset_id, []):
+            if detail.get('gender') != gender_filter:
+                continue
             results.append({
                 'preset_id': preset_id,
-                'name': detail.get('presets', {}).get('name', ''),
+                'name': (detail.get('presets') or {}).get('name', ''),
                 'ref_image_full': detail.get('ref_image_full', ''),
                 'description': detail.get('description', '')
             })
+            break
     
     return results
 
 
-def analyze(person_image_url, clothing_image_url, preset_ids):
+def get_preset_details(preset_ids, is_male):
+    """
+    Query presets and presets_details tables to get the reference images and descriptions
+    for the given preset IDs, filtered by gender.
+    
+    Args:
+        preset_ids: List of preset IDs (integers)
+        is_male: Boolean - True if the model is male
+        
+    Returns:
+        List of dicts with 'preset_id', 'name', 'ref_image_full', 'description'
+    """
+    return select_preset_details(fetch_preset_detail_rows(preset_ids), preset_ids, is_male)
+
+
+def analyze(person_image_url, clothing_image_url, preset_ids, image_store=None):
     """
     Analyze step of the inference pipeline.
     
+    Gender detection, clothing analysis and the preset lookup don't depend on each
+    other, so they run at the same time:
     1. Detect gender from person image
     2. Analyze clothing to get type and style
-    3. Build garment description
-    4. Query preset details based on gender
+    3. Prefetch preset details for both genders
+    Then the garment description is built and the preset details are filtered by gender.
+    
+    Gender and clothing answers are cached by image content hash and prompt version,
+    so a garment or model seen before skips its vision call. With ANALYZE_MODE=combined,
+    gender and clothing come from one vision call on both images; if that answer can't
+    be parsed, the two separate calls are made instead.
     
     Args:
         person_image_url: URL of the person/model image
         clothing_image_url: URL of the clothing image
         preset_ids: List of preset IDs (integers)
+        image_store: Optional RunImageStore holding the run's images (used for hashing)
         
     Returns:
         Dict with analysis results including garment_description and preset_details
     """
-    # Step 1: Detect gender
-    gender = detect_gender(person_image_url)
-    is_male = (gender == 'male')
+    if image_store is None:
+        image_store = RunImageStore()
+    
+    def detect_gender_cached():
+        return detect_gender(person_image_url, image_hash=image_store.content_hash(person_image_url))
     
-    # Step 2: Analyze clothing
-    clothing_info = analyze_clothing(clothing_image_url)
+    def analyze_clothing_cached():
+        return analyze_clothing(clothing_image_url, image_hash=image_store.content_hash(clothing_image_url))
+    
+    def analyze_combined_cached():
+        return analyze_person_and_clothing(person_image_url, clothing_image_url,
+                                           person_hash=image_store.content_hash(person_image_url),
+                                           clothing_hash=image_store.content_hash(clothing_image_url))
+    
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        preset_rows_future = executor.submit(fetch_preset_detail_rows, preset_ids)
+        
+        combined = None
+        if ANALYZE_MODE == 'combined':
+            try:
+                combined = analyze_combined_cached()
+                if combined is None:
+                    print("Combined analysis answer unusable, falling back to separate calls")
+            except Exception as e:
+                print(f"Combined analysis failed, falling back to separate calls: {e}")
+        
+        if combined is not None:
+            gender, clothing_info = combined
+        else:
+            gender_future = executor.submit(detect_gender_cached)
+            clothing_future = executor.submit(analyze_clothing_cached)
+            gender = gender_future.result()
+            clothing_info = clothing_future.result()
+        
+        preset_rows = preset_rows_future.result()
+    
+    is_male = (gender == 'male')
     
-    # Step 3: Build garment description
+    # Build garment description
     garment_description = build_garment_description(clothing_info)
     
-    # Step 4: Get preset details filtered by gender
-    preset_details = get_preset_details(preset_ids, is_male)
+    # Keep only the preset details matching the detected gender
+    preset_details = select_preset_details(preset_rows, preset_ids, is_male)
     
     return {
         'gender': gender,
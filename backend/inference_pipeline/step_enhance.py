@@ -1,63 +1,50 @@
-import os
-import json
-import tempfile
-import requests
-from io import BytesIO
-from PIL import Image as PILImage
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from ai_api_utils.gemini import gemini_client_manager, extract_image_bytes, GEMINI_IMAGE_MODEL
 from .prompts import get_enhance_prompt
+from .image_store import RunImageStore
+from .step_generate import original_image_part
 
 load_dotenv()
 
 
-def download_image_to_pil(url):
-    """
-    Download an image from URL and return as PIL Image object.
-    """
-    response = requests.get(url, timeout=60)
-    response.raise_for_status()
-    return PILImage.open(BytesIO(response.content))
-
-
-def enhance_image(image_url, clothing_type, max_retries=3):
+def enhance_image(image_url, clothing_type, max_retries=3, image_store=None):
     """
     Enhance an image using Gemini's image generation to harmonize the clothing.
     
     Uses the same SDK pattern as generate:
-    - Download image and open with PIL Image.open()
+    - Get the image from the run's image store (the generated bytes, not a re-download),
+      unchanged
     - Pass image and prompt to generate_content
-    - Handle response parts properly
+    - Take the image bytes from the response parts in memory
     - Retries up to max_retries times if response is None or has no parts
     
     Args:
         image_url: URL of the generated image to enhance
         clothing_type: String describing the clothing type (e.g., "skirt", "dress")
         max_retries: Maximum number of retry attempts (default: 3)
+        image_store: Optional RunImageStore shared across the run
         
     Returns:
         bytes: The enhanced image data, or None if all retries fail
     """
-    api_key = os.environ.get("GOOGLE_AI_STUDIO_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_AI_STUDIO_API_KEY not found in environment")
+    # Shared client (raises ValueError if GOOGLE_AI_STUDIO_API_KEY is missing)
+    gemini_client_manager.get_client()
     
     # Build the enhance prompt
     prompt_text = get_enhance_prompt(clothing_type)
     
-    # Download image and open with PIL
-    image = download_image_to_pil(image_url)
-    
-    # Initialize client
-    client = genai.Client(api_key=api_key)
+    # Send the generated image at full resolution in its original encoding, reusing
+    # the bytes the run already has (downscaling it would undo what enhance improves)
+    image_store = image_store or RunImageStore()
+    image = original_image_part(image_store, image_url)
     
     # Retry logic
     for attempt in range(max_retries):
         try:
             # Use the same pattern as generate - prompt first, then image
-            response = client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            response = gemini_client_manager.generate_content(
+                model=GEMINI_IMAGE_MODEL,
                 contents=[
                     prompt_text,
                     image,
@@ -71,44 +58,15 @@ def enhance_image(image_url, clothing_type, max_retries=3):
                 )
             )
             
-            # Check if response or response.parts is None
-            if response is None or response.parts is None:
-                if attempt < max_retries - 1:
-                    continue  # Retry
-                else:
-                    return None  # All retries exhausted
-            
-            # Extract the generated image from response
-            enhanced_image = None
-            for part in response.parts:
-                if part.text is not None:
-                    # Text response (if any)
-                    continue
-                elif image := part.as_image():
-                    enhanced_image = image
-                    break
+            # Take the image bytes straight from the response (no temp file, no decode)
+            image_bytes = extract_image_bytes(response)
             
-            if not enhanced_image:
+            if image_bytes is None:
                 if attempt < max_retries - 1:
                     continue  # Retry
                 else:
                     return None  # All retries exhausted
             
-            # part.as_image() returns a google.genai.types.Image object
-            # Its save() method only accepts a file path (string), not a file-like object
-            # So we save to a temporary file and read it back
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-            
-            enhanced_image.save(tmp_path)
-            
-            # Read the file back as bytes
-            with open(tmp_path, 'rb') as f:
-                image_bytes = f.read()
-            
-            # Clean up temp file
-            os.unlink(tmp_path)
-            
             return image_bytes
             
         except Exception as e:
@@ -123,19 +81,21 @@ def enhance_image(image_url, clothing_type, max_retries=3):
     return None
 
 
-def enhance(generated_image_url, clothing_type):
+def enhance(generated_image_url, clothing_type, image_store=None):
     """
     Main enhance function for a single generated image.
     
     Args:
         generated_image_url: URL of the generated image from step_generate
         clothing_type: String describing the clothing type from step_analyze
+        image_store: Optional RunImageStore shared across the run
         
     Returns:
         bytes: The enhanced image data, or None if enhancement fails after retries
     """
     return enhance_image(
         image_url=generated_image_url,
-        clothing_type=clothing_type
+        clothing_type=clothing_type,
+        image_store=image_store
     )
 
@@ -1,13 +1,9 @@
-import os
 import json
-import tempfile
-import requests
-from io import BytesIO
-from PIL import Image as PILImage
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from ai_api_utils.gemini import gemini_client_manager, extract_image_bytes, GEMINI_IMAGE_MODEL
 from .prompts import GENERATE_PROMPT
+from .image_store import RunImageStore
 
 load_dotenv()
 
@@ -35,24 +31,27 @@ def build_prompt(garment_description, ref_img_description):
     return prompt
 
 
-def download_image_to_pil(url):
-    """
-    Download an image from URL and return as PIL Image object.
-    This is what Image.open() expects - a file-like object or path.
-    """
-    response = requests.get(url, timeout=60)
-    response.raise_for_status()
-    return PILImage.open(BytesIO(response.content))
+def prepared_image_part(image_store, image_url):
+    """Wrap the run's prepared version of a user input image as a request part (no re-encoding by the SDK)."""
+    image_bytes, mime_type = image_store.get_prepared(image_url)
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+
+def original_image_part(image_store, image_url):
+    """Wrap an image as a request part at full resolution in its original encoding."""
+    image_bytes, mime_type = image_store.get_original(image_url)
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
 
 
-def generate_image(model_image_url, clothing_image_url, ref_image_url, garment_description, ref_img_description, max_retries=3):
+def generate_image(model_image_url, clothing_image_url, ref_image_url, garment_description, ref_img_description, max_retries=3, image_store=None):
     """
     Generate an image using Gemini's image generation SDK.
     
-    Uses the exact pattern from gemini_guide.txt:
-    - Download images and open with PIL Image.open()
-    - Pass images directly to generate_content
-    - Handle response parts properly
+    Uses the pattern from gemini_guide.txt:
+    - Get images from the run's image store (person and clothing prepared for the
+      request, see input_prep.py; the reference image as stored)
+    - Pass the prompt and images to generate_content
+    - Take the image bytes from the response parts in memory
     - Retries up to max_retries times if response is None or has no parts
     
     Args:
@@ -62,32 +61,31 @@ def generate_image(model_image_url, clothing_image_url, ref_image_url, garment_d
         garment_description: Dict with garment description
         ref_img_description: String description of the reference image
         max_retries: Maximum number of retry attempts (default: 3)
+        image_store: Optional RunImageStore shared across the run
         
     Returns:
         bytes: The generated image data, or None if all retries fail
     """
-    api_key = os.environ.get("GOOGLE_AI_STUDIO_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_AI_STUDIO_API_KEY not found in environment")
+    # Shared client (raises ValueError if GOOGLE_AI_STUDIO_API_KEY is missing)
+    gemini_client_manager.get_client()
     
     # Build the prompt
     prompt_text = build_prompt(garment_description, ref_img_description)
     
-    # Download images and open with PIL (as shown in gemini_guide.txt)
-    model_image = download_image_to_pil(model_image_url)
-    clothing_image = download_image_to_pil(clothing_image_url)
-    ref_image = download_image_to_pil(ref_image_url)
-    
-    # Initialize client
-    client = genai.Client(api_key=api_key)
+    # The user's photos are oriented, downscaled and encoded for the request (see
+    # input_prep.py) once per run; the curated reference image is sent as stored
+    image_store = image_store or RunImageStore()
+    model_image = prepared_image_part(image_store, model_image_url)
+    clothing_image = prepared_image_part(image_store, clothing_image_url)
+    ref_image = original_image_part(image_store, ref_image_url)
     
     # Retry logic
     for attempt in range(max_retries):
         try:
             # Use the exact pattern from gemini_guide.txt
             # Order: prompt text, then images in order (image_1, image_2, image_3)
-            response = client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            response = gemini_client_manager.generate_content(
+                model=GEMINI_IMAGE_MODEL,
                 contents=[
                     prompt_text,
                     model_image,      # image_1
@@ -103,44 +101,15 @@ def generate_image(model_image_url, clothing_image_url, ref_image_url, garment_d
                 )
             )
             
-            # Check if response or response.parts is None
-            if response is None or response.parts is None:
-                if attempt < max_retries - 1:
-                    continue  # Retry
-                else:
-                    return None  # All retries exhausted
-            
-            # Extract the generated image from response (as shown in gemini_guide.txt)
-            generated_image = None
-            for part in response.parts:
-                if part.text is not None:
-                    # Text response (if any)
-                    continue
-                elif image := part.as_image():
-                    generated_image = image
-                    break
+            # Take the image bytes straight from the response (no temp file, no decode)
+            image_bytes = extract_image_bytes(response)
             
-            if not generated_image:
+            if image_bytes is None:
                 if attempt < max_retries - 1:
                     continue  # Retry
                 else:
                     return None  # All retries exhausted
             
-            # part.as_image() returns a google.genai.types.Image object
-            # Its save() method only accepts a file path (string), not a file-like object
-            # So we save to a temporary file and read it back
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-            
-            generated_image.save(tmp_path)
-            
-            # Read the file back as bytes
-            with open(tmp_path, 'rb') as f:
-                image_bytes = f.read()
-            
-            # Clean up temp file
-            os.unlink(tmp_path)
-            
             return image_bytes
             
         except Exception as e:
@@ -155,7 +124,7 @@ def generate_image(model_image_url, clothing_image_url, ref_image_url, garment_d
     return None
 
 
-def generate(model_image_url, clothing_image_url, preset_detail, garment_description):
+def generate(model_image_url, clothing_image_url, preset_detail, garment_description, image_store=None):
     """
     Main generate function for a single preset.
     
@@ -164,6 +133,7 @@ def generate(model_image_url, clothing_image_url, preset_detail, garment_descrip
         clothing_image_url: URL of the clothing image
         preset_detail: Dict with 'ref_image_full' and 'description' keys
         garment_description: Dict with garment description
+        image_store: Optional RunImageStore shared across the run
         
     Returns:
         bytes: The generated image data, or None if generation fails after retries
@@ -176,5 +146,6 @@ def generate(model_image_url, clothing_image_url, preset_detail, garment_descrip
         clothing_image_url=clothing_image_url,
         ref_image_url=ref_image_url,
         garment_description=garment_description,
-        ref_img_description=ref_img_description
+        ref_img_description=ref_img_description,
+        image_store=image_store
     )
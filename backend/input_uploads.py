@@ -0,0 +1,284 @@
+"""
+Input Uploads Module
+Background uploads of a run's input images, off the /generate_request critical path.
+
+generate_request spools each uploaded file to INPUT_SPOOL_DIR as received and returns;
+normalizing and uploading to Supabase storage happen in parallel on a per-process
+thread pool. Upload state lives in a node-local SQLite table (see sqlite_utils.py), so
+the job worker that runs the pipeline - possibly in another Gunicorn process, or after
+a restart - can wait for the upload, or do it itself from the spool file if the
+process that started it is gone. Uploads are content-addressed (see image_dedup.py).
+Once all of a run's inputs are uploaded, the run's inputs in Supabase are filled in.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image as PILImage
+from db_utils import update_run_input_images
+from general_utils import generate_uuid_filename
+from image_dedup import upload_image_deduplicated
+from models.image import Image
+from sqlite_utils import get_connection, pid_alive
+
+INPUT_SPOOL_DIR = os.getenv('INPUT_SPOOL_DIR', os.path.join('uploads', 'spool'))
+INPUT_UPLOAD_MAX_WORKERS = int(os.getenv('INPUT_UPLOAD_MAX_WORKERS', '4'))
+INPUT_UPLOAD_WAIT_SECONDS = float(os.getenv('INPUT_UPLOAD_WAIT_SECONDS', '120'))
+INPUT_SPOOL_RETENTION_SECONDS = int(os.getenv('INPUT_SPOOL_RETENTION_SECONDS', '86400'))
+
+_DB_NAME = 'input_uploads'
+_POLL_INTERVAL_SECONDS = 0.2
+_PRUNE_EVERY = 100
+
+
+class InputUploads:
+    """Spools input images and uploads them to Supabase storage in the background."""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._schema_ready = False
+        self._executor = None
+        self._executor_pid = None
+        self._futures = {}
+        self._submit_count = 0
+
+    def _conn(self):
+        conn = get_connection(_DB_NAME)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    spool_path TEXT PRIMARY KEY,
+                    run_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    owner_pid INTEGER,
+                    url TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS uploads_run_id ON uploads (run_id)')
+            self._schema_ready = True
+        return conn
+
+    def _get_executor(self):
+        # Created lazily so a forked process never inherits another process's pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=INPUT_UPLOAD_MAX_WORKERS,
+                                                    thread_name_prefix='input-upload')
+                self._executor_pid = os.getpid()
+                self._futures = {}
+            return self._executor
+
+    def spool(self, image_file) -> str:
+        """
+        Save an uploaded file to INPUT_SPOOL_DIR as received (no decoding).
+
+        Args:
+            image_file: A file-like object (e.g. a Werkzeug FileStorage)
+
+        Returns:
+            str: Path of the spool file
+
+        Raises:
+            Exception: If the file isn't a readable image
+        """
+        image_data = image_file.read()
+        try:
+            # Only parses the header; the full decode happens in the background
+            PILImage.open(BytesIO(image_data))
+        except Exception as e:
+            raise Exception(f"Not a valid image: {str(e)}")
+
+        os.makedirs(INPUT_SPOOL_DIR, exist_ok=True)
+        spool_path = os.path.join(INPUT_SPOOL_DIR, generate_uuid_filename('upload'))
+        with open(spool_path, 'wb') as f:
+            f.write(image_data)
+        return spool_path
+
+    def submit(self, run_id: str, role: str, spool_path: str) -> None:
+        """
+        Start uploading a spooled input image for a run in the background.
+
+        Args:
+            run_id: Run the image belongs to
+            role: Key of the image in the run's inputs ('model' or 'clothing')
+            spool_path: Path returned by spool()
+        """
+        self._conn().execute(
+            "INSERT INTO uploads (spool_path, run_id, role, status, owner_pid, created_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?)",
+            (spool_path, str(run_id), role, os.getpid(), time.time())
+        )
+        executor = self._get_executor()
+        self._futures[spool_path] = executor.submit(self._upload, spool_path)
+
+        self._submit_count += 1
+        if self._submit_count % _PRUNE_EVERY == 0:
+            self.prune()
+
+    def _upload(self, spool_path: str) -> str:
+        """
+        Normalize and upload the spooled image (deduplicated) and record its URL. Returns the URL.
+        If the upload was discarded meanwhile, only the stored image remains; the run is not updated.
+        """
+        conn = self._conn()
+        tmp_path = f"{spool_path}.tmp"
+        try:
+            with open(spool_path, 'rb') as f:
+                url, image_bytes = upload_image_deduplicated(f.read())
+
+            if image_bytes is not None:
+                with open(tmp_path, 'wb') as f:
+                    f.write(image_bytes)
+
+            # Swap the spool file in the same transaction that marks the upload done, so
+            # a concurrent discard() either sees it done or deletes the row first
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                recorded = conn.execute(
+                    "UPDATE uploads SET status = 'done', url = ? WHERE spool_path = ? AND status = 'pending'",
+                    (url, spool_path)
+                ).rowcount > 0
+                if recorded and image_bytes is not None:
+                    # Keep the normalized bytes so the pipeline can use them without downloading
+                    os.replace(tmp_path, spool_path)
+                elif recorded:
+                    # Recognized without decoding: the spool holds the raw upload, which the
+                    # pipeline must not use, so it downloads the stored image instead
+                    os.remove(spool_path)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            conn.execute("UPDATE uploads SET status = 'failed', error = ? WHERE spool_path = ?",
+                         (str(e), spool_path))
+            raise
+
+        if not recorded:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return url
+
+        self._fill_run_inputs(spool_path)
+        return url
+
+    def _fill_run_inputs(self, spool_path: str) -> None:
+        """Write the run's input URLs to Supabase once all of its uploads are done."""
+        conn = self._conn()
+        run_id = conn.execute('SELECT run_id FROM uploads WHERE spool_path = ?', (spool_path,)).fetchone()[0]
+        rows = conn.execute('SELECT role, status, url FROM uploads WHERE run_id = ?', (run_id,)).fetchall()
+        if any(row['status'] != 'done' for row in rows):
+            return
+
+        urls = {row['role']: row['url'] for row in rows}
+        try:
+            update_run_input_images(int(run_id), model_url=urls.get('model'), clothing_url=urls.get('clothing'))
+        except Exception as e:
+            print(f"Error updating inputs for run {run_id}: {e}")
+
+    def _claim(self, spool_path: str) -> bool:
+        """Take over a pending upload whose owning process is gone. Returns True if claimed."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT status, owner_pid FROM uploads WHERE spool_path = ?',
+                               (spool_path,)).fetchone()
+            claimed = (row is not None and row['status'] == 'pending'
+                       and not pid_alive(row['owner_pid']))
+            if claimed:
+                conn.execute('UPDATE uploads SET owner_pid = ? WHERE spool_path = ?', (os.getpid(), spool_path))
+            conn.execute('COMMIT')
+            return claimed
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def resolve(self, spool_path: str, timeout: float = INPUT_UPLOAD_WAIT_SECONDS) -> Image:
+        """
+        Wait for a spooled input image's upload and return it as an Image whose data
+        holds the normalized bytes (None if the upload was deduplicated before decoding).
+        If the uploading process is gone, uploads it here.
+
+        Raises:
+            Exception: If the upload failed or didn't finish within timeout
+        """
+        future = self._futures.get(spool_path) if self._executor_pid == os.getpid() else None
+        if future is not None:
+            try:
+                url = future.result(timeout=timeout)
+            except Exception as e:
+                raise Exception(f"Failed to upload input image: {str(e)}")
+        else:
+            url = self._wait_for_upload(spool_path, timeout)
+
+        image = Image(url=url)
+        if os.path.exists(spool_path):
+            with open(spool_path, 'rb') as f:
+                image.data = f.read()
+        return image
+
+    def _wait_for_upload(self, spool_path: str, timeout: float) -> str:
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._conn().execute('SELECT status, url, error FROM uploads WHERE spool_path = ?',
+                                       (spool_path,)).fetchone()
+            if row is None:
+                raise Exception(f"Unknown input upload: {spool_path}")
+            if row['status'] == 'done':
+                return row['url']
+            if row['status'] == 'failed':
+                raise Exception(f"Failed to upload input image: {row['error']}")
+
+            if self._claim(spool_path):
+                print(f"Uploading {spool_path} left pending by a stopped process")
+                try:
+                    return self._upload(spool_path)
+                except Exception as e:
+                    raise Exception(f"Failed to upload input image: {str(e)}")
+
+            if time.monotonic() >= deadline:
+                raise Exception(f"Timed out waiting for input image upload after {timeout}s")
+            time.sleep(_POLL_INTERVAL_SECONDS)
+
+    def discard(self, spool_paths: list) -> None:
+        """
+        Delete spool files once a run no longer needs them. Uploads still pending are
+        cancelled: one that hasn't started never runs, and one in flight finishes
+        without writing its URL to the run.
+        """
+        for spool_path in spool_paths:
+            future = self._futures.pop(spool_path, None)
+            if future is not None:
+                future.cancel()
+            self._conn().execute('DELETE FROM uploads WHERE spool_path = ?', (spool_path,))
+            try:
+                os.remove(spool_path)
+            except FileNotFoundError:
+                pass
+
+    def prune(self, max_age_seconds: int = INPUT_SPOOL_RETENTION_SECONDS) -> None:
+        """Drop spool files and upload records older than max_age_seconds."""
+        conn = self._conn()
+        rows = conn.execute('SELECT spool_path FROM uploads WHERE created_at < ?',
+                            (time.time() - max_age_seconds,)).fetchall()
+        self.discard([row['spool_path'] for row in rows])
+
+
+# Global singleton instance
+input_uploads = InputUploads()
@@ -0,0 +1,327 @@
+"""
+Job Queue Module
+Bounded, durable queue for generation runs, replacing one daemon thread per request.
+
+Jobs are stored in a node-local SQLite table (see sqlite_utils.py), so every Gunicorn
+worker on the host shares one queue and queued work survives a restart. Each process
+runs JOB_QUEUE_WORKERS worker threads that claim jobs oldest-first; with 4 Gunicorn
+workers that is 4 * JOB_QUEUE_WORKERS runs in flight per host, whatever the burst size.
+
+Submissions are refused (HTTP 429 with Retry-After) once JOB_QUEUE_MAX_DEPTH jobs are
+waiting; enqueue() checks the depth and inserts in one transaction.
+
+A running job records the token of the process that claimed it (its PID plus a random
+ID, since PIDs get reused) and a heartbeat that the process refreshes every
+JOB_QUEUE_HEARTBEAT_SECONDS. Jobs whose heartbeat is older than
+JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS belong to a process that died or hung; they are put
+back in the queue, up to JOB_QUEUE_MAX_ATTEMPTS claims, after which they are handed to
+the abandon handler.
+
+Workers are started explicitly with start() (see start_background_workers in app.py),
+not when the module is imported.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from sqlite_utils import get_connection
+
+JOB_QUEUE_WORKERS = int(os.getenv('JOB_QUEUE_WORKERS', '2'))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv('JOB_QUEUE_MAX_DEPTH', '20'))
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', '2'))
+JOB_QUEUE_RETRY_AFTER_SECONDS = int(os.getenv('JOB_QUEUE_RETRY_AFTER_SECONDS', '30'))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv('JOB_QUEUE_POLL_INTERVAL', '1'))
+JOB_QUEUE_RETENTION_SECONDS = int(os.getenv('JOB_QUEUE_RETENTION_SECONDS', '86400'))
+JOB_QUEUE_HEARTBEAT_SECONDS = float(os.getenv('JOB_QUEUE_HEARTBEAT_SECONDS', '10'))
+JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv('JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS', '60'))
+
+_DB_NAME = 'job_queue'
+
+# How often idle workers look for jobs orphaned by dead processes
+_RECOVER_INTERVAL_SECONDS = 30
+
+# Window for the wait-time metrics in get_stats()
+_STATS_WINDOW_SECONDS = 3600
+
+
+class JobQueue:
+    """Host-wide job queue with a fixed pool of worker threads per process."""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._schema_ready = False
+        self._wakeup = threading.Event()
+        self._handler = None
+        self._abandon_handler = None
+        self._started_pid = None
+        self._owner = None
+        self._owner_pid = None
+        self._last_recover = 0.0
+
+    def _conn(self):
+        conn = get_connection(_DB_NAME)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    error TEXT,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)')
+            self._schema_ready = True
+        return conn
+
+    def _owner_token(self) -> str:
+        """Token identifying this process in the owner column (new after a fork)."""
+        if self._owner_pid != os.getpid():
+            self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+            self._owner_pid = os.getpid()
+        return self._owner
+
+    def start(self, handler: Callable[[dict], None],
+              abandon_handler: Optional[Callable[[dict, str], None]] = None) -> None:
+        """
+        Start this process's worker threads (once per process).
+
+        Args:
+            handler: Called with a job's payload dict; exceptions mark the job failed
+            abandon_handler: Called with (payload, error message) for jobs that were
+                orphaned by dead processes too many times
+        """
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._handler = handler
+            self._abandon_handler = abandon_handler
+
+        self.recover()
+
+        thread = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat')
+        thread.daemon = True
+        thread.start()
+
+        for i in range(JOB_QUEUE_WORKERS):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}")
+            thread.daemon = True
+            thread.start()
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be claimed."""
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def has_capacity(self) -> bool:
+        """Advisory check before accepting work; enqueue() makes the binding decision."""
+        return self.depth() < JOB_QUEUE_MAX_DEPTH
+
+    def enqueue(self, run_id: str, payload: dict) -> Optional[int]:
+        """
+        Add a job unless JOB_QUEUE_MAX_DEPTH jobs are already waiting.
+
+        Returns:
+            The job ID, or None if the queue is full
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            job_id = None
+            if depth < JOB_QUEUE_MAX_DEPTH:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (run_id, payload, status, enqueued_at) VALUES (?, ?, 'queued', ?)",
+                    (str(run_id), json.dumps(payload), time.time())
+                )
+                job_id = cursor.lastrowid
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if job_id is not None:
+            self._wakeup.set()
+        return job_id
+
+    def _claim(self):
+        """Atomically take the oldest queued job for this process. Returns the row or None."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, run_id, payload, attempts, enqueued_at FROM jobs "
+                "WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, started_at = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (self._owner_token(), now, now, row['id'])
+                )
+            conn.execute('COMMIT')
+            return row
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _finish(self, job_id: int, error: Optional[str] = None) -> None:
+        # Only while this process still owns it; a job requeued after a missed heartbeat
+        # may already be running elsewhere
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+            ('failed' if error else 'done', error, time.time(), job_id, self._owner_token())
+        )
+
+    def heartbeat(self) -> None:
+        """Mark the jobs this process is running as alive."""
+        self._conn().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+            (time.time(), self._owner_token())
+        )
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(JOB_QUEUE_HEARTBEAT_SECONDS)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Job queue heartbeat error: {e}")
+
+    def recover(self) -> None:
+        """
+        Requeue running jobs whose heartbeat is older than JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS
+        (their process died or hung), and hand jobs that have used up
+        JOB_QUEUE_MAX_ATTEMPTS to the abandon handler.
+        """
+        self._last_recover = time.monotonic()
+        conn = self._conn()
+        abandoned = []
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                "SELECT id, payload, attempts, owner FROM jobs "
+                "WHERE status = 'running' AND owner IS NOT ? AND COALESCE(heartbeat_at, 0) < ?",
+                (self._owner_token(), time.time() - JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS)
+            ).fetchall()
+            for row in rows:
+                if row['attempts'] >= JOB_QUEUE_MAX_ATTEMPTS:
+                    error = f"Job was interrupted {row['attempts']} times (worker restarted)"
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (error, time.time(), row['id'])
+                    )
+                    abandoned.append((json.loads(row['payload']), error))
+                else:
+                    print(f"Requeueing job {row['id']} orphaned by process {row['owner']}")
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner = NULL, started_at = NULL, heartbeat_at = NULL "
+                        "WHERE id = ?",
+                        (row['id'],)
+                    )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - JOB_QUEUE_RETENTION_SECONDS,)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        for payload, error in abandoned:
+            if self._abandon_handler is not None:
+                try:
+                    self._abandon_handler(payload, error)
+                except Exception as e:
+                    print(f"Error handling abandoned job: {e}")
+
+        if rows and len(abandoned) < len(rows):
+            self._wakeup.set()
+
+    def _worker_loop(self) -> None:
+        while True:
+            try:
+                if time.monotonic() - self._last_recover >= _RECOVER_INTERVAL_SECONDS:
+                    self.recover()
+
+                row = self._claim()
+                if row is None:
+                    self._wakeup.wait(JOB_QUEUE_POLL_INTERVAL)
+                    self._wakeup.clear()
+                    continue
+            except Exception as e:
+                print(f"Job queue error: {e}")
+                time.sleep(JOB_QUEUE_POLL_INTERVAL)
+                continue
+
+            print(f"Starting job {row['id']} for run {row['run_id']} "
+                  f"(waited {time.time() - row['enqueued_at']:.1f}s, attempt {row['attempts'] + 1})")
+            error = None
+            try:
+                self._handler(json.loads(row['payload']))
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                error = str(e)
+
+            try:
+                self._finish(row['id'], error)
+            except Exception as e:
+                print(f"Error finishing job {row['id']}: {e}")
+
+    def get_stats(self) -> dict:
+        """Host-wide queue depth and wait times over the last hour, plus this process's worker count."""
+        conn = self._conn()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        since = time.time() - _STATS_WINDOW_SECONDS
+        waits = conn.execute(
+            'SELECT COUNT(*), AVG(started_at - enqueued_at), MAX(started_at - enqueued_at) '
+            'FROM jobs WHERE started_at IS NOT NULL AND started_at >= ?',
+            (since,)
+        ).fetchone()
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+        return {
+            'depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'max_depth': JOB_QUEUE_MAX_DEPTH,
+            'workers_per_process': JOB_QUEUE_WORKERS if self._started_pid == os.getpid() else 0,
+            'oldest_queued_age_seconds': round(time.time() - oldest, 3) if oldest else 0,
+            'last_hour': {
+                'started': waits[0],
+                'done': conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'done' AND finished_at >= ?", (since,)
+                ).fetchone()[0],
+                'failed': conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'failed' AND finished_at >= ?", (since,)
+                ).fetchone()[0],
+                'avg_wait_seconds': round(waits[1] or 0, 3),
+                'max_wait_seconds': round(waits[2] or 0, 3)
+            }
+        }
+
+
+# Global singleton instance
+job_queue = JobQueue()
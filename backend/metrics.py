@@ -0,0 +1,110 @@
+"""
+Prometheus metrics for the app, served at GET /metrics.
+
+Latency histograms for the pipeline stages, provider predictions and HTTP calls,
+Gemini requests, Supabase storage / table calls and the Flask handlers. Every
+histogram has an 'outcome' label ('ok', 'error', or a more specific value set by the
+caller), so slow and failing calls can be told apart.
+
+Gunicorn workers are separate processes. When PROMETHEUS_MULTIPROC_DIR is set (it
+must exist and be emptied before the workers start, see README) every worker writes
+its samples there and /metrics aggregates all of them; otherwise /metrics only
+reports the worker that answered.
+"""
+import functools
+import os
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# prometheus_client picks multiprocess mode at import time, so .env has to be loaded first
+load_dotenv()
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+# Pipeline stages and provider predictions take seconds to minutes
+SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+# Supabase and HTTP handlers take milliseconds to seconds
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PIPELINE_RUN_SECONDS = Histogram(
+    'pipeline_run_seconds', 'Whole inference pipeline run', ['outcome'], buckets=SLOW_BUCKETS)
+PIPELINE_STAGE_SECONDS = Histogram(
+    'pipeline_stage_seconds', 'Inference pipeline stage (analyze once per run; generate, enhance, upload per preset)',
+    ['stage', 'outcome'], buckets=SLOW_BUCKETS)
+PROVIDER_PREDICTION_SECONDS = Histogram(
+    'provider_prediction_seconds', 'Provider prediction from creation to result (run_prediction_sync)',
+    ['provider', 'outcome'], buckets=SLOW_BUCKETS)
+PROVIDER_HTTP_SECONDS = Histogram(
+    'provider_http_request_seconds', 'HTTP request through the shared provider session',
+    ['host', 'method', 'outcome'], buckets=FAST_BUCKETS)
+GEMINI_REQUEST_SECONDS = Histogram(
+    'gemini_request_seconds', 'Gemini generate_content call', ['model', 'outcome'], buckets=SLOW_BUCKETS)
+GEMINI_SLOT_WAIT_SECONDS = Histogram(
+    'gemini_slot_wait_seconds', 'Time waiting for a process-wide Gemini request slot', buckets=SLOW_BUCKETS)
+SUPABASE_SECONDS = Histogram(
+    'supabase_request_seconds', 'Supabase storage or table call made by db_utils',
+    ['kind', 'operation', 'outcome'], buckets=FAST_BUCKETS)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', 'Flask request handler, until the response starts (so not the length of SSE streams)',
+    ['method', 'endpoint', 'status'], buckets=FAST_BUCKETS)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Observe the duration of the block in histogram.
+
+    Yields the label dict, so the block can set a more specific 'outcome' than the
+    default 'ok' (an exception always records 'error').
+    """
+    labels.setdefault('outcome', 'ok')
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels['outcome'] = 'error'
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def timed_call(histogram, **labels):
+    """Decorator form of timed(); labels are fixed at decoration time."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def supabase_call(kind):
+    """Decorator timing a db_utils function in SUPABASE_SECONDS, labelled with its name."""
+    def decorator(func):
+        return timed_call(SUPABASE_SECONDS, kind=kind, operation=func.__name__)(func)
+    return decorator
+
+
+def render():
+    """
+    Current metrics in the Prometheus text format.
+
+    Returns:
+        Tuple of (body bytes, content type)
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
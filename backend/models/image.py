@@ -1,12 +1,15 @@
-from db_utils import upload_image_to_supabase
-from general_utils import generate_uuid_filename
+from image_dedup import upload_image_deduplicated
 
 class Image:
     def __init__(self, url=None, filepath=None):
+        # Normalized bytes of an image we uploaded ourselves, so the pipeline
+        # can use them without downloading the image back from storage
+        self.data = None
         if filepath:
-            filename = generate_uuid_filename()
-            self.url = upload_image_to_supabase(filepath, filename)
-            self.filepath = filename
+            image_data = filepath.read()
+            filepath.seek(0)
+            self.url, self.data = upload_image_deduplicated(image_data)
+            self.filepath = self.url.rsplit('/', 1)[-1]
         else:
             self.url = url
             self.filepath = filepath
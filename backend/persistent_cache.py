@@ -0,0 +1,171 @@
+"""
+Two-tier cache for results that are expensive to recompute and worth keeping across
+restarts: an in-process LRU (cache_utils.TTLCache) in front of a node-local SQLite
+table (see sqlite_utils.py) shared by every Gunicorn worker on the host.
+
+Values must be JSON-serializable. Like TTLCache, a cache created with ttl_seconds <= 0
+is disabled, and its stats are reported from /stats under its name. If the SQLite
+file can't be used (locked for too long, disk full, corrupt), get() falls back to the
+memory tier and set() only fills the memory tier; the error is logged.
+"""
+import json
+import sqlite3
+import threading
+import time
+from cache_utils import TTLCache, register_cache
+from sqlite_utils import get_connection
+
+_DB_NAME = 'persistent_cache'
+
+# Trim the disk tier every this many sets
+_EVICT_EVERY = 100
+
+_MISSING = object()
+
+
+class PersistentCache:
+    """Memory LRU + SQLite cache where entries expire ttl_seconds after they are set."""
+
+    def __init__(self, name, ttl_seconds, memory_entries=1000, max_entries=None):
+        """
+        Args:
+            name: Cache name; also separates this cache's rows in the shared table
+            ttl_seconds: Entry lifetime in both tiers (<= 0 disables the cache)
+            memory_entries: Size bound of the in-process LRU tier
+            max_entries: Size bound of the disk tier; least recently used rows are evicted
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._memory = TTLCache(name, ttl_seconds, max_entries=memory_entries, register=False)
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._set_count = 0
+
+        register_cache(name, self)
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def _conn(self):
+        conn = get_connection(_DB_NAME)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    cache TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (cache, key)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (cache, accessed_at)')
+            self._schema_ready = True
+        return conn
+
+    def _count(self, outcome):
+        with self._lock:
+            if outcome == 'memory':
+                self._memory_hits += 1
+            elif outcome == 'disk':
+                self._disk_hits += 1
+            else:
+                self._misses += 1
+
+    def get(self, key, default=None):
+        """Return the cached value for key from memory or disk, or default if missing or expired."""
+        if not self.enabled:
+            self._count('miss')
+            return default
+
+        value = self._memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count('memory')
+            return value
+
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT value, expires_at FROM entries WHERE cache = ? AND key = ?', (self.name, key)
+            ).fetchone()
+            if row is not None and row['expires_at'] > now:
+                conn.execute('UPDATE entries SET accessed_at = ? WHERE cache = ? AND key = ?',
+                             (now, self.name, key))
+        except sqlite3.Error as e:
+            print(f"Error reading {self.name} cache from disk: {e}")
+            row = None
+        if row is None or row['expires_at'] <= now:
+            self._count('miss')
+            return default
+
+        value = json.loads(row['value'])
+        self._memory.set(key, value)
+        self._count('disk')
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        self._memory.set(key, value)
+
+        now = time.time()
+        with self._lock:
+            self._set_count += 1
+            evict = self._set_count % _EVICT_EVERY == 0
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO entries (cache, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (self.name, key, json.dumps(value), now + self.ttl_seconds, now)
+            )
+            if evict:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"Error writing {self.name} cache to disk: {e}")
+
+    def evict(self):
+        """Drop expired rows, then the least recently used ones beyond max_entries."""
+        conn = self._conn()
+        conn.execute('DELETE FROM entries WHERE cache = ? AND expires_at <= ?', (self.name, time.time()))
+        if self.max_entries:
+            conn.execute('''
+                DELETE FROM entries WHERE cache = ? AND key IN (
+                    SELECT key FROM entries WHERE cache = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.name, self.name, self.max_entries))
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or every entry if keys is None, from both tiers."""
+        self._memory.invalidate(keys)
+        conn = self._conn()
+        if keys is None:
+            conn.execute('DELETE FROM entries WHERE cache = ?', (self.name,))
+            return
+        for key in keys:
+            conn.execute('DELETE FROM entries WHERE cache = ? AND key = ?', (self.name, key))
+
+    def stats(self):
+        with self._lock:
+            memory_hits, disk_hits, misses = self._memory_hits, self._disk_hits, self._misses
+        lookups = memory_hits + disk_hits + misses
+        try:
+            disk_entries = self._conn().execute(
+                'SELECT COUNT(*) FROM entries WHERE cache = ?', (self.name,)
+            ).fetchone()[0]
+        except Exception:
+            disk_entries = None
+        return {
+            'enabled': self.enabled,
+            'memory_entries': self._memory.stats()['entries'],
+            'disk_entries': disk_entries,
+            'memory_hits': memory_hits,
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'hit_rate': round((memory_hits + disk_hits) / lookups, 4) if lookups else None,
+        }
+
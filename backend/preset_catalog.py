@@ -0,0 +1,138 @@
+"""
+Cached preset catalog for GET /presets.
+
+The catalog changes maybe once a week, so each worker keeps the serialized response
+in memory for PRESET_CATALOG_CACHE_TTL_SECONDS instead of querying Supabase on every
+page load. refresh() (POST /presets/refresh) rebuilds it right away and bumps a
+refresh counter in a node-local SQLite table (see sqlite_utils.py), so the other
+Gunicorn workers drop their copies on their next request. The pipeline's cached
+presets_details rows follow the same counter (see refresh_version()).
+
+The same table records when the catalog content last changed, so every worker sends
+the same ETag and Last-Modified for the same catalog. A TTL of 0 disables the cache.
+"""
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from cache_utils import TTLCache
+from db_utils import get_all_presets
+from sqlite_utils import get_connection
+
+PRESET_CATALOG_CACHE_TTL_SECONDS = int(os.getenv('PRESET_CATALOG_CACHE_TTL_SECONDS', '600'))
+# How long browsers may reuse a response without revalidating (Cache-Control max-age)
+PRESET_CATALOG_MAX_AGE_SECONDS = int(os.getenv('PRESET_CATALOG_MAX_AGE_SECONDS', '60'))
+# Checked on POST /presets/refresh (X-Refresh-Token header); empty disables the endpoint
+PRESET_REFRESH_TOKEN = os.getenv('PRESET_REFRESH_TOKEN', '')
+
+_DB_NAME = 'preset_catalog'
+_CATALOG = 'presets'
+
+_catalog_cache = TTLCache('preset_catalog', PRESET_CATALOG_CACHE_TTL_SECONDS)
+# One rebuild at a time; concurrent requests wait and reuse its result
+_build_lock = threading.Lock()
+
+_schema_ready = False
+
+
+def _conn():
+    global _schema_ready
+    conn = get_connection(_DB_NAME)
+    if not _schema_ready:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_state (
+                name TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified REAL NOT NULL DEFAULT 0,
+                refresh_version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        _schema_ready = True
+    return conn
+
+
+def refresh_version():
+    """Counter bumped by every refresh(), shared by all workers on the host."""
+    row = _conn().execute('SELECT refresh_version FROM catalog_state WHERE name = ?', (_CATALOG,)).fetchone()
+    return row['refresh_version'] if row else 0
+
+
+def _record_etag(etag):
+    """Return when the catalog with this ETag first appeared, recording now if it is new."""
+    conn = _conn()
+    conn.execute('''
+        INSERT INTO catalog_state (name, etag, last_modified) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            last_modified = CASE WHEN catalog_state.etag = excluded.etag
+                                 THEN catalog_state.last_modified ELSE excluded.last_modified END,
+            etag = excluded.etag
+    ''', (_CATALOG, etag, float(int(time.time()))))
+    row = conn.execute('SELECT last_modified FROM catalog_state WHERE name = ?', (_CATALOG,)).fetchone()
+    return row['last_modified']
+
+
+def _build_entry(refresh_version):
+    body = json.dumps({'presets': get_all_presets()}, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    return {
+        'body': body,
+        'etag': etag,
+        'last_modified': _record_etag(etag),
+        'refresh_version': refresh_version
+    }
+
+
+def get_preset_catalog():
+    """
+    Get the /presets response, from the cache unless it expired or was refreshed.
+
+    Returns:
+        Dict with 'body' (JSON bytes), 'etag' (without quotes) and 'last_modified'
+        (Unix timestamp of the last catalog change)
+    """
+    version = refresh_version()
+    if not _catalog_cache.enabled:
+        return _build_entry(version)
+
+    entry = _catalog_cache.get(_CATALOG)
+    if entry is not None and entry['refresh_version'] == version:
+        return entry
+
+    with _build_lock:
+        entry = _catalog_cache.get(_CATALOG)
+        if entry is not None and entry['refresh_version'] == version:
+            return entry
+
+        entry = _build_entry(version)
+        _catalog_cache.set(_CATALOG, entry)
+        return entry
+
+
+def refresh():
+    """
+    Reload the catalog from Supabase in this worker and mark every other worker's copy
+    stale, along with every worker's cached presets_details rows.
+
+    Returns:
+        The rebuilt catalog (see get_preset_catalog)
+    """
+    _conn().execute('''
+        INSERT INTO catalog_state (name, refresh_version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET refresh_version = catalog_state.refresh_version + 1
+    ''', (_CATALOG,))
+    return get_preset_catalog()
+
+
+def refresh_enabled():
+    """POST /presets/refresh is only served when PRESET_REFRESH_TOKEN is configured."""
+    return bool(PRESET_REFRESH_TOKEN)
+
+
+def verify_refresh_token(token):
+    """Check the token sent with a refresh request. Never passes if PRESET_REFRESH_TOKEN is unset."""
+    if not PRESET_REFRESH_TOKEN:
+        return False
+    # Bytes, since compare_digest rejects str with non-ASCII characters
+    return hmac.compare_digest((token or '').encode('utf-8'), PRESET_REFRESH_TOKEN.encode('utf-8'))
@@ -0,0 +1,84 @@
+"""
+Progress Store Module
+Node-local progress for runs executing on this host, shared by every Gunicorn worker.
+
+Backed by a SQLite table in WAL mode (see sqlite_utils.py), so the worker running a
+pipeline can record every progress tick locally and /check_progress can answer from
+any worker without a Supabase query. Supabase stays the durable record; it only
+needs to be read for runs this host doesn't know about.
+"""
+import time
+from typing import Dict, Optional
+from sqlite_utils import get_connection
+
+_DB_NAME = 'progress'
+
+_schema_ready = False
+
+
+def _conn():
+    global _schema_ready
+    conn = get_connection(_DB_NAME)
+    if not _schema_ready:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS run_progress (
+                run_id TEXT PRIMARY KEY,
+                progress INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        _schema_ready = True
+    return conn
+
+
+def upsert(run_id: str, progress: Optional[int] = None, status: Optional[str] = None,
+           error: Optional[str] = None) -> None:
+    """
+    Record progress / status / error for a run. Progress never goes backwards and
+    fields passed as None keep their current value.
+    """
+    _conn().execute('''
+        INSERT INTO run_progress (run_id, progress, status, error, updated_at)
+        VALUES (?, COALESCE(?, 0), COALESCE(?, 'pending'), ?, ?)
+        ON CONFLICT (run_id) DO UPDATE SET
+            progress = MAX(run_progress.progress, COALESCE(excluded.progress, run_progress.progress)),
+            status = COALESCE(?, run_progress.status),
+            error = COALESCE(excluded.error, run_progress.error),
+            updated_at = excluded.updated_at
+    ''', (str(run_id), progress, status, error, time.time(), status))
+
+
+def get_many(run_ids: list) -> Dict[str, dict]:
+    """
+    Get the locally known runs among run_ids.
+
+    Returns:
+        Dict mapping run_id to {'progress', 'status', 'error', 'updated_at'}; unknown runs are absent
+    """
+    if not run_ids:
+        return {}
+    placeholders = ','.join('?' for _ in run_ids)
+    rows = _conn().execute(
+        f'SELECT run_id, progress, status, error, updated_at FROM run_progress WHERE run_id IN ({placeholders})',
+        [str(run_id) for run_id in run_ids]
+    ).fetchall()
+    return {
+        row['run_id']: {
+            'progress': row['progress'],
+            'status': row['status'],
+            'error': row['error'],
+            'updated_at': row['updated_at']
+        }
+        for row in rows
+    }
+
+
+def delete(run_id: str) -> None:
+    _conn().execute('DELETE FROM run_progress WHERE run_id = ?', (str(run_id),))
+
+
+def prune(max_age_seconds: float) -> None:
+    """Drop runs that haven't been updated for max_age_seconds."""
+    _conn().execute('DELETE FROM run_progress WHERE updated_at < ?', (time.time() - max_age_seconds,))
@@ -1,16 +1,44 @@
 """
 Progress Tracker Module
-Provides progress tracking using Supabase database for multi-worker compatibility.
-Works correctly with Gunicorn's multiple worker processes.
+Tracks run progress in a node-local store shared by Gunicorn's worker processes, with
+Supabase as the durable record.
 
-Uses the 'intermediate_outputs' JSON column to store progress since we can't add new columns.
-Progress is stored as: intermediate_outputs.progress_percent
+In Supabase, progress lives in the 'intermediate_outputs' JSON column (we can't add
+new columns), as intermediate_outputs.progress_percent.
+
+Every progress tick is recorded in the node-local progress store (progress_store.py),
+which all workers on the host share, so /check_progress normally answers without a
+Supabase query. A local row is only trusted while it is terminal or was updated within
+PROGRESS_LOCAL_FRESH_SECONDS; runs this host doesn't know about, and runs whose local
+row went quiet (the run may have been finished or failed by another host or by hand),
+are read from Supabase.
+Supabase only gets durable writes when progress crosses one of
+PROGRESS_DURABLE_MILESTONES (the stage boundaries), plus completion and errors. Those go
+through the merge_run_progress SQL function (sql/merge_run_progress.sql), which merges
+progress_percent server-side in a single statement.
 """
+import os
 import threading
+import time
 from typing import Dict, Optional
 from dataclasses import dataclass
 from datetime import datetime
 from db_utils import supabase
+import progress_store
+
+# Progress values that get written through to Supabase. The defaults line up with the
+# pipeline's stage boundaries (analysis done at 25%, see inference_pipeline/stage_progress.py).
+PROGRESS_DURABLE_MILESTONES = sorted(
+    int(value) for value in os.getenv('PROGRESS_DURABLE_MILESTONES', '25,50,75').split(',') if value.strip()
+)
+
+# A non-terminal local row older than this is re-checked against Supabase
+PROGRESS_LOCAL_FRESH_SECONDS = int(os.getenv('PROGRESS_LOCAL_FRESH_SECONDS', '60'))
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+# Prune the local store every this many created runs
+_PRUNE_EVERY = 100
 
 
 @dataclass
@@ -30,10 +58,9 @@ class RunProgress:
 
 class ProgressTracker:
     """
-    Progress tracker that stores progress in Supabase database.
-    This allows multiple Gunicorn workers to share progress state.
-    
-    Uses intermediate_outputs JSON column to store progress_percent.
+    Progress tracker that records every tick in the node-local progress store, which
+    all Gunicorn workers on the host share, and writes durable milestones, completion
+    and errors to Supabase (intermediate_outputs.progress_percent, status, error).
     """
     _instance = None
     _lock = threading.Lock()
@@ -50,12 +77,84 @@ class ProgressTracker:
         if self._initialized:
             return
         self._initialized = True
+        self._writes_lock = threading.Lock()
+        # run_id -> last progress written to Supabase
+        self._last_durable = {}
+        self._rpc_available = True
+        self._created_count = 0
+
+    def _write(self, run_id: str, progress: Optional[int] = None, status: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        """
+        Merge progress_percent (and optionally status / error) into the run in one statement.
+        Falls back to a read-modify-write if merge_run_progress isn't installed.
+        """
+        if self._rpc_available:
+            try:
+                supabase.rpc('merge_run_progress', {
+                    'p_run_id': int(run_id),
+                    'p_progress': progress,
+                    'p_status': status,
+                    'p_error': error
+                }).execute()
+                return
+            except Exception as e:
+                # PGRST202: function not found - stop trying it until restart
+                if 'PGRST202' not in str(e):
+                    raise
+                print("merge_run_progress not installed (see sql/merge_run_progress.sql), "
+                      "falling back to read-modify-write progress updates")
+                self._rpc_available = False
+
+        updates = {}
+        if progress is not None:
+            # Get current intermediate_outputs to preserve other data
+            result = supabase.table('runs').select('intermediate_outputs').eq('id', int(run_id)).execute()
+
+            current_outputs = {}
+            if result.data and result.data[0].get('intermediate_outputs'):
+                current_outputs = result.data[0]['intermediate_outputs']
+
+            current_outputs['progress_percent'] = progress
+            updates['intermediate_outputs'] = current_outputs
+        if status is not None:
+            updates['status'] = status
+        if error is not None:
+            updates['error'] = error
+
+        supabase.table('runs').update(updates).eq('id', int(run_id)).execute()
+
+    def _should_write(self, run_id: str, progress: int) -> bool:
+        """Only let through changes that cross a durable milestone."""
+        with self._writes_lock:
+            last = self._last_durable.get(run_id, 0)
+            if not any(last < milestone <= progress for milestone in PROGRESS_DURABLE_MILESTONES):
+                return False
+            self._last_durable[run_id] = progress
+            return True
+
+    def _forget(self, run_id: str) -> None:
+        with self._writes_lock:
+            self._last_durable.pop(run_id, None)
+
+    def _write_local(self, run_id: str, progress: Optional[int] = None, status: Optional[str] = None,
+                     error: Optional[str] = None) -> None:
+        try:
+            progress_store.upsert(run_id, progress=progress, status=status, error=error)
+        except Exception as e:
+            print(f"Error writing local progress: {e}")
 
     def create_run(self, run_id: str) -> None:
         """
         Initialize a new run with 0% progress.
         Sets intermediate_outputs to include progress_percent.
         """
+        self._write_local(run_id, progress=0, status='pending')
+
+        self._created_count += 1
+        if self._created_count % _PRUNE_EVERY == 0:
+            self.cleanup_old_runs()
+
         try:
             supabase.table('runs').update({
                 'intermediate_outputs': {'progress_percent': 0}
@@ -64,113 +163,122 @@ class ProgressTracker:
             print(f"Error creating run progress: {e}")
 
     def update_progress(self, run_id: str, progress: int) -> None:
-        """Update the progress for a run (0-100)."""
+        """
+        Update the progress for a run (0-100). Always recorded locally; only
+        written to Supabase when it crosses a durable milestone.
+        """
         try:
             clamped_progress = min(100, max(0, progress))
-            
-            # Get current intermediate_outputs to preserve other data
-            result = supabase.table('runs').select('intermediate_outputs').eq('id', int(run_id)).execute()
-            
-            current_outputs = {}
-            if result.data and result.data[0].get('intermediate_outputs'):
-                current_outputs = result.data[0]['intermediate_outputs']
-            
-            # Update progress_percent
-            current_outputs['progress_percent'] = clamped_progress
-            
-            supabase.table('runs').update({
-                'intermediate_outputs': current_outputs
-            }).eq('id', int(run_id)).execute()
+
+            self._write_local(run_id, progress=clamped_progress)
+
+            if not self._should_write(run_id, clamped_progress):
+                return
+
+            self._write(run_id, progress=clamped_progress)
         except Exception as e:
             print(f"Error updating progress: {e}")
 
     def mark_complete(self, run_id: str) -> None:
         """Mark a run as complete."""
+        self._write_local(run_id, progress=100, status='completed')
         try:
-            # Get current intermediate_outputs to preserve other data
-            result = supabase.table('runs').select('intermediate_outputs').eq('id', int(run_id)).execute()
-            
-            current_outputs = {}
-            if result.data and result.data[0].get('intermediate_outputs'):
-                current_outputs = result.data[0]['intermediate_outputs']
-            
-            current_outputs['progress_percent'] = 100
-            
-            supabase.table('runs').update({
-                'intermediate_outputs': current_outputs,
-                'status': 'completed'
-            }).eq('id', int(run_id)).execute()
+            self._forget(run_id)
+            self._write(run_id, progress=100, status='completed')
         except Exception as e:
             print(f"Error marking complete: {e}")
 
     def mark_error(self, run_id: str, error_message: str) -> None:
         """Mark a run as failed with an error message."""
+        self._write_local(run_id, status='failed', error=error_message)
         try:
-            supabase.table('runs').update({
-                'error': error_message,
-                'status': 'failed'
-            }).eq('id', int(run_id)).execute()
+            self._forget(run_id)
+            self._write(run_id, status='failed', error=error_message)
         except Exception as e:
             print(f"Error marking error: {e}")
 
     def get_progress(self, run_id: str) -> Optional[RunProgress]:
-        """Get the current progress for a run from the database."""
-        try:
-            result = supabase.table('runs').select('id,intermediate_outputs,status,error').eq('id', int(run_id)).execute()
-            
-            if not result.data or len(result.data) == 0:
-                return None
-            
-            row = result.data[0]
-            intermediate_outputs = row.get('intermediate_outputs') or {}
-            progress = intermediate_outputs.get('progress_percent', 0) or 0
-            
-            return RunProgress(
-                run_id=str(row['id']),
-                progress=progress,
-                is_complete=row.get('status') in ('completed', 'failed'),
-                error=row.get('error')
-            )
-        except Exception as e:
-            print(f"Error getting progress: {e}")
-            return None
+        """Get the current progress for a run (local store first, then the database)."""
+        return self.get_multiple_progress([run_id]).get(run_id)
 
     def get_multiple_progress(self, run_ids: list) -> Dict[str, Optional[RunProgress]]:
-        """Get progress for multiple runs at once from the database."""
+        """
+        Get progress for multiple runs at once. Runs with a terminal or recently updated
+        local row are answered from the local store; Supabase is queried for the rest,
+        and a terminal state found there is recorded locally.
+        """
+        results_map = {}
+        stale_rows = {}
+
         try:
-            # Convert string IDs to integers for the query
-            int_ids = [int(rid) for rid in run_ids]
-            
-            result = supabase.table('runs').select('id,intermediate_outputs,status,error').in_('id', int_ids).execute()
-            
-            # Build a map of results
-            results_map = {}
-            for row in result.data:
-                run_id_str = str(row['id'])
-                intermediate_outputs = row.get('intermediate_outputs') or {}
-                progress = intermediate_outputs.get('progress_percent', 0) or 0
-                
-                results_map[run_id_str] = RunProgress(
+            fresh_after = time.time() - PROGRESS_LOCAL_FRESH_SECONDS
+            for run_id_str, row in progress_store.get_many(run_ids).items():
+                run_progress = RunProgress(
                     run_id=run_id_str,
-                    progress=progress,
-                    is_complete=row.get('status') in ('completed', 'failed'),
-                    error=row.get('error')
+                    progress=row['progress'],
+                    is_complete=row['status'] in TERMINAL_STATUSES,
+                    error=row['error']
                 )
-            
-            # Return results for all requested IDs (None if not found)
-            return {run_id: results_map.get(run_id) for run_id in run_ids}
-            
+                if run_progress.is_complete or row['updated_at'] >= fresh_after:
+                    results_map[run_id_str] = run_progress
+                else:
+                    stale_rows[run_id_str] = run_progress
         except Exception as e:
-            print(f"Error getting multiple progress: {e}")
-            return {run_id: None for run_id in run_ids}
+            print(f"Error reading local progress: {e}")
+
+        missing_ids = [run_id for run_id in run_ids if run_id not in results_map]
+        if missing_ids:
+            try:
+                # Convert string IDs to integers for the query
+                int_ids = [int(rid) for rid in missing_ids]
+
+                result = supabase.table('runs').select('id,intermediate_outputs,status,error').in_('id', int_ids).execute()
+
+                for row in result.data:
+                    run_id_str = str(row['id'])
+                    intermediate_outputs = row.get('intermediate_outputs') or {}
+                    progress = intermediate_outputs.get('progress_percent', 0) or 0
+
+                    is_complete = row.get('status') in TERMINAL_STATUSES
+
+                    local = stale_rows.get(run_id_str)
+                    if local is not None and not is_complete:
+                        # Supabase only has the last milestone; the local row may be further along
+                        progress = max(progress, local.progress)
+                    elif local is not None:
+                        self._write_local(run_id_str, progress=progress, status=row['status'],
+                                          error=row.get('error'))
+
+                    results_map[run_id_str] = RunProgress(
+                        run_id=run_id_str,
+                        progress=progress,
+                        is_complete=is_complete,
+                        error=row.get('error')
+                    )
+            except Exception as e:
+                print(f"Error getting multiple progress: {e}")
+
+        # Supabase unreachable or without the run: the stale local row is still the best answer
+        for run_id_str, run_progress in stale_rows.items():
+            results_map.setdefault(run_id_str, run_progress)
+
+        # Return results for all requested IDs (None if not found)
+        return {run_id: results_map.get(run_id) for run_id in run_ids}
 
     def cleanup_run(self, run_id: str) -> None:
-        """No-op for database-backed tracker (data persists in DB)."""
-        pass
+        """Drop a run from the local store (Supabase keeps the durable record)."""
+        self._forget(run_id)
+        try:
+            progress_store.delete(run_id)
+        except Exception as e:
+            print(f"Error cleaning up local progress: {e}")
 
     def cleanup_old_runs(self, max_age_hours: int = 24) -> None:
-        """No-op for database-backed tracker (use DB cleanup instead)."""
-        pass
+        """Drop runs from the local store that haven't been updated for max_age_hours."""
+        try:
+            progress_store.prune(max_age_hours * 3600)
+        except Exception as e:
+            print(f"Error pruning local progress: {e}")
 
 
 # Global singleton instance
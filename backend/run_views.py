@@ -0,0 +1,171 @@
+"""
+Projections and validators for the run read endpoints.
+
+GET /runs/<run_id> returns a compact view by default (status, error and the input
+and output URLs); the heavy intermediate_outputs (analysis and per-step results) are
+only read through GET /runs/<run_id>/intermediate_outputs or an explicit fields=
+projection, so the common read transfers a fraction of the row from Supabase.
+
+Responses carry an ETag, a hash of the serialized projection, so any change to the
+returned columns (including hand edits to a finished run) changes it. A conditional
+request still reads the projection but gets a 304 without the body when it matches.
+
+GET /runs pages through runs newest first with an opaque cursor (keyset on the run
+ID, so a page costs one range query however deep it is), and POST /runs:batchGet
+reads many runs with a single in_ query.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+from progress_tracker import TERMINAL_STATUSES
+
+# How long clients may reuse the response for a finished run without revalidating.
+# 0 makes them revalidate every time, so edits to a finished run show up at once.
+RUN_TERMINAL_MAX_AGE_SECONDS = int(os.getenv('RUN_TERMINAL_MAX_AGE_SECONDS', '0'))
+
+RUNS_PAGE_DEFAULT_LIMIT = int(os.getenv('RUNS_PAGE_DEFAULT_LIMIT', '20'))
+RUNS_PAGE_MAX_LIMIT = int(os.getenv('RUNS_PAGE_MAX_LIMIT', '100'))
+RUNS_BATCH_MAX_IDS = int(os.getenv('RUNS_BATCH_MAX_IDS', '100'))
+
+# Columns a client may ask for with fields=
+RUN_FIELDS = ('id', 'status', 'error', 'is_sample', 'inputs', 'outputs', 'intermediate_outputs')
+COMPACT_FIELDS = ('id', 'status', 'error', 'is_sample', 'inputs', 'outputs')
+
+
+def parse_fields(fields_param, default=COMPACT_FIELDS):
+    """
+    Parse a fields= query parameter into the columns to select.
+
+    Args:
+        fields_param: Comma-separated column names, '*' for every column in RUN_FIELDS,
+            or None/empty for the default
+        default: Columns to use when fields_param is empty
+
+    Returns:
+        Tuple of column names, always starting with 'id'
+
+    Raises:
+        ValueError: If a requested column is not in RUN_FIELDS
+    """
+    if not fields_param:
+        fields = list(default)
+    elif fields_param.strip() == '*':
+        fields = list(RUN_FIELDS)
+    else:
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in RUN_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(RUN_FIELDS)}")
+
+    return ('id',) + tuple(field for field in dict.fromkeys(fields) if field != 'id')
+
+
+def parse_limit(limit_param):
+    """
+    Parse a limit= query parameter (defaults to RUNS_PAGE_DEFAULT_LIMIT, capped at RUNS_PAGE_MAX_LIMIT).
+
+    Raises:
+        ValueError: If limit_param is not a positive integer
+    """
+    if not limit_param:
+        return RUNS_PAGE_DEFAULT_LIMIT
+    try:
+        limit = int(limit_param)
+    except ValueError:
+        raise ValueError(f"Invalid limit: {limit_param}")
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {limit_param}")
+    return min(limit, RUNS_PAGE_MAX_LIMIT)
+
+
+def parse_bool(value, name):
+    """
+    Parse an optional true/false query parameter.
+
+    Returns:
+        True, False, or None if value is empty
+
+    Raises:
+        ValueError: If value is not 'true' or 'false'
+    """
+    if not value:
+        return None
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f"Invalid {name}: {value} (expected true or false)")
+
+
+def parse_run_ids(run_ids):
+    """
+    Validate the run_ids of a batch request.
+
+    Args:
+        run_ids: List of run IDs, each an integer or a string of digits
+
+    Returns:
+        List of the distinct IDs as strings, in request order
+
+    Raises:
+        ValueError: If run_ids is not a non-empty list of at most RUNS_BATCH_MAX_IDS valid IDs
+    """
+    if not isinstance(run_ids, list) or not run_ids:
+        raise ValueError("run_ids must be a non-empty array")
+    if len(run_ids) > RUNS_BATCH_MAX_IDS:
+        raise ValueError(f"At most {RUNS_BATCH_MAX_IDS} run_ids per request")
+
+    parsed = []
+    for run_id in run_ids:
+        is_digits = isinstance(run_id, str) and run_id.isascii() and run_id.isdigit()
+        if not (is_digits or (isinstance(run_id, int) and not isinstance(run_id, bool))):
+            raise ValueError(f"Invalid run ID: {run_id!r}. Must be an integer.")
+        parsed.append(str(int(run_id)))
+    return list(dict.fromkeys(parsed))
+
+
+def encode_cursor(run_id):
+    """Opaque cursor pointing after the given run ID."""
+    return base64.urlsafe_b64encode(json.dumps({'before_id': run_id}).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor.
+
+    Returns:
+        The run ID the next page starts before, or None if cursor is empty
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        before_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['before_id']
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(before_id, int):
+        raise ValueError("Invalid cursor")
+    return before_id
+
+
+def serialize(payload):
+    """
+    Serialize a response payload once and hash it for the ETag.
+
+    Returns:
+        Tuple of (JSON body bytes, ETag without quotes)
+    """
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+def cache_control(status):
+    """Cache-Control for a run response: revalidated while running, reusable for a while once finished."""
+    if status in TERMINAL_STATUSES and RUN_TERMINAL_MAX_AGE_SECONDS > 0:
+        return f"private, max-age={RUN_TERMINAL_MAX_AGE_SECONDS}"
+    return 'no-cache'
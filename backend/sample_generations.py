@@ -0,0 +1,114 @@
+"""
+Cached response for GET /sample_generations.
+
+The response is built from one query for the sample runs plus one batched preset-name
+lookup for all of them, serialized once and kept in memory with its ETag. Sample rows
+are curated by hand in Supabase, so nothing in the app tells us when they change:
+  - every SAMPLE_GENERATIONS_REVALIDATE_SECONDS a cached response is revalidated by
+    comparing the current sample run IDs with the ones it was built from (one small
+    query); a sample added or removed rebuilds it
+  - after SAMPLE_GENERATIONS_CACHE_TTL_SECONDS it is rebuilt regardless, which picks
+    up edits to an existing sample's inputs or outputs
+  - invalidate() drops it immediately (this worker only)
+A TTL of 0 disables the cache and every request rebuilds the response.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from cache_utils import TTLCache
+from db_utils import get_sample_runs, get_sample_run_ids, get_preset_names_by_ids
+
+SAMPLE_GENERATIONS_CACHE_TTL_SECONDS = int(os.getenv('SAMPLE_GENERATIONS_CACHE_TTL_SECONDS', '3600'))
+SAMPLE_GENERATIONS_REVALIDATE_SECONDS = int(os.getenv('SAMPLE_GENERATIONS_REVALIDATE_SECONDS', '30'))
+
+_CACHE_KEY = 'response'
+
+_response_cache = TTLCache('sample_generations', SAMPLE_GENERATIONS_CACHE_TTL_SECONDS)
+# One rebuild or revalidation at a time; concurrent requests wait and reuse its result
+_build_lock = threading.Lock()
+
+
+def build_samples(rows):
+    """
+    Decode the preset IDs of sample runs to names with a single preset lookup.
+
+    Args:
+        rows: List of run dicts with 'inputs' and 'outputs'
+
+    Returns:
+        List of dicts with 'inputs' (settings as preset names) and 'outputs'
+    """
+    # Collect the numeric preset IDs of every row, then resolve them in one query
+    preset_ids = set()
+    for row in rows:
+        settings = (row.get('inputs') or {}).get('settings', [])
+        if settings and isinstance(settings[0], int):
+            preset_ids.update(settings)
+    preset_names_map = get_preset_names_by_ids(sorted(preset_ids))
+
+    samples = []
+    for row in rows:
+        inputs = row.get('inputs') or {}
+        outputs = row.get('outputs') or []
+
+        settings = inputs.get('settings', [])
+        if settings and isinstance(settings[0], int):
+            inputs = {**inputs, 'settings': [preset_names_map.get(pid, str(pid)) for pid in settings]}
+
+        samples.append({
+            'inputs': inputs,
+            'outputs': outputs
+        })
+    return samples
+
+
+def _build_entry():
+    rows = get_sample_runs()
+    body = json.dumps(build_samples(rows), separators=(',', ':')).encode('utf-8')
+    return {
+        'body': body,
+        'etag': hashlib.sha256(body).hexdigest()[:32],
+        'run_ids': [row['id'] for row in rows],
+        'checked_at': time.monotonic()
+    }
+
+
+def _is_fresh(entry):
+    return entry is not None and time.monotonic() - entry['checked_at'] < SAMPLE_GENERATIONS_REVALIDATE_SECONDS
+
+
+def get_sample_generations():
+    """
+    Get the /sample_generations response, from the cache when it is still current.
+
+    Returns:
+        Tuple of (JSON body bytes, ETag without quotes)
+    """
+    if not _response_cache.enabled:
+        entry = _build_entry()
+        return entry['body'], entry['etag']
+
+    entry = _response_cache.get(_CACHE_KEY)
+    if _is_fresh(entry):
+        return entry['body'], entry['etag']
+
+    with _build_lock:
+        # Another request may have revalidated or rebuilt it while we waited
+        entry = _response_cache.get(_CACHE_KEY)
+        if _is_fresh(entry):
+            return entry['body'], entry['etag']
+
+        if entry is not None and get_sample_run_ids() == entry['run_ids']:
+            entry['checked_at'] = time.monotonic()
+            return entry['body'], entry['etag']
+
+        entry = _build_entry()
+        _response_cache.set(_CACHE_KEY, entry)
+        return entry['body'], entry['etag']
+
+
+def invalidate():
+    """Drop the cached response so the next request rebuilds it."""
+    _response_cache.invalidate()
@@ -0,0 +1,79 @@
+"""
+Benchmark: separate vs combined vision analysis (ANALYZE_MODE).
+
+Calls the real vision model through Replicate, so it needs REPLICATE_API_TOKEN (and
+the rest of backend/.env). The analysis cache is bypassed: every round makes fresh
+predictions. For each round it times
+    separate - detect_gender and analyze_clothing in parallel (2 predictions)
+    combined - analyze_person_and_clothing (1 prediction)
+and reports whether the two modes agree on gender and clothing type.
+
+Usage (from backend/):
+    python scripts/bench_analyze_modes.py --person-url URL --clothing-url URL [--rounds 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_pipeline.step_analyze import (  # noqa: E402
+    analyze_clothing,
+    analyze_person_and_clothing,
+    detect_gender
+)
+
+
+def run_separate(person_url, clothing_url):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        gender_future = executor.submit(detect_gender, person_url)
+        clothing_future = executor.submit(analyze_clothing, clothing_url)
+        return gender_future.result(), clothing_future.result()
+
+
+def run_combined(person_url, clothing_url):
+    return analyze_person_and_clothing(person_url, clothing_url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--person-url', required=True)
+    parser.add_argument('--clothing-url', required=True)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    timings = {'separate': [], 'combined': []}
+    unparsed = 0
+    agreements = 0
+
+    for round_number in range(1, args.rounds + 1):
+        start = time.perf_counter()
+        separate = run_separate(args.person_url, args.clothing_url)
+        timings['separate'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        combined = run_combined(args.person_url, args.clothing_url)
+        timings['combined'].append(time.perf_counter() - start)
+
+        if combined is None:
+            unparsed += 1
+        elif combined[0] == separate[0] and combined[1]['type'].lower() == separate[1]['type'].lower():
+            agreements += 1
+
+        print(f"round {round_number}: separate {timings['separate'][-1]:.2f}s {separate}")
+        print(f"         combined {timings['combined'][-1]:.2f}s {combined}")
+
+    print()
+    for mode, predictions in (('separate', 2), ('combined', 1)):
+        values = timings[mode]
+        print(f"{mode:9s} {predictions} prediction(s)/run  median {statistics.median(values):6.2f}s  "
+              f"min {min(values):6.2f}s  max {max(values):6.2f}s")
+    print(f"combined answers unparseable (would fall back): {unparsed}/{args.rounds}")
+    print(f"combined agrees with separate on gender and type: {agreements}/{args.rounds}")
+
+
+if __name__ == '__main__':
+    main()
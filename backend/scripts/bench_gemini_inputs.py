@@ -0,0 +1,137 @@
+"""
+Benchmark: Gemini request inputs, SDK PIL encoding vs input_prep.prepare_image.
+
+Passing a PIL image to generate_content makes the SDK (pil_to_blob) re-encode it as a
+full-size PNG for every call; the pipeline now sends prepare_image's output for the
+person and clothing photos and the stored bytes of the reference image. For synthetic
+inputs shaped like real requests (a 12 MP phone JPEG, a 4K PNG and a square PNG
+reference image) this compares the bytes per image part and the encode time of both
+paths. An upload is sent three times per preset (generate retries aside),
+so the per-call cost matters more than the one-off preparation.
+
+With --live and GOOGLE_AI_STUDIO_API_KEY set, it also times a real image request for
+each path with the images at --person-url, --clothing-url and --ref-url.
+
+Usage (from backend/):
+    python scripts/bench_gemini_inputs.py [--rounds 3]
+    python scripts/bench_gemini_inputs.py --live --person-url URL --clothing-url URL --ref-url URL
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from google.genai import _transformers, types
+from PIL import Image as PILImage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_pipeline.input_prep import prepare_image  # noqa: E402
+
+
+def synthetic_photo(width, height, image_format):
+    """Gradient plus noise: compresses roughly like a photo, unlike flat synthetic images."""
+    size = (width, height)
+    gradient = PILImage.linear_gradient('L').resize(size)
+    noise = PILImage.effect_noise(size, 24)
+    image = PILImage.merge('RGB', (gradient, noise, gradient.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT)))
+
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=92)
+    return buffer.getvalue()
+
+
+def load(image_bytes):
+    image = PILImage.open(BytesIO(image_bytes))
+    image.load()
+    return image
+
+
+def time_encode(encode, rounds):
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = encode()
+        durations.append(time.perf_counter() - start)
+    return size, statistics.median(durations)
+
+
+def run_offline(rounds):
+    # (name, encoded image, whether the pipeline prepares it or sends it as stored)
+    inputs = [
+        ('phone JPEG 4032x3024', synthetic_photo(4032, 3024, 'JPEG'), True),
+        ('4K PNG 3840x2160', synthetic_photo(3840, 2160, 'PNG'), True),
+        ('reference PNG 2048x2048', synthetic_photo(2048, 2048, 'PNG'), False),
+    ]
+
+    print(f"{'input':26s} {'upload':>9s} {'sdk part':>10s} {'sdk enc':>8s} {'prepared':>10s} {'prep enc':>9s}")
+    totals = {'sdk': 0, 'prepared': 0}
+    for name, image_bytes, prepared in inputs:
+        image = load(image_bytes)
+        sdk_size, sdk_time = time_encode(lambda: len(_transformers.pil_to_blob(image).data), rounds)
+        if prepared:
+            prepared_size, prepared_time = time_encode(lambda: len(prepare_image(image)[0]), rounds)
+        else:
+            prepared_size, prepared_time = len(image_bytes), 0.0
+        totals['sdk'] += sdk_size
+        totals['prepared'] += prepared_size
+        print(f"{name:26s} {len(image_bytes) / 1e6:7.2f}MB {sdk_size / 1e6:8.2f}MB {sdk_time:7.2f}s "
+              f"{prepared_size / 1e6:8.2f}MB {prepared_time:8.2f}s")
+
+    print(f"\nper request (3 images): sdk {totals['sdk'] / 1e6:.2f}MB, prepared {totals['prepared'] / 1e6:.2f}MB "
+          f"({100 * (1 - totals['prepared'] / totals['sdk']):.0f}% smaller)")
+
+
+def run_live(person_url, clothing_url, ref_url, rounds):
+    from ai_api_utils.gemini import GEMINI_IMAGE_MODEL, extract_image_bytes, gemini_client_manager
+    from inference_pipeline.image_store import RunImageStore
+    from inference_pipeline.step_generate import original_image_part, prepared_image_part
+
+    image_store = RunImageStore()
+    urls = [person_url, clothing_url, ref_url]
+    variants = {
+        # The PIL images the steps used to hand to the SDK
+        'sdk': [PILImage.open(BytesIO(image_store.get_bytes(url))) for url in urls],
+        'prepared': [prepared_image_part(image_store, person_url), prepared_image_part(image_store, clothing_url),
+                     original_image_part(image_store, ref_url)],
+    }
+    prompt = "Place the person from image 1, wearing the garment from image 2, into the scene of image 3."
+
+    for name, images in variants.items():
+        durations = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = gemini_client_manager.generate_content(
+                model=GEMINI_IMAGE_MODEL,
+                contents=[prompt, *images],
+                config=types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE']),
+            )
+            durations.append(time.perf_counter() - start)
+            if extract_image_bytes(response) is None:
+                print(f"{name}: response had no image")
+        print(f"{name:9s} median {statistics.median(durations):6.2f}s  min {min(durations):6.2f}s  "
+              f"max {max(durations):6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--live', action='store_true', help='also time real Gemini requests')
+    parser.add_argument('--person-url')
+    parser.add_argument('--clothing-url')
+    parser.add_argument('--ref-url')
+    args = parser.parse_args()
+
+    run_offline(args.rounds)
+
+    if args.live:
+        if not (args.person_url and args.clothing_url and args.ref_url):
+            parser.error('--live needs --person-url, --clothing-url and --ref-url')
+        print()
+        run_live(args.person_url, args.clothing_url, args.ref_url, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: CPU time and output size of each image encoding profile in db_utils.
+
+Runs normalize_image_bytes over representative images (a 4K photo-like PNG like a
+Gemini output, a phone-photo JPEG, and an RGBA PNG cut-out like a clothing upload)
+once per profile, plus the pass-through path for inputs that are already compliant
+(RGB in one of IMAGE_PASSTHROUGH_FORMATS).
+Pass your own files with --images to benchmark real uploads instead.
+
+Usage (from backend/, needs the Supabase settings in .env for the db_utils import):
+    python scripts/bench_image_encoding.py [--repeat 3] [--images a.jpg b.png ...]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+from PIL import Image as PILImage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils  # noqa: E402
+from db_utils import ENCODING_PROFILES, normalize_image_bytes  # noqa: E402
+
+
+def _photo_like(size):
+    """Gradient plus noise: compresses roughly like a photo, unlike flat synthetic images."""
+    gradient = PILImage.linear_gradient('L').resize(size)
+    noise = PILImage.effect_noise(size, 24)
+    return PILImage.merge('RGB', (gradient, noise, gradient.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def _encode(img, image_format, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+def sample_images():
+    """(label, bytes) pairs standing in for typical inputs."""
+    output_4k = _photo_like((4096, 4096))
+    phone_photo = _photo_like((3024, 4032))
+
+    cutout = _photo_like((1500, 2000)).convert('RGBA')
+    mask = PILImage.new('L', cutout.size, 0)
+    mask.paste(255, (300, 300, 1200, 1700))
+    cutout.putalpha(mask)
+
+    return [
+        ('4K output PNG', _encode(output_4k, 'PNG')),
+        ('phone photo JPEG', _encode(phone_photo, 'JPEG', quality=90)),
+        ('RGBA cut-out PNG', _encode(cutout, 'PNG')),
+    ]
+
+
+def bench(image_bytes, profile, passthrough, repeat):
+    db_utils.IMAGE_PASSTHROUGH = passthrough
+    best_cpu = best_wall = None
+    for _ in range(repeat):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        output = normalize_image_bytes(image_bytes, profile=profile)
+        cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+    return best_cpu, best_wall, len(output), output is image_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--images', nargs='*', help='image files to benchmark instead of the synthetic samples')
+    args = parser.parse_args()
+
+    if args.images:
+        images = []
+        for path in args.images:
+            with open(path, 'rb') as f:
+                images.append((os.path.basename(path), f.read()))
+    else:
+        images = sample_images()
+
+    for label, image_bytes in images:
+        with PILImage.open(io.BytesIO(image_bytes)) as img:
+            print(f"{label}: {img.width}x{img.height} {img.mode} {img.format}, "
+                  f"{len(image_bytes) / 1e6:.2f} MB in, best of {args.repeat}")
+        rows = [(profile, bench(image_bytes, profile, False, args.repeat)) for profile in ENCODING_PROFILES]
+        passthrough = bench(image_bytes, None, True, args.repeat)
+        if passthrough[3]:
+            rows.append(('pass-through', passthrough))
+        for label, (cpu, wall, size, _) in rows:
+            print(f"  {label:14s} cpu {cpu * 1000:9.1f} ms  wall {wall * 1000:9.1f} ms  {size / 1e6:7.2f} MB")
+        print()
+
+
+if __name__ == '__main__':
+    main()
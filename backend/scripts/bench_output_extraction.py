@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: per-image cost of getting a Gemini output image ready for upload.
+
+Compares the old path (types.Image.save() to a temp file, read it back, then decode,
+flatten and re-encode as optimized PNG before upload) with the in-memory path
+(take part.inline_data.data and upload it as-is).
+
+Usage (from backend/):
+    python scripts/bench_output_extraction.py [--size 4096] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image as PILImage
+from google.genai import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_api_utils.gemini import extract_image_bytes  # noqa: E402
+
+
+def make_output_png(size):
+    """A photo-like RGB PNG (gradient plus noise) roughly the size of a 4K Gemini output."""
+    gradient = PILImage.linear_gradient('L').resize((size, size))
+    noise = PILImage.effect_noise((size, size), 48)
+    img = PILImage.merge('RGB', (gradient, noise, gradient.rotate(90)))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def make_response(image_bytes):
+    part = types.Part(inline_data=types.Blob(data=image_bytes, mime_type='image/png'))
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role='model', parts=[part]))]
+    )
+
+
+def legacy_path(response):
+    """What generate_image + upload_image_to_supabase used to do before upload."""
+    image = None
+    for part in response.parts:
+        if part.text is None and (candidate := part.as_image()):
+            image = candidate
+            break
+
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+    image.save(tmp_path)
+    with open(tmp_path, 'rb') as f:
+        image_bytes = f.read()
+    os.unlink(tmp_path)
+
+    img = PILImage.open(io.BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def in_memory_path(response):
+    return extract_image_bytes(response)
+
+
+def bench(fn, response, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(response)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=4096, help='edge length of the synthetic output image')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    response = make_response(make_output_png(args.size))
+
+    legacy_s, legacy_bytes = bench(legacy_path, response, args.repeat)
+    memory_s, memory_bytes = bench(in_memory_path, response, args.repeat)
+
+    print(f"image: {args.size}x{args.size} PNG, best of {args.repeat}")
+    print(f"  tempfile + re-encode   : {legacy_s * 1000:10.3f} ms  ({legacy_bytes / 1e6:.1f} MB uploaded)")
+    print(f"  in-memory pass-through : {memory_s * 1000:10.3f} ms  ({memory_bytes / 1e6:.1f} MB uploaded)")
+    print(f"  saved per image        : {(legacy_s - memory_s) * 1000:10.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
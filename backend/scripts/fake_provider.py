@@ -0,0 +1,123 @@
+"""
+Local fake of the Replicate predictions API that POSTs webhook callbacks.
+
+Serve mode runs only the fake provider, for testing the real app end to end:
+
+    python scripts/fake_provider.py serve --port 5055 --delay 3
+    REPLICATE_BASE_URL=http://127.0.0.1:5055/v1 WEBHOOK_BASE_URL=http://127.0.0.1:4000 WEBHOOK_SECRET=demo-secret python app.py
+
+Demo mode runs the fake provider and a webhook receiver in-process and compares
+how long run_prediction_sync takes to notice completion with webhooks vs polling:
+
+    python scripts/fake_provider.py demo --delay 3
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def create_fake_provider(delay):
+    """Flask app implementing POST /v1/predictions and GET /v1/predictions/<id>."""
+    app = Flask('fake_provider')
+    predictions = {}
+    ids = itertools.count(1)
+    lock = threading.Lock()
+
+    def complete(prediction_id, webhook_url):
+        time.sleep(delay)
+        with lock:
+            prediction = predictions[prediction_id]
+            prediction['status'] = 'succeeded'
+            prediction['output'] = ['fake output']
+            body = dict(prediction)
+        if webhook_url:
+            try:
+                requests.post(webhook_url, json=body, timeout=10)
+            except requests.exceptions.RequestException as e:
+                print(f"Fake provider failed to deliver webhook: {e}")
+
+    @app.route('/v1/predictions', methods=['POST'])
+    def create():
+        payload = request.get_json()
+        prediction_id = f"fake{next(ids)}"
+        with lock:
+            predictions[prediction_id] = {'id': prediction_id, 'status': 'starting', 'input': payload.get('input')}
+        threading.Thread(target=complete, args=(prediction_id, payload.get('webhook')), daemon=True).start()
+        return jsonify(predictions[prediction_id]), 201
+
+    @app.route('/v1/predictions/<prediction_id>', methods=['GET'])
+    def get(prediction_id):
+        with lock:
+            prediction = predictions.get(prediction_id)
+        if prediction is None:
+            return jsonify({'detail': 'Not found'}), 404
+        return jsonify(prediction), 200
+
+    return app
+
+
+def start_server(app, port):
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def demo(args):
+    os.environ['REPLICATE_BASE_URL'] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ['WEBHOOK_BASE_URL'] = f"http://127.0.0.1:{args.receiver_port}"
+    os.environ['WEBHOOK_SECRET'] = 'demo-secret'
+
+    from ai_api_utils import replicate, webhooks
+
+    receiver = Flask('webhook_receiver')
+
+    @receiver.route('/webhooks/<provider>', methods=['POST'])
+    def provider_webhook(provider):
+        if not webhooks.verify_token(request.args.get('token')):
+            return jsonify({'error': 'Invalid webhook token'}), 403
+        webhooks.deliver(provider, str(webhooks.extract_prediction_id(request.get_json())))
+        return jsonify({'status': 'ok'}), 200
+
+    start_server(create_fake_provider(args.delay), args.port)
+    start_server(receiver, args.receiver_port)
+
+    start = time.time()
+    replicate.run_prediction_sync({'prompt': 'demo'}, max_wait_seconds=60, poll_interval=args.poll_interval)
+    webhook_s = time.time() - start
+
+    webhooks.WEBHOOK_BASE_URL = ''
+    start = time.time()
+    replicate.run_prediction_sync({'prompt': 'demo'}, max_wait_seconds=60, poll_interval=args.poll_interval)
+    polling_s = time.time() - start
+
+    print(f"prediction takes {args.delay:.1f}s at the provider")
+    print(f"  webhook mode: {webhook_s:.2f}s")
+    print(f"  polling mode: {polling_s:.2f}s (poll_interval={args.poll_interval}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['serve', 'demo'])
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--receiver-port', type=int, default=5056, help='webhook receiver port (demo mode)')
+    parser.add_argument('--delay', type=float, default=3.0, help='seconds until each prediction completes')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='polling interval to compare against (demo mode)')
+    args = parser.parse_args()
+
+    if args.mode == 'demo':
+        demo(args)
+    else:
+        create_fake_provider(args.delay).run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Load test: GET /presets throughput with and without the preset catalog cache.
+
+Starts the app in-process on a threaded local server (one per mode) and hammers
+/presets from --concurrency client threads for --duration seconds per mode:
+    uncached    - catalog cache disabled, every request queries Supabase
+    cached      - catalog served from memory (200 with the full body)
+    conditional - cached, and clients send If-None-Match (304, no body)
+The uncached mode queries the real presets table, so it needs the Supabase settings
+in backend/.env. With --base-url the modes run against an already running server
+instead; its own cache settings apply, so 'uncached' is skipped there.
+
+Usage (from backend/):
+    python scripts/load_test_presets.py [--concurrency 8] [--duration 10]
+    python scripts/load_test_presets.py --base-url https://api.wardrobeforge.com
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preset_catalog  # noqa: E402
+from app import app  # noqa: E402
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def run_clients(url, concurrency, duration, conditional):
+    """Send requests from concurrency threads until duration elapses. Returns (latencies, status counts)."""
+    etag = requests.get(url).headers.get('ETag') if conditional else None
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        headers = {'If-None-Match': etag} if etag else {}
+        local_latencies = []
+        local_statuses = {}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = session.get(url, headers=headers)
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def report(mode, latencies, statuses, duration):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{mode:12s} {len(latencies) / duration:8.1f} req/s  p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+          f"p95 {p95 * 1000:7.1f}ms  statuses {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--base-url', help='test a running server instead of an in-process one')
+    args = parser.parse_args()
+
+    if args.base_url:
+        url = args.base_url.rstrip('/') + '/presets'
+        for mode in ('cached', 'conditional'):
+            latencies, statuses = run_clients(url, args.concurrency, args.duration, mode == 'conditional')
+            report(mode, latencies, statuses, args.duration)
+        return
+
+    cache_ttl = preset_catalog._catalog_cache.ttl_seconds or 600
+    for mode in ('uncached', 'cached', 'conditional'):
+        preset_catalog._catalog_cache.ttl_seconds = 0 if mode == 'uncached' else cache_ttl
+        preset_catalog._catalog_cache.invalidate()
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/presets"
+            latencies, statuses = run_clients(url, args.concurrency, args.duration, mode == 'conditional')
+            report(mode, latencies, statuses, args.duration)
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
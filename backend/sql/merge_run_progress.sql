@@ -0,0 +1,27 @@
+-- Atomic progress merge for ProgressTracker (progress_tracker.py).
+-- Run once in the Supabase SQL editor. Until it exists the tracker falls back to
+-- a read-modify-write of runs.intermediate_outputs.
+--
+-- Merges progress_percent into runs.intermediate_outputs in a single statement,
+-- never lowering it, and optionally sets status / error in the same UPDATE.
+
+create or replace function merge_run_progress(
+    p_run_id bigint,
+    p_progress integer default null,
+    p_status text default null,
+    p_error text default null
+) returns void
+language sql
+as $$
+    update runs
+    set intermediate_outputs = case
+            when p_progress is null then intermediate_outputs
+            else coalesce(intermediate_outputs::jsonb, '{}'::jsonb) || jsonb_build_object(
+                'progress_percent',
+                greatest(p_progress, coalesce((intermediate_outputs::jsonb ->> 'progress_percent')::integer, 0))
+            )
+        end,
+        status = coalesce(p_status, status),
+        error = coalesce(p_error, error)
+    where id = p_run_id;
+$$;
@@ -0,0 +1,57 @@
+"""
+Node-local SQLite helpers for state that has to be shared by every Gunicorn worker
+on the same host without a round trip to Supabase.
+
+Databases live in LOCAL_STATE_DIR and run in WAL mode, so readers in one worker
+never block on a writer in another. Connections are kept per thread and per
+process (they must not cross a fork).
+"""
+import os
+import sqlite3
+import threading
+
+LOCAL_STATE_DIR = os.getenv('LOCAL_STATE_DIR', 'local_state')
+
+_local = threading.local()
+
+
+def get_connection(db_name):
+    """
+    Return this thread's connection to LOCAL_STATE_DIR/<db_name>.db, opening it on first use.
+    Connections are in autocommit mode; use BEGIN IMMEDIATE for multi-statement writes.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or getattr(_local, 'pid', None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(db_name)
+    if conn is None:
+        os.makedirs(LOCAL_STATE_DIR, exist_ok=True)
+        conn = sqlite3.connect(
+            os.path.join(LOCAL_STATE_DIR, f"{db_name}.db"),
+            timeout=10,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=10000')
+        connections[db_name] = conn
+    return conn
+
+
+def pid_alive(pid):
+    """
+    Whether a process with this PID exists on the host, for taking over rows owned by
+    a process that died. PIDs get reused, so a True can be stale; rows whose work
+    has to be recovered reliably use a heartbeat instead (see job_queue.py).
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,25 @@
+"""
+SSE App
+Serves only GET /runs/<run_id>/events, so open progress streams stay out of the main
+app's Gunicorn threads.
+
+Run it with a gevent worker, where each stream is a greenlet (see README):
+    gunicorn --worker-class gevent --workers 1 --worker-connections 1000 --bind 127.0.0.1:8001 sse_app:app
+
+nginx routes the events URL here and everything else to app.py. Streams read the same
+node-local event bus and progress store as the main app's workers, so this process
+must run on the same host with the same LOCAL_STATE_DIR.
+"""
+from flask import Flask, request
+from flask_cors import CORS
+from event_stream import stream_run_events
+
+app = Flask(__name__)
+CORS(app)
+
+
+@app.route('/runs/<run_id>/events', methods=['GET'])
+def run_events(run_id):
+    """Server-Sent Events stream of a run's progress (see event_stream.py)."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return stream_run_events(run_id, last_event_id)
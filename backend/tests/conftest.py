@@ -0,0 +1,38 @@
+"""
+Shared test setup. Run from backend/:
+    python -m pytest tests
+
+Every test gets its own LOCAL_STATE_DIR, so the SQLite-backed modules start empty.
+Supabase is never contacted; the client only needs settings to be created on import.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'test-key')
+
+import sqlite_utils  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def local_state_dir(tmp_path, monkeypatch):
+    """
+    Point sqlite_utils at a fresh directory and drop connections to the previous one.
+    Modules that create their tables on first use are made to create them again.
+    """
+    monkeypatch.setattr(sqlite_utils, 'LOCAL_STATE_DIR', str(tmp_path))
+    monkeypatch.setattr(sqlite_utils, '_local', threading.local())
+    for module in list(sys.modules.values()):
+        # The flag lives on the module or on its singleton instance (e.g. event_bus)
+        owners = [module] + [
+            value for value in getattr(module, '__dict__', {}).values()
+            if type(value).__dict__.get('_instance') is value
+        ]
+        for owner in owners:
+            if getattr(owner, '_schema_ready', None) is True:
+                monkeypatch.setattr(owner, '_schema_ready', False)
+    return tmp_path
@@ -0,0 +1,53 @@
+import pytest
+
+import event_stream
+from event_bus import event_bus
+from sse_app import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(event_stream, 'SSE_MAX_STREAMS', 1)
+    monkeypatch.setattr(event_stream.stream_slots, '_open', 0)
+    return app.test_client()
+
+
+def test_stream_replays_events_until_terminal(client):
+    event_bus.publish('run-1', 'progress', {'progress': 40})
+    event_bus.publish('run-1', 'complete', {'progress': 100, 'outputs': []})
+
+    response = client.get('/runs/run-1/events')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert 'event: progress\ndata: {"progress": 40}' in body
+    assert body.endswith('event: complete\ndata: {"progress": 100, "outputs": []}\n\n')
+
+
+def test_stream_resumes_after_last_event_id(client):
+    first = event_bus.publish('run-1', 'progress', {'progress': 40})
+    event_bus.publish('run-1', 'complete', {'progress': 100, 'outputs': []})
+
+    body = client.get('/runs/run-1/events', headers={'Last-Event-ID': str(first)}).get_data(as_text=True)
+
+    assert 'event: progress' not in body
+    assert 'event: complete' in body
+
+
+def test_streams_past_the_cap_get_503(client):
+    event_bus.publish('run-1', 'complete', {'progress': 100, 'outputs': []})
+
+    open_stream = client.get('/runs/run-1/events', buffered=False)
+    assert open_stream.status_code == 200
+    assert event_stream.stream_slots.open_count() == 1
+
+    refused = client.get('/runs/run-1/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == str(event_stream.SSE_RETRY_AFTER_SECONDS)
+    assert refused.get_json()['fallback'] == '/check_progress'
+
+    # Closing the stream gives its slot back
+    open_stream.close()
+    assert event_stream.stream_slots.open_count() == 0
+    assert client.get('/runs/run-1/events').status_code == 200
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+
+import image_dedup
+from inference_pipeline.image_store import RunImageStore
+from inference_pipeline.input_prep import prepare_image
+
+_ORIENTATION = 0x0112
+URL = 'https://example.com/content/person.png'
+
+
+def phone_photo(orientation):
+    """A 400x200 JPEG whose pixels need the EXIF orientation to be shown upright, marker top-left."""
+    image = PILImage.new('RGB', (400, 200), (200, 30, 30))
+    image.paste((0, 0, 255), (0, 0, 40, 20))
+    exif = PILImage.Exif()
+    exif[_ORIENTATION] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def uploaded(monkeypatch):
+    """Run an image through the upload path (normalize + dedup, storage stubbed out)."""
+    monkeypatch.setattr(image_dedup, 'supabase_image_exists', lambda filename: None)
+    monkeypatch.setattr(image_dedup, 'upload_image_bytes_to_supabase',
+                        lambda image_bytes, filename, content_type=None, exist_ok=False: URL)
+
+    def upload(raw):
+        url, image_bytes = image_dedup.upload_image_deduplicated(raw)
+        assert image_bytes is not None
+        return url, image_bytes
+    return upload
+
+
+@pytest.mark.parametrize('orientation, size, marker', [
+    (1, (400, 200), (5, 5)),
+    (6, (200, 400), (195, 5)),
+    (8, (200, 400), (5, 395)),
+])
+def test_uploaded_photo_is_prepared_upright(uploaded, orientation, size, marker):
+    url, image_bytes = uploaded(phone_photo(orientation))
+    store = RunImageStore()
+    store.put(url, image_bytes)
+
+    prepared_bytes, mime_type = store.get_prepared(url)
+
+    prepared = PILImage.open(io.BytesIO(prepared_bytes))
+    assert mime_type == 'image/jpeg'
+    assert prepared.size == size
+    red, green, blue = prepared.convert('RGB').getpixel(marker)
+    assert blue > 200 and red < 60
+
+
+def test_prepare_applies_orientation_of_raw_bytes():
+    raw = PILImage.open(io.BytesIO(phone_photo(6)))
+    prepared = PILImage.open(io.BytesIO(prepare_image(raw)[0]))
+    assert prepared.size == (200, 400)
+
+
+def test_prepare_downscales_to_max_edge():
+    image = PILImage.new('RGB', (4000, 1000))
+    prepared = PILImage.open(io.BytesIO(prepare_image(image, max_edge=2048, image_format='png')[0]))
+    assert prepared.size == (2048, 512)
+    assert prepared.format == 'PNG'
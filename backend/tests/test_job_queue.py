@@ -0,0 +1,128 @@
+import json
+import time
+
+import pytest
+
+import job_queue as job_queue_module
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = job_queue_module.job_queue
+    monkeypatch.setattr(queue, '_schema_ready', False)
+    monkeypatch.setattr(queue, '_owner_pid', None)
+    monkeypatch.setattr(queue, '_abandon_handler', None)
+    return queue
+
+
+def _job(queue, job_id):
+    return queue._conn().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def _orphan(queue, job_id, heartbeat_age):
+    """Make a running job look like it belongs to another process that last beat heartbeat_age ago."""
+    queue._conn().execute(
+        "UPDATE jobs SET owner = '1234:dead', heartbeat_at = ? WHERE id = ?",
+        (time.time() - heartbeat_age, job_id)
+    )
+
+
+def test_claim_takes_oldest_job_and_records_owner(queue):
+    first = queue.enqueue('1', {'run_id': 1})
+    queue.enqueue('2', {'run_id': 2})
+
+    row = queue._claim()
+
+    assert row['id'] == first
+    assert json.loads(row['payload']) == {'run_id': 1}
+    job = _job(queue, first)
+    assert job['status'] == 'running'
+    assert job['owner'] == queue._owner_token()
+    assert job['attempts'] == 1
+    assert job['heartbeat_at'] is not None
+    assert queue.depth() == 1
+
+
+def test_claim_returns_none_when_empty(queue):
+    assert queue._claim() is None
+
+
+def test_enqueue_refuses_when_full(queue, monkeypatch):
+    monkeypatch.setattr(job_queue_module, 'JOB_QUEUE_MAX_DEPTH', 2)
+
+    assert queue.enqueue('1', {}) is not None
+    assert queue.enqueue('2', {}) is not None
+    assert queue.enqueue('3', {}) is None
+    assert queue.depth() == 2
+
+    # Running jobs don't count towards the depth
+    queue._claim()
+    assert queue.enqueue('3', {}) is not None
+
+
+def test_recover_requeues_job_with_stale_heartbeat(queue):
+    job_id = queue.enqueue('1', {'run_id': 1})
+    queue._claim()
+    _orphan(queue, job_id, job_queue_module.JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS + 5)
+
+    queue.recover()
+
+    job = _job(queue, job_id)
+    assert job['status'] == 'queued'
+    assert job['owner'] is None
+    assert queue._claim()['id'] == job_id
+
+
+def test_recover_keeps_job_with_fresh_heartbeat(queue):
+    job_id = queue.enqueue('1', {})
+    queue._claim()
+    _orphan(queue, job_id, 1)
+
+    queue.recover()
+
+    assert _job(queue, job_id)['status'] == 'running'
+
+
+def test_recover_keeps_own_jobs(queue):
+    job_id = queue.enqueue('1', {})
+    queue._claim()
+    queue._conn().execute('UPDATE jobs SET heartbeat_at = 0 WHERE id = ?', (job_id,))
+
+    queue.recover()
+
+    assert _job(queue, job_id)['status'] == 'running'
+
+
+def test_recover_abandons_job_after_max_attempts(queue, monkeypatch):
+    abandoned = []
+    monkeypatch.setattr(queue, '_abandon_handler', lambda payload, error: abandoned.append((payload, error)))
+    job_id = queue.enqueue('1', {'run_id': 1})
+
+    for _ in range(job_queue_module.JOB_QUEUE_MAX_ATTEMPTS):
+        assert queue._claim()['id'] == job_id
+        _orphan(queue, job_id, job_queue_module.JOB_QUEUE_HEARTBEAT_TIMEOUT_SECONDS + 5)
+        queue.recover()
+
+    assert _job(queue, job_id)['status'] == 'failed'
+    assert [payload for payload, _ in abandoned] == [{'run_id': 1}]
+    assert queue._claim() is None
+
+
+def test_finish_ignores_job_taken_over_by_another_process(queue):
+    job_id = queue.enqueue('1', {})
+    queue._claim()
+    _orphan(queue, job_id, 0)
+
+    queue._finish(job_id)
+
+    assert _job(queue, job_id)['status'] == 'running'
+
+
+def test_heartbeat_refreshes_own_running_jobs(queue):
+    job_id = queue.enqueue('1', {})
+    queue._claim()
+    queue._conn().execute('UPDATE jobs SET heartbeat_at = 0 WHERE id = ?', (job_id,))
+
+    queue.heartbeat()
+
+    assert _job(queue, job_id)['heartbeat_at'] > time.time() - 5
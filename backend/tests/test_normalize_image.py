@@ -0,0 +1,85 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+
+import db_utils
+
+_GPS_IFD = 0x8825
+_ORIENTATION = 0x0112
+
+
+def encode(image_format, size=(400, 200), orientation=None, gps=False):
+    """An RGB test image (wider than tall, with a marker in the top-left corner)."""
+    image = PILImage.new('RGB', size, (200, 30, 30))
+    image.paste((0, 0, 255), (0, 0, 40, 20))
+    params = {}
+    if orientation is not None or gps:
+        exif = PILImage.Exif()
+        if orientation is not None:
+            exif[_ORIENTATION] = orientation
+        if gps:
+            gps_ifd = exif.get_ifd(_GPS_IFD)
+            gps_ifd[1] = 'N'
+            gps_ifd[2] = (52.0, 22.0, 1.0)
+        params['exif'] = exif.tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def decode(image_bytes):
+    image = PILImage.open(io.BytesIO(image_bytes))
+    image.load()
+    return image
+
+
+@pytest.fixture(autouse=True)
+def passthrough(monkeypatch):
+    monkeypatch.setattr(db_utils, 'IMAGE_PASSTHROUGH', True)
+    monkeypatch.setattr(db_utils, 'IMAGE_PASSTHROUGH_FORMATS', ['PNG', 'JPEG', 'WEBP'])
+
+
+def test_plain_jpeg_passes_through_unchanged():
+    raw = encode('JPEG')
+    assert db_utils.normalize_image_bytes(raw) == raw
+
+
+def test_jpeg_gps_is_stripped_without_reencoding():
+    raw = encode('JPEG', gps=True)
+    assert decode(raw).getexif().get_ifd(_GPS_IFD)
+
+    normalized = db_utils.normalize_image_bytes(raw)
+
+    image = decode(normalized)
+    assert image.format == 'JPEG'
+    assert not image.getexif()
+    assert 'exif' not in image.info
+    # Same entropy-coded data, so the same pixels
+    assert image.tobytes() == decode(raw).tobytes()
+
+
+@pytest.mark.parametrize('image_format', ['PNG', 'WEBP'])
+def test_exif_in_other_formats_is_dropped(image_format):
+    image = decode(db_utils.normalize_image_bytes(encode(image_format, gps=True)))
+    assert not image.getexif()
+    assert 'exif' not in image.info
+
+
+@pytest.mark.parametrize('orientation, size', [(1, (400, 200)), (3, (400, 200)), (6, (200, 400)), (8, (200, 400))])
+def test_jpeg_orientation_is_applied(orientation, size):
+    image = decode(db_utils.normalize_image_bytes(encode('JPEG', orientation=orientation, gps=True)))
+    assert image.size == size
+    assert image.getexif().get(_ORIENTATION, 1) == 1
+    assert not image.getexif().get_ifd(_GPS_IFD)
+
+
+def test_orientation_applied_when_passthrough_is_off(monkeypatch):
+    monkeypatch.setattr(db_utils, 'IMAGE_PASSTHROUGH', False)
+    image = decode(db_utils.normalize_image_bytes(encode('JPEG', orientation=6)))
+    assert image.size == (200, 400)
+
+
+def test_strip_jpeg_metadata_rejects_non_jpeg():
+    assert db_utils._strip_jpeg_metadata(encode('PNG')) is None
+    assert db_utils._strip_jpeg_metadata(b'\xff\xd8\xff\xe1\x00') is None
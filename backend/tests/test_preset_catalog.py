@@ -0,0 +1,19 @@
+import preset_catalog
+
+
+def test_verify_refresh_token(monkeypatch):
+    monkeypatch.setattr(preset_catalog, 'PRESET_REFRESH_TOKEN', 'refresh-secret')
+
+    assert preset_catalog.refresh_enabled()
+    assert preset_catalog.verify_refresh_token('refresh-secret')
+    assert not preset_catalog.verify_refresh_token('wrong')
+    assert not preset_catalog.verify_refresh_token(None)
+    assert not preset_catalog.verify_refresh_token('é')
+
+
+def test_refresh_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(preset_catalog, 'PRESET_REFRESH_TOKEN', '')
+
+    assert not preset_catalog.refresh_enabled()
+    assert not preset_catalog.verify_refresh_token('')
+    assert not preset_catalog.verify_refresh_token(None)
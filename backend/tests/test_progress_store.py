@@ -0,0 +1,37 @@
+import progress_store
+
+
+def test_progress_never_goes_backwards():
+    progress_store.upsert('1', progress=50)
+    progress_store.upsert('1', progress=30)
+
+    assert progress_store.get_many(['1'])['1']['progress'] == 50
+
+    progress_store.upsert('1', progress=75)
+    assert progress_store.get_many(['1'])['1']['progress'] == 75
+
+
+def test_omitted_fields_keep_their_values():
+    progress_store.upsert('1', progress=40, status='processing')
+    progress_store.upsert('1', status='failed', error='boom')
+    progress_store.upsert('1', progress=10)
+
+    row = progress_store.get_many(['1'])['1']
+    assert (row['progress'], row['status'], row['error']) == (40, 'failed', 'boom')
+
+
+def test_get_many_skips_unknown_runs():
+    progress_store.upsert('1', progress=0, status='pending')
+
+    assert set(progress_store.get_many(['1', '2'])) == {'1'}
+    assert progress_store.get_many([]) == {}
+
+
+def test_prune_drops_old_runs():
+    progress_store.upsert('1', progress=0)
+    progress_store._conn().execute("UPDATE run_progress SET updated_at = 0 WHERE run_id = '1'")
+    progress_store.upsert('2', progress=0)
+
+    progress_store.prune(60)
+
+    assert set(progress_store.get_many(['1', '2'])) == {'2'}
@@ -0,0 +1,61 @@
+import pytest
+
+import run_views
+
+
+def test_cursor_round_trip():
+    cursor = run_views.encode_cursor(1234)
+    assert '=' not in cursor
+    assert run_views.decode_cursor(cursor) == 1234
+
+
+def test_decode_cursor_empty():
+    assert run_views.decode_cursor(None) is None
+    assert run_views.decode_cursor('') is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    'e30',  # {}
+    run_views.encode_cursor('12'),
+    run_views.encode_cursor(None),
+])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(ValueError):
+        run_views.decode_cursor(cursor)
+
+
+def test_etag_follows_content():
+    row = {'id': 7, 'status': 'completed', 'outputs': ['a.png']}
+    body, etag = run_views.serialize(row)
+
+    assert run_views.serialize(dict(row))[1] == etag
+    # An edit to a finished run must change the ETag even though its status didn't
+    assert run_views.serialize({**row, 'outputs': ['b.png']})[1] != etag
+    assert body == b'{"id":7,"status":"completed","outputs":["a.png"]}'
+
+
+def test_cache_control(monkeypatch):
+    assert run_views.cache_control('processing') == 'no-cache'
+    monkeypatch.setattr(run_views, 'RUN_TERMINAL_MAX_AGE_SECONDS', 0)
+    assert run_views.cache_control('completed') == 'no-cache'
+    monkeypatch.setattr(run_views, 'RUN_TERMINAL_MAX_AGE_SECONDS', 60)
+    assert run_views.cache_control('completed') == 'private, max-age=60'
+
+
+def test_parse_fields():
+    assert run_views.parse_fields(None) == run_views.COMPACT_FIELDS
+    assert run_views.parse_fields('outputs, status,outputs') == ('id', 'outputs', 'status')
+    assert run_views.parse_fields('*') == run_views.RUN_FIELDS
+    with pytest.raises(ValueError):
+        run_views.parse_fields('status,secret')
+
+
+def test_parse_run_ids():
+    assert run_views.parse_run_ids([3, '4', '004', 3]) == ['3', '4']
+
+
+@pytest.mark.parametrize('run_ids', [[], None, '1,2', [True], [1.5], ['abc'], ['-1'], ['²']])
+def test_parse_run_ids_rejects_invalid(run_ids):
+    with pytest.raises(ValueError):
+        run_views.parse_run_ids(run_ids)
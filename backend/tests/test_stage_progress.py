@@ -0,0 +1,61 @@
+from inference_pipeline.stage_progress import ANALYZE_WEIGHT, STAGE_WEIGHTS, StageProgress
+
+
+def test_weights_add_up_to_100():
+    assert ANALYZE_WEIGHT + sum(STAGE_WEIGHTS.values()) == 100
+
+
+def test_single_preset():
+    progress = StageProgress([1])
+    assert progress.percent() == 0
+
+    progress.analyze_done()
+    assert progress.percent() == 25
+    progress.stage_done(1, 'generate')
+    assert progress.percent() == 75
+    progress.stage_done(1, 'enhance')
+    assert progress.percent() == 100
+
+
+def test_presets_share_the_stage_weights():
+    progress = StageProgress([1, 2, 3])
+    progress.analyze_done()
+
+    progress.stage_done(1, 'generate')
+    assert progress.percent() == 41
+    progress.stage_done(2, 'generate')
+    progress.stage_done(1, 'enhance')
+    assert progress.percent() == 66
+    progress.skip_remaining(3)
+    assert progress.percent() == 91
+
+
+def test_set_presets_resets_stages():
+    progress = StageProgress([1, 2])
+    progress.stage_done(1, 'generate')
+
+    progress.set_presets([5])
+    progress.analyze_done()
+
+    assert progress.percent() == 25
+
+
+def test_reports_increasing_values_outside_the_lock():
+    reported = []
+    progress = None
+
+    def callback(value):
+        assert not progress._lock.locked()
+        reported.append(value)
+
+    progress = StageProgress([1, 2], progress_callback=callback)
+    progress.start()
+    progress.analyze_done()
+    progress.stage_done(1, 'generate')
+    progress.set_presets([1, 2])  # percent drops back to 25; nothing is reported
+    progress.analyze_done()
+    progress.stage_done(2, 'generate')
+    progress.stage_done(2, 'enhance')
+    progress.finish()
+
+    assert reported == [0, 25, 50, 62, 100]
@@ -0,0 +1,174 @@
+import threading
+
+import pytest
+
+import preset_catalog
+from inference_pipeline import step_analyze
+from inference_pipeline.image_store import RunImageStore
+
+PERSON_URL = 'https://example.com/person.png'
+CLOTHING_URL = 'https://example.com/clothing.png'
+CLOTHING_INFO = {'type': 'skirt', 'style': 'worn from the waist down'}
+
+
+class FakeQuery:
+    def __init__(self, rows, calls):
+        self._rows = rows
+        self._calls = calls
+        self._ids = None
+
+    def select(self, *args):
+        return self
+
+    def in_(self, column, ids):
+        self._ids = list(ids)
+        return self
+
+    def execute(self):
+        self._calls.append(self._ids)
+        return type('Result', (), {'data': [row for row in self._rows if row['id'] in self._ids]})()
+
+
+class FakeSupabase:
+    """presets_details with a male (gender false) and a female (gender true) row per preset."""
+
+    def __init__(self):
+        self.calls = []
+        self.rows = [
+            {'id': preset_id, 'gender': gender, 'ref_image_full': f"ref-{preset_id}-{gender}",
+             'description': f"desc-{preset_id}-{gender}", 'presets': {'id': preset_id, 'name': f"preset {preset_id}"}}
+            for preset_id in (1, 2) for gender in (False, True)
+        ]
+
+    def table(self, name):
+        assert name == 'presets_details'
+        return FakeQuery(self.rows, self.calls)
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(step_analyze, 'supabase', fake)
+    step_analyze.invalidate_preset_details_cache()
+    yield fake
+    step_analyze.invalidate_preset_details_cache()
+
+
+@pytest.fixture
+def image_store():
+    store = RunImageStore()
+    store.put(PERSON_URL, b'person')
+    store.put(CLOTHING_URL, b'clothing')
+    return store
+
+
+def test_gender_and_clothing_run_concurrently(monkeypatch, fake_supabase, image_store):
+    # Each call waits for the other one; run one after the other, the barrier times out
+    barrier = threading.Barrier(2, timeout=5)
+
+    def detect_gender(url, image_hash=None):
+        barrier.wait()
+        return 'female'
+
+    def analyze_clothing(url, image_hash=None):
+        barrier.wait()
+        return CLOTHING_INFO
+
+    monkeypatch.setattr(step_analyze, 'ANALYZE_MODE', 'separate')
+    monkeypatch.setattr(step_analyze, 'detect_gender', detect_gender)
+    monkeypatch.setattr(step_analyze, 'analyze_clothing', analyze_clothing)
+
+    result = step_analyze.analyze(PERSON_URL, CLOTHING_URL, [2, 1], image_store=image_store)
+
+    assert result['gender'] == 'female'
+    assert result['clothing_type'] == 'skirt'
+    assert result['garment_description']['type'] == 'skirt'
+
+
+@pytest.mark.parametrize('gender, expected_gender_flag', [('female', True), ('male', False)])
+def test_preset_prefetch_is_filtered_by_gender(monkeypatch, fake_supabase, image_store, gender,
+                                               expected_gender_flag):
+    monkeypatch.setattr(step_analyze, 'ANALYZE_MODE', 'separate')
+    monkeypatch.setattr(step_analyze, 'detect_gender', lambda url, image_hash=None: gender)
+    monkeypatch.setattr(step_analyze, 'analyze_clothing', lambda url, image_hash=None: CLOTHING_INFO)
+
+    result = step_analyze.analyze(PERSON_URL, CLOTHING_URL, [2, 1], image_store=image_store)
+
+    # One batched query for both genders, then one row per preset in request order
+    assert fake_supabase.calls == [[2, 1]]
+    assert [detail['preset_id'] for detail in result['preset_details']] == [2, 1]
+    assert [detail['ref_image_full'] for detail in result['preset_details']] == [
+        f"ref-2-{expected_gender_flag}", f"ref-1-{expected_gender_flag}"
+    ]
+
+
+def test_preset_rows_are_cached(monkeypatch, fake_supabase, image_store):
+    monkeypatch.setattr(step_analyze, 'ANALYZE_MODE', 'separate')
+    monkeypatch.setattr(step_analyze, 'detect_gender', lambda url, image_hash=None: 'male')
+    monkeypatch.setattr(step_analyze, 'analyze_clothing', lambda url, image_hash=None: CLOTHING_INFO)
+
+    step_analyze.analyze(PERSON_URL, CLOTHING_URL, [1], image_store=image_store)
+    step_analyze.analyze(PERSON_URL, CLOTHING_URL, [1, 2], image_store=image_store)
+
+    assert fake_supabase.calls == [[1], [2]]
+
+
+def test_preset_refresh_drops_cached_rows(monkeypatch, fake_supabase):
+    monkeypatch.setattr(preset_catalog, 'get_all_presets', lambda: [])
+
+    step_analyze.fetch_preset_detail_rows([1])
+    step_analyze.fetch_preset_detail_rows([1])
+    assert fake_supabase.calls == [[1]]
+
+    # As POST /presets/refresh does, possibly in another worker
+    preset_catalog.refresh()
+    fake_supabase.rows[0]['description'] = 'edited'
+
+    rows = step_analyze.fetch_preset_detail_rows([1])
+    assert fake_supabase.calls == [[1], [1]]
+    assert rows[1][0]['description'] == 'edited'
+
+
+@pytest.mark.parametrize('combined_answer', [None, RuntimeError('vision API down')])
+def test_combined_mode_falls_back_to_separate_calls(monkeypatch, fake_supabase, image_store, combined_answer):
+    separate_calls = []
+
+    def analyze_person_and_clothing(*args, **kwargs):
+        if isinstance(combined_answer, Exception):
+            raise combined_answer
+        return combined_answer
+
+    def detect_gender(url, image_hash=None):
+        separate_calls.append('gender')
+        return 'male'
+
+    def analyze_clothing(url, image_hash=None):
+        separate_calls.append('clothing')
+        return CLOTHING_INFO
+
+    monkeypatch.setattr(step_analyze, 'ANALYZE_MODE', 'combined')
+    monkeypatch.setattr(step_analyze, 'analyze_person_and_clothing', analyze_person_and_clothing)
+    monkeypatch.setattr(step_analyze, 'detect_gender', detect_gender)
+    monkeypatch.setattr(step_analyze, 'analyze_clothing', analyze_clothing)
+
+    result = step_analyze.analyze(PERSON_URL, CLOTHING_URL, [1], image_store=image_store)
+
+    assert sorted(separate_calls) == ['clothing', 'gender']
+    assert result['gender'] == 'male'
+    assert result['preset_details'][0]['ref_image_full'] == 'ref-1-False'
+
+
+def test_combined_mode_skips_separate_calls(monkeypatch, fake_supabase, image_store):
+    def unexpected(*args, **kwargs):
+        raise AssertionError('separate call made although the combined answer was usable')
+
+    monkeypatch.setattr(step_analyze, 'ANALYZE_MODE', 'combined')
+    monkeypatch.setattr(step_analyze, 'analyze_person_and_clothing',
+                        lambda *args, **kwargs: ('female', CLOTHING_INFO))
+    monkeypatch.setattr(step_analyze, 'detect_gender', unexpected)
+    monkeypatch.setattr(step_analyze, 'analyze_clothing', unexpected)
+
+    result = step_analyze.analyze(PERSON_URL, CLOTHING_URL, [1], image_store=image_store)
+
+    assert (result['gender'], result['clothing_style']) == ('female', 'worn from the waist down')
+    assert result['preset_details'][0]['ref_image_full'] == 'ref-1-True'
@@ -0,0 +1,32 @@
+import pytest
+
+from ai_api_utils import webhooks
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(webhooks, 'WEBHOOK_SECRET', 'demo-secret')
+    monkeypatch.setattr(webhooks, 'WEBHOOK_BASE_URL', 'https://api.example.com')
+
+
+def test_verify_token(secret):
+    assert webhooks.verify_token('demo-secret')
+    assert not webhooks.verify_token('wrong')
+    assert not webhooks.verify_token(None)
+
+
+def test_verify_token_with_non_ascii_token(secret):
+    assert not webhooks.verify_token('é')
+
+
+def test_webhooks_off_without_secret(monkeypatch):
+    monkeypatch.setattr(webhooks, 'WEBHOOK_SECRET', '')
+    monkeypatch.setattr(webhooks, 'WEBHOOK_BASE_URL', 'https://api.example.com')
+
+    assert not webhooks.webhook_enabled()
+    assert not webhooks.verify_token('')
+    assert not webhooks.verify_token(None)
+
+
+def test_webhook_url_carries_secret(secret):
+    assert webhooks.webhook_url('replicate') == 'https://api.example.com/webhooks/replicate?token=demo-secret'